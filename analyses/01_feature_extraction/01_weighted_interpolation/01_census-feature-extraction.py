@@ -1,11 +1,14 @@
 # Import census data (population density, average age and average household size) at the hexagon resolution 8 level
 
 import pymongo
-import pandas as pd
 import geopandas as gpd
 from tqdm import tqdm
-import h3
-from src.get_hexagon_geometry_shapely import get_hexagon_geometry_shapely
+from src.hex_geometry import hex_ids_to_geoseries
+from src.mongo_extraction import extract_collection, read_extracted
+from src.census_aggregation import aggregate_census_features
+from src.weighted_average import weighted_average, AGE_WEIGHTS_HEXAGON, HOUSEHOLD_SIZE_WEIGHTS
+from src.feature_store import write_features
+from src.h3_index import h3_to_uint64, cell_areas, merge_on_h3
 
 
 # Client id for database
@@ -13,74 +16,100 @@ client = pymongo.MongoClient()  # When database is stored locally
 # Select database name for census data
 db = client.h3r8data # If using another resolution change to the database name
 
+# Number of documents fetched and processed at a time (bounds peak memory)
+batch_size = 50000
+# Directory where the intermediate chunks are written
+staging_directory = '../../../data/filter/staging'
+# Compute the features with a MongoDB aggregation pipeline (only the hexagon id and three numbers per hexagon are
+# transferred) instead of fetching the age and household size histograms and computing them in pandas
+use_aggregation = True
+# Integer type of the census counts when the features are computed in pandas ('int32' halves the memory used)
+counts_dtype = 'int32'
+
 ###############
 # Data extraction at the hexagon 8 level
 ###############
 
-# Extract population density data
-# We use population density at the output area level and perform uniform interpolation
-with tqdm(desc="Population density") as pbar_population:
-    cursor_populationdensity = db.age.find()
-    docs_populationdensity = list(cursor_populationdensity)
-    df_population = pd.DataFrame(docs_populationdensity)
+
+def age_features(df_age):
+    """
+    Compute population density and average age for a chunk of documents of the age collection.
+    """
+    # Hexagon ids are carried as uint64 from the database onwards
+    df_age['index'] = h3_to_uint64(df_age['index'])
 
     # Compute hexagon (res 8) area
-    df_population['area_h8'] = df_population['index'].apply(lambda x: h3.cell_area(x))
+    df_age['area_h8'] = cell_areas(df_age['index'])
 
     # Calculate population density
-    df_population['population_density'] = df_population['total'] / df_population['area_h8']
+    df_age['population_density'] = df_age['total'] / df_age['area_h8']
+
+    # Calculate average age from the number of people of each age
+    df_age['avg_age'] = weighted_average(df_age, AGE_WEIGHTS_HEXAGON, dtype=counts_dtype)
 
-    # Keep only hexagon id and population density to merge with the rest of the data
-    df_population = df_population[['index', 'population_density']].drop_duplicates()
-    pbar_population.update()
+    # Keep only hexagon id, population (kept to validate the interpolations), population density and avg age to
+    # merge with the rest of the data
+    return df_age[['index', 'total', 'population_density', 'avg_age']]
 
-# Extract average household size data
-with tqdm(desc="Household size") as pbar_household:
-    cursor_householdsize = db.householdsize.find()
-    docs_householdsize = list(cursor_householdsize)
-    df_householdsize = pd.DataFrame(docs_householdsize)
 
+def household_size_features(df_householdsize):
+    """
+    Compute average household size for a chunk of documents of the householdsize collection.
+    """
     # Calculate average household size using the number of households of each size
-    df_householdsize['avg_household_size'] = (df_householdsize['1'] + 2 * df_householdsize['2'] +
-                                              3 * df_householdsize['3'] + 4 * df_householdsize['4'] +
-                                              5 * df_householdsize['5'] + 6 * df_householdsize['6'] +
-                                              7 * df_householdsize['7'] +
-                                              8 * df_householdsize['8']) / df_householdsize['total']
-
-    # Keep only hexagon id and avg household size to merge with the rest of the data
-    df_householdsize = df_householdsize[['index', 'avg_household_size']].drop_duplicates()
-    pbar_household.update()
-
-# Extract average age data
-with tqdm(desc="Fetching age") as pbar_age:
-    cursor_age = db.age.find()
-    docs_age = list(cursor_age)
-    df_age = pd.DataFrame(docs_age)
-
-    # Obtain cumulative sum of age and total number of people to compute avg age
-    df_age['cumsum_age'] = df_age['0'].astype('int64') * 0
-    df_age['total_p'] = df_age['0'].astype('int64') * 0
-
-    for age in range(101):
-        age_column = f'{age}'
-        df_age['cumsum_age'] = df_age['cumsum_age'] + df_age[age_column].astype('int64') * (age + 1)
-        df_age['total_p'] = df_age['total_p'] + df_age[age_column].astype('int64')
-
-    # Calculate average
-    df_age['avg'] = df_age['cumsum_age']/df_age['total_p']
-
-    # Keep only hexagon id and avg age to merge with the rest of the data
-    df_avg_age = pd.DataFrame({'index': df_age['index'], 'avg_age': df_age['avg']}).drop_duplicates()
-    pbar_age.update()
-
-# Combine the dataframes using the hexagon id
-with tqdm(desc="Combining DataFrames") as pbar_combine:
-    df_final = pd.merge(df_population, df_householdsize, on='index', how='inner')
-    df_final = pd.merge(df_final, df_avg_age, on='index', how='inner')
-    pbar_combine.update(1)
+    df_householdsize['avg_household_size'] = weighted_average(df_householdsize, HOUSEHOLD_SIZE_WEIGHTS,
+                                                              denominator_column='total', dtype=counts_dtype)
+
+    # Keep only hexagon id (as uint64) and avg household size to merge with the rest of the data
+    df_householdsize['index'] = h3_to_uint64(df_householdsize['index'])
+    return df_householdsize[['index', 'avg_household_size']]
+
+
+if use_aggregation:
+    # Population density, average household size and average age computed server-side
+    with tqdm(desc="Census features (aggregation pipeline)") as pbar_census:
+        df_final = aggregate_census_features(db, batch_size=batch_size, ensure_index=True)
+        # Hexagon ids are carried as uint64 from the database onwards
+        df_final['index'] = h3_to_uint64(df_final['index'])
+
+        # Calculate population density using the hexagon (res 8) area
+        df_final['population_density'] = df_final['total'] / cell_areas(df_final['index'])
+
+        # Keep only hexagon id, population (kept to validate the interpolations) and features
+        df_final = df_final[['index', 'total', 'population_density', 'avg_household_size', 'avg_age']]
+        pbar_census.update()
+else:
+    # Extract population density and average age data in a single pass over the age collection
+    # We use population density at the output area level and perform uniform interpolation
+    with tqdm(desc="Population density and age") as pbar_age:
+        age_columns = {column: 1 for column in AGE_WEIGHTS_HEXAGON}
+        extract_collection(db.age, f'{staging_directory}/weighted_census_age_h8',
+                           projection={'index': 1, 'total': 1, **age_columns},
+                           batch_size=batch_size, transform=age_features)
+        df_age = read_extracted(f'{staging_directory}/weighted_census_age_h8')
+
+        df_population = df_age[['index', 'total', 'population_density']].drop_duplicates()
+        df_avg_age = df_age[['index', 'avg_age']].drop_duplicates()
+        pbar_age.update()
+
+    # Extract average household size data
+    with tqdm(desc="Household size") as pbar_household:
+        household_columns = {column: 1 for column in HOUSEHOLD_SIZE_WEIGHTS}
+        extract_collection(db.householdsize, f'{staging_directory}/weighted_census_householdsize_h8',
+                           projection={'index': 1, 'total': 1, **household_columns},
+                           batch_size=batch_size, transform=household_size_features)
+        df_householdsize = read_extracted(f'{staging_directory}/weighted_census_householdsize_h8')
+        df_householdsize = df_householdsize.drop_duplicates()
+        pbar_household.update()
+
+    # Combine the dataframes using the hexagon id
+    with tqdm(desc="Combining DataFrames") as pbar_combine:
+        df_final = merge_on_h3(df_population, df_householdsize, on='index', how='inner')
+        df_final = merge_on_h3(df_final, df_avg_age, on='index', how='inner')
+        pbar_combine.update(1)
 
 # Add geometry to dataframe
-df_final['geojson'] = df_final['index'].apply(lambda x: get_hexagon_geometry_shapely(x))
+df_final['geojson'] = hex_ids_to_geoseries(df_final['index'], index=df_final.index)
 
 # Convert dataframe to GeoDataFrame format
 gdf_geocode = gpd.GeoDataFrame(df_final, geometry=df_final['geojson'])
@@ -88,5 +117,5 @@ gdf_geocode = gpd.GeoDataFrame(df_final, geometry=df_final['geojson'])
 # Define EPSG Geodetic Parameter
 gdf_geocode.crs = {'init': 'epsg:4326'}
 
-# Save to pickle file
-gdf_geocode.to_pickle('../../../data/filter/weighted_census_features_h8_uk.pkl')
\ No newline at end of file
+# Save to the feature store
+write_features(gdf_geocode, '../../../data/filter/weighted_census_features_h8_uk.parquet')
\ No newline at end of file
@@ -1,18 +1,28 @@
 # Import landuse data at the hexagon resolution 8 level
 
 import pymongo
-from pandas import DataFrame
+from src.mongo_extraction import extract_collection, read_extracted
+from src.feature_store import write_features
+from src.h3_index import h3_to_uint64
 
 # Client id for database
 client = pymongo.MongoClient("35.179.58.255", 27017)
 db = client.h3r8data  # If using another resolution change to the database name
 
+# Number of documents fetched at a time (bounds peak memory)
+batch_size = 50000
+# Directory where the intermediate chunks are written
+staging_directory = '../../../data/filter/staging'
+
 ############
 # Obtain landuse data at resolution 8 from database
 ############
 
-df_landuse = DataFrame(list(db.landuse.find({})))
-df_landuse = df_landuse.drop(columns=['_id', 'geojson'])
+# Stream the collection in chunks, the geometry and the '_id' are dropped server-side
+extract_collection(db.landuse, f'{staging_directory}/landuse_h8', projection={'geojson': 0}, batch_size=batch_size)
+df_landuse = read_extracted(f'{staging_directory}/landuse_h8')
+# Hexagon ids are carried as uint64 from the database onwards
+df_landuse['index'] = h3_to_uint64(df_landuse['index'])
 
 # Pivot the DataFrame to create the desired structure
 pivot_df = df_landuse.pivot(index='index', columns='type', values='area')
@@ -25,5 +35,5 @@ pivot_df.columns = ['index'] + [f'area_{col}' for col in pivot_df.columns[1:]]
 # Fill NaN values with 0 if needed
 pivot_df.fillna(0, inplace=True)
 
-# Save to pickle file
-pivot_df.to_pickle('../../../data/filter/landuse_features_h8_uk.pkl')
\ No newline at end of file
+# Save to the feature store
+write_features(pivot_df, '../../../data/filter/landuse_features_h8_uk.parquet')
\ No newline at end of file
@@ -2,24 +2,50 @@
 
 import pymongo
 import pandas.io.json
-from src.road_length_calculation import road_length
+from src.road_length_calculation import road_lengths_batch
+from src.mongo_extraction import extract_collection, read_extracted
+from src.feature_store import write_features
+from src.h3_index import h3_to_uint64
 
 # Client id for database
 client = pymongo.MongoClient("35.179.58.255", 27017)
 db = client.h3r8data  # If using another resolution change to the database name
 
+# Road types for which a 'length_<type>' column is computed (all of them in a single traversal of the features)
+# Add more types (e.g. 'motorway', 'primary', 'service') here, or set to None to use every type found in the data
+road_types = ['residential', 'tertiary']
+
+# Number of documents fetched and processed at a time (bounds peak memory)
+batch_size = 10000
+# Directory where the intermediate chunks are written
+staging_directory = '../../../data/filter/staging'
+
 ############
 # Obtain road data at resolution 8 from database
 ############
-df_roads = list(db.roads.find({}))
-df_roads = pandas.json_normalize(df_roads)
-df_roads = df_roads.drop(columns=['_id', 'geojson.type'])
 
-# Calculate length of residential and tertiary roads in each hexagon
-df_roads['length_residential'] = df_roads['geojson.features'].map(lambda x: road_length(x, road_type='residential'))
-df_roads['length_tertiary'] = df_roads['geojson.features'].map(lambda x: road_length(x, road_type='tertiary'))
 
-df_roads = df_roads.drop(columns=['geojson.features'])
+def road_features(df_roads):
+    """
+    Replace the nested road features of a chunk of hexagons by the length of each road type.
+    """
+    # Calculate length of each road type in each hexagon
+    # All segments are flattened and measured in one vectorized pass ('ellipsoidal' or 'haversine' are faster
+    # approximations, see src/road_length_calculation.py for their error bounds)
+    df_lengths = road_lengths_batch(df_roads['geojson.features'], road_types=road_types, method='vincenty')
+
+    df_roads = df_roads.drop(columns=['geojson.features'])
+    # Hexagon ids are carried as uint64 from the database onwards
+    df_roads['index'] = h3_to_uint64(df_roads['index'])
+    return pandas.concat([df_roads, df_lengths], axis=1)
+
+
+# Stream the collection in chunks, only the road lengths of each chunk are kept
+extract_collection(db.roads, f'{staging_directory}/roads_h8', projection={'geojson.type': 0},
+                   batch_size=batch_size, normalize=True, transform=road_features)
+df_roads = read_extracted(f'{staging_directory}/roads_h8')
+# Road types missing from some chunks have no length there
+df_roads = df_roads.fillna(0)
 
-# Save to pickle file
-df_roads.to_pickle('../../../data/filter/road_features_h8_uk.pkl')
\ No newline at end of file
+# Save to the feature store
+write_features(df_roads, '../../../data/filter/road_features_h8_uk.parquet')
\ No newline at end of file
@@ -1,52 +1,32 @@
 # Merge the census and OSM data
-import pickle
+from src.feature_store import read_features, write_features
+from src.h3_index import merge_on_h3
 
 ##################
 # Merge the 3 datasets of features
 ##################
 
-# Read pickle file with census features and store in a variable
-file_name = "../../../data/filter/weighted_census_features_h8_uk.pkl"
-objects = []
-with (open(file_name, "rb")) as openfile:
-    while True:
-        try:
-            objects.append(pickle.load(openfile))
-        except EOFError:
-            break
-uk_hex = objects[0]
-
-# Read pickle file with landuse data and store in a variable
-file_name = '../../../data/filter/landuse_features_h8_uk.pkl'
-objects = []
-with (open(file_name, "rb")) as openfile:
-    while True:
-        try:
-            objects.append(pickle.load(openfile))
-        except EOFError:
-            break
-landuse_uk_hex = objects[0]
-
-# Read pickle file with road data and store in a variable
-file_name = "../../../data/filter/road_features_h8_uk.pkl"
-objects = []
-with (open(file_name, "rb")) as openfile:
-    while True:
-        try:
-            objects.append(pickle.load(openfile))
-        except EOFError:
-            break
-road_uk_hex = objects[0]
-
-# Merge roads and landuse dataframes
-uk_osm = road_uk_hex.merge(landuse_uk_hex, how='outer', on='index')
+# Read feature store file with census features and store in a variable
+file_name = "../../../data/filter/weighted_census_features_h8_uk.parquet"
+uk_hex = read_features(file_name)
+
+# Read feature store file with landuse data and store in a variable
+file_name = '../../../data/filter/landuse_features_h8_uk.parquet'
+landuse_uk_hex = read_features(file_name)
+
+# Read feature store file with road data and store in a variable
+file_name = "../../../data/filter/road_features_h8_uk.parquet"
+road_uk_hex = read_features(file_name)
+
+# Merge roads and landuse dataframes (on the uint64 hexagon ids)
+uk_osm = merge_on_h3(road_uk_hex, landuse_uk_hex, how='outer', on='index')
 
 # Replace NaN values with 0
 uk_osm.fillna(0, inplace=True)
 
 # Merge OSM data with census data
-uk_hex_total = uk_hex.merge(uk_osm, how='left', on='index')
+uk_hex_total = merge_on_h3(uk_hex, uk_osm, how='left', on='index')
 uk_hex_total.fillna(0, inplace=True)
 
-# Save to pickle file
-uk_hex_total.to_pickle('../../../data/filter/UK_weighted_merged_features_h8_uk.pkl')
\ No newline at end of file
+# Save to the feature store
+write_features(uk_hex_total, '../../../data/filter/UK_weighted_merged_features_h8_uk.parquet')
\ No newline at end of file
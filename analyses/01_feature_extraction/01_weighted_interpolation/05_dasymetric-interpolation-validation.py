@@ -0,0 +1,49 @@
+# Regenerate the population of each hexagon from the census areas with the dasymetric (residential area weighted)
+# interpolation engine, and validate it against the existing resolution 8 census features on a subset of the UK
+
+import shapely
+from src.feature_store import read_features
+from src.hex_geometry import hex_ids_to_geoseries
+from src.dasymetric_interpolation import dasymetric_interpolate, validate_interpolation
+
+# Resolution of the hexagons (the landuse features must be at the same resolution)
+resolution_id = 8
+# Number of census areas processed at a time (bounds peak memory, e.g. at resolution 9)
+chunk_size = 5000
+# Directory of the census boundaries (saved by the uniform census extraction) and of the cached area weights
+staging_directory = '../../../data/filter/staging'
+# Fixture subset: census areas with a point inside this box (longitude and latitude bounds, Greater Manchester)
+fixture_bbox = (-2.75, 53.35, -1.9, 53.7)
+
+###############
+# Read census areas and residential area of each hexagon
+###############
+gdf_areas = read_features(f'{staging_directory}/uk_census_boundaries.parquet').set_geometry('geojson')
+gdf_areas = gdf_areas.set_crs(epsg=4326, allow_override=True)
+in_fixture = shapely.contains_xy(shapely.box(*fixture_bbox), *shapely.get_coordinates(
+    shapely.point_on_surface(gdf_areas.geometry.values)).T)
+gdf_areas = gdf_areas[in_fixture]
+
+landuse_uk_hex = read_features('../../../data/filter/landuse_features_h8_uk.parquet',
+                               columns=['index', 'area_residential'])
+
+###############
+# Dasymetric interpolation of the population
+###############
+df_census_hex = dasymetric_interpolate(gdf_areas, ['total_population'], landuse_uk_hex, resolution_id,
+                                       chunk_size=chunk_size, cache_directory=staging_directory)
+
+###############
+# Validation against the existing resolution 8 census features
+###############
+weighted_census_hex = read_features('../../../data/filter/weighted_census_features_h8_uk.parquet',
+                                    columns=['index', 'total'])
+# Only the hexagons far from the edge of the fixture are fully covered by its census areas
+fixture_inner_bbox = shapely.box(fixture_bbox[0] + 0.05, fixture_bbox[1] + 0.05, fixture_bbox[2] - 0.05,
+                                 fixture_bbox[3] - 0.05)
+hexagon_centers = shapely.centroid(hex_ids_to_geoseries(weighted_census_hex['index']).values)
+inner_hexagons = shapely.contains(fixture_inner_bbox, hexagon_centers)
+weighted_census_hex = weighted_census_hex[inner_hexagons]
+
+print(f'Dasymetric interpolation of {len(gdf_areas)} census areas to {len(df_census_hex)} hexagons')
+print(validate_interpolation(df_census_hex, weighted_census_hex, ['total_population'], ['total']).T)
@@ -0,0 +1,28 @@
+# Derive the merged features at coarser resolutions from the features extracted at the hexagon resolution 8 level,
+# so that the clustering can be run at any of them without extracting the data again from MongoDB
+
+from src.feature_store import read_features
+from src.feature_pyramid import build_feature_pyramid
+from src.pipeline import pipeline_parameter
+
+# Coarser resolutions derived from the resolution 8 hexagons (the clustering resolution when run by the pipeline)
+resolution_id = pipeline_parameter('resolution')
+pyramid_resolutions = [7, 6, 5] if resolution_id is None else [resolution_id]
+
+##################
+# Read the merged features at the finest resolution
+##################
+file_name = '../../../data/filter/UK_weighted_merged_features_h8_uk.parquet'
+uk_hex_total = read_features(file_name)
+
+##################
+# Roll up the features to the parent hexagons
+# Road lengths and landuse areas are summed, population density, average age and average household size are
+# averaged weighted by the area of the children. Each level is saved to the feature store
+##################
+pyramid = build_feature_pyramid(
+    uk_hex_total, pyramid_resolutions,
+    file_path_template='../../../data/filter/UK_weighted_merged_features_h{resolution}_uk.parquet')
+
+for resolution, uk_hex_level in pyramid.items():
+    print(f'Resolution {resolution}: {len(uk_hex_level)} hexagons')
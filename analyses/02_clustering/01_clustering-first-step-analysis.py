@@ -1,57 +1,66 @@
 # Perform first step of the clustering: urban-mid-rural
 # Analyse the distribution of each variable used for the clustering by output label
 
-import pickle
+from src.feature_store import read_features, write_features
 import pandas as pd
 
 from src.clustering_k_means import clustering_k_means
+from src.k_selection import sweep_k
+from src.pipeline import pipeline_parameter
 
-# User input to obtain whether we are using the census data from uniform or weighted interpolation
-user_input = input("Enter 'uniform' or 'weighted' depending on how you want the census data to have been obtained")
-
-# Select pickle file to read features and store features in a variable
-if user_input == 'weighted':
-    file_name = "../../data/filter/UK_weighted_merged_features_h8_uk.pkl"
-else:
-    file_name = "../../data/filter/UK_uniform_merged_features_h7_uk.pkl"
-
-objects = []
-with (open(file_name, "rb")) as openfile:
-    while True:
-        try:
-            objects.append(pickle.load(openfile))
-        except EOFError:
-            break
-uk_hex_total = objects[0]
-
-##################
-# Perform first step of the k-means clustering
-# Cluster hexagons at resolution 8 level in rural-mid-urban based on population density, avg and avg household size
-# Variables for the analysis could be change depending on the variables available in the uk_hex_total dataframe
-##################
-
-# Define parameter values clustering function
-column_names_clustering_3_tier = ['population_density', 'avg_age', 'avg_household_size']
-n_clusters_uk = 3  # rural-mid-urban classification
-name_label_column_3_tier = 'label_3_tier'  # Label column name
-colors_3_tier = ['red', 'greenyellow', 'dodgerblue']
-if user_input == 'weighted':
-    file_path_3_tier = '../../outputs/01_weighted_interpolation/figures/3_tier_post_analysis.png'
-else:
-    file_path_3_tier = '../../outputs/02_uniform_interpolation/figures/3_tier_post_analysis.png'
-
-
-uk_hex_total, metrics_3_tier = clustering_k_means(df=uk_hex_total, columns_clustering=column_names_clustering_3_tier,
-                                                  n_clusters=n_clusters_uk, label_column_name=name_label_column_3_tier,
-                                                  post_analysis=True, colors_plot=colors_3_tier,
-                                                  figure_file_path=file_path_3_tier, metrics=True)
-
-print('3 Tier Clustering scores')
-print(pd.DataFrame(data=metrics_3_tier))
-
-# Save to pickle file
-if user_input == 'weighted':
-    save_file = '../../outputs/01_weighted_interpolation/data/UK_clustering_3_tier_labels_h8.pkl'
-else:
-    save_file = '../../outputs/02_uniform_interpolation/data/UK_clustering_3_tier_labels_h7.pkl'
-uk_hex_total.to_pickle(save_file)
\ No newline at end of file
+# With the spawn start method (macOS, Windows), the worker processes of the k sweep import this script again
+if __name__ == '__main__':
+    # User input to obtain whether we are using the census data from uniform or weighted interpolation (the
+    # variant of the run when run by the pipeline)
+    user_input = pipeline_parameter('variant') or input(
+        "Enter 'uniform' or 'weighted' depending on how you want the census data to have been obtained")
+    # Resolution of the hexagons: any coarser resolution saved by the feature pyramid scripts can also be used
+    resolution_id = pipeline_parameter('resolution', 8 if user_input == 'weighted' else 7)
+
+    # Select feature store file to read features and store features in a variable
+    if user_input == 'weighted':
+        file_name = f"../../data/filter/UK_weighted_merged_features_h{resolution_id}_uk.parquet"
+        output_directory = '../../outputs/01_weighted_interpolation'
+    else:
+        file_name = f"../../data/filter/UK_uniform_merged_features_h{resolution_id}_uk.parquet"
+        output_directory = '../../outputs/02_uniform_interpolation'
+
+    uk_hex_total = read_features(file_name)
+
+    ##################
+    # Optional: compare different numbers of clusters before fixing n_clusters_uk
+    # Inertia, Davies-Bouldin index, sampled silhouette score and stability of the labels across seeds for each k
+    ##################
+    run_k_sweep = False
+    if run_k_sweep:
+        k_sweep = sweep_k(uk_hex_total, ['population_density', 'avg_age', 'avg_household_size'], k_range=range(2, 9),
+                          seeds=[0, 1, 2], n_jobs=pipeline_parameter('n_jobs'), plot=True,
+                          figure_file_path=f'{output_directory}/figures/k_sweep_h{resolution_id}.png')
+        print(k_sweep)
+
+    ##################
+    # Perform first step of the k-means clustering
+    # Cluster hexagons at resolution 8 level in rural-mid-urban based on population density, avg and avg household size
+    # Variables for the analysis could be change depending on the variables available in the uk_hex_total dataframe
+    ##################
+
+    # Define parameter values clustering function
+    column_names_clustering_3_tier = ['population_density', 'avg_age', 'avg_household_size']
+    n_clusters_uk = 3  # rural-mid-urban classification
+    name_label_column_3_tier = 'label_3_tier'  # Label column name
+    colors_3_tier = ['red', 'greenyellow', 'dodgerblue']
+    file_path_3_tier = f'{output_directory}/figures/3_tier_post_analysis.png'
+    model_file_3_tier = f'{output_directory}/data/UK_clustering_3_tier_model_h{resolution_id}.npz'
+
+
+    uk_hex_total, metrics_3_tier = clustering_k_means(
+        df=uk_hex_total, columns_clustering=column_names_clustering_3_tier, n_clusters=n_clusters_uk,
+        label_column_name=name_label_column_3_tier, post_analysis=True, colors_plot=colors_3_tier,
+        figure_file_path=file_path_3_tier, metrics=True, model_file_path=model_file_3_tier)
+
+    print('3 Tier Clustering scores')
+    print(pd.DataFrame(data=metrics_3_tier))
+
+    # Save to the feature store
+    save_file = f'{output_directory}/data/UK_clustering_3_tier_labels_h{resolution_id}.parquet'
+    write_features(uk_hex_total, save_file)
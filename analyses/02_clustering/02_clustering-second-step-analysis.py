@@ -1,26 +1,28 @@
 # Perform second step of the clustering: subclassification of middle and rural
 # Analyse the distribution of each variable used for the clustering by output label
 
-import pickle
-from src.clustering_k_means import clustering_k_means
+from src.feature_store import read_features, write_features
+from src.hierarchical_clustering import HierarchicalHexClusterer
+from src.clustering_model import load_model
+from src.evaluation import evaluate_clustering
+from src.pipeline import pipeline_parameter
 import pandas as pd
 
-# User input to obtain whether we are using the census data from uniform or weighted interpolation
-user_input = input("Enter 'uniform' or 'weighted' depending on how you want the census data to have been obtained")
+# User input to obtain whether we are using the census data from uniform or weighted interpolation (the
+# variant of the run when run by the pipeline)
+user_input = pipeline_parameter('variant') or input(
+    "Enter 'uniform' or 'weighted' depending on how you want the census data to have been obtained")
+# Resolution of the hexagons: any coarser resolution saved by the feature pyramid scripts can also be used
+resolution_id = pipeline_parameter('resolution', 8 if user_input == 'weighted' else 7)
 
-# Read pickle file with features and store in a variable
+# Read feature store file with features and store in a variable
 if user_input == 'weighted':
-    file_name = "../../outputs/01_weighted_interpolation/data/UK_clustering_3_tier_labels_h8.pkl"
+    file_name = f"../../outputs/01_weighted_interpolation/data/UK_clustering_3_tier_labels_h{resolution_id}.parquet"
+    model_file_3_tier = f'../../outputs/01_weighted_interpolation/data/UK_clustering_3_tier_model_h{resolution_id}.npz'
 else:
-    file_name = "../../outputs/02_uniform_interpolation/data/UK_clustering_3_tier_labels_h7.pkl"
-objects = []
-with (open(file_name, "rb")) as openfile:
-    while True:
-        try:
-            objects.append(pickle.load(openfile))
-        except EOFError:
-            break
-uk_hex_total = objects[0]
+    file_name = f"../../outputs/02_uniform_interpolation/data/UK_clustering_3_tier_labels_h{resolution_id}.parquet"
+    model_file_3_tier = f'../../outputs/02_uniform_interpolation/data/UK_clustering_3_tier_model_h{resolution_id}.npz'
+uk_hex_total = read_features(file_name)
 column_names = list(uk_hex_total.columns.values)
 column_names_labels = [name for name in column_names if name.startswith('label')]
 # Name of column that contains final classification
@@ -33,82 +35,56 @@ name_label_column_3_tier = column_names_labels[0]
 # Variables for the analysis could be change depending on the variables available in the uk_hex_total dataframe
 ####################
 
-# Rename labels to add labels of subclasses in the correct order
-uk_hex_total[name_label_column_3_tier] = uk_hex_total[name_label_column_3_tier].apply(lambda x: 3 if x == 1 else x)
-
-# Select subset of dataframe with instances for rural and middle class
-uk_hex_rural = uk_hex_total.loc[uk_hex_total[name_label_column_3_tier] == 3]
-uk_hex_middle = uk_hex_total.loc[uk_hex_total[name_label_column_3_tier] == 0]
-
 ################
-# Sub-clustering for middle class
+# Sub-clustering for middle class (label 0 of the 3-tier clustering)
 ################
 column_names_extra_middle = ['population_density', 'area_residential', 'length_residential', 'length_tertiary']
 n_clusters_middle = 2
-name_label_column_middle = 'middle_label_subclass'
 colors_middle = ['red', 'maroon']
 if user_input == 'weighted':
     file_path_middle = '../../outputs/01_weighted_interpolation/figures/middle_sub_clustering_post_analysis.png'
 else:
     file_path_middle = '../../outputs/02_uniform_interpolation/figures/middle_sub_clustering_post_analysis.png'
 
-
-uk_hex_middle, metrics_middle = clustering_k_means(df=uk_hex_middle, columns_clustering=column_names_extra_middle,
-                                                   n_clusters=n_clusters_middle, label_column_name=name_label_column_middle,
-                                                   post_analysis=True, colors_plot=colors_middle,
-                                                   figure_file_path=file_path_middle, metrics=True)
-
-# Select only labels and geometry before merging
-uk_hex_middle_drop = uk_hex_middle[[name_label_column_middle, 'geojson']]
-# Merge with original dataframe
-uk_hex_total = uk_hex_total.merge(uk_hex_middle_drop, how='outer', on='geojson')
-
 ################
-# Sub-clustering for rural class
+# Sub-clustering for rural class (label 1 of the 3-tier clustering)
 ################
 column_names_extra_rural = ['population_density', 'area_residential', 'length_residential', 'length_tertiary']
 n_clusters_rural = 3
-name_label_column_rural = 'rural_label_subclass'
 colors_rural = ['greenyellow', 'forestgreen', 'orange']
 if user_input == 'weighted':
     file_path_rural = '../../outputs/01_weighted_interpolation/figures/rural_sub_clustering_post_analysis.png'
 else:
     file_path_rural = '../../outputs/02_uniform_interpolation/figures/rural_sub_clustering_post_analysis.png'
 
-uk_hex_rural, metrics_rural = clustering_k_means(df=uk_hex_rural, columns_clustering=column_names_extra_rural,
-                                                 n_clusters=n_clusters_rural, label_column_name=name_label_column_rural,
-                                                 post_analysis=True, colors_plot=colors_rural,
-                                                 figure_file_path=file_path_rural, metrics=True)
-
-# Modify labels of subclassification for rural areas before merging back with the whole dataset
-uk_hex_rural[name_label_column_rural] = uk_hex_rural[name_label_column_rural].apply(lambda x: x+3)
-# Select only labels and geometry before merging
-uk_hex_rural_drop = uk_hex_rural[[name_label_column_rural, 'geojson']]
-# Merge with original dataframe
-uk_hex_total = uk_hex_total.merge(uk_hex_rural_drop, how='outer', on='geojson')
-
-
 #################
 # Combine two-steps from clustering
 #################
 
-# Rename column with final two-step clustering labels
+# Final labels: middle subclasses first (0, 1), then urban (2) and rural subclasses (3, 4, 5)
+# Labels are assigned by position, so no merge with the original dataframe is needed
+# The first step is the one of the first-step analysis (its labels and its saved model)
+clusterer = HierarchicalHexClusterer(
+    sub_clusterings={
+        0: {'columns': column_names_extra_middle, 'n_clusters': n_clusters_middle,
+            'post_analysis': True, 'colors_plot': colors_middle, 'figure_file_path': file_path_middle,
+            'metrics': True},
+        1: {'columns': column_names_extra_rural, 'n_clusters': n_clusters_rural,
+            'post_analysis': True, 'colors_plot': colors_rural, 'figure_file_path': file_path_rural,
+            'metrics': True},
+    },
+    tier_order=[0, 2, 1])
+labels_total = clusterer.fit_predict(uk_hex_total, labels_first_step=uk_hex_total[name_label_column_3_tier].to_numpy(),
+                                     first_step_model=load_model(model_file_3_tier))
+metrics_middle, metrics_rural = clusterer.metrics_[0], clusterer.metrics_[1]
+
+# Rename labels of the 3-tier clustering to match the order of the final labels
+uk_hex_total[name_label_column_3_tier] = uk_hex_total[name_label_column_3_tier].apply(lambda x: 3 if x == 1 else x)
+
+# Add column with final two-step clustering labels
 n_classes = n_clusters_rural + n_clusters_middle + 1
 name_label_column_total = 'label_' + str(n_classes) + '_tier'
-uk_hex_total.rename(columns={name_label_column_rural: name_label_column_total}, inplace=True)
-
-# Combine all labels in the same column
-uk_hex_total[name_label_column_total] = uk_hex_total[name_label_column_total].\
-    fillna(uk_hex_total[name_label_column_middle])  # Incorporate labels from middle subclassification
-
-uk_hex_total[name_label_column_total] = uk_hex_total[name_label_column_total].\
-    fillna(uk_hex_total[name_label_column_3_tier])  # Incorporate labels from urban type
-
-# Convert label column to type integer
-uk_hex_total[name_label_column_total] = uk_hex_total[name_label_column_total].astype(int)
-
-# Drop column with labels from middle subclassification
-uk_hex_total = uk_hex_total.drop(columns=name_label_column_middle)
+uk_hex_total[name_label_column_total] = labels_total
 
 # Define a dictionary to store scores
 scores = {
@@ -121,7 +97,8 @@ print("Available Scores:")
 print("1. Middle Sub-clustering")
 print("2. Rural Sub-clustering")
 
-user_input_results = input("Enter the number(s) of the score(s) you want to print (e.g., '1 2' to print Middle and Rural): ")
+user_input_results = pipeline_parameter('scores') or input(
+    "Enter the number(s) of the score(s) you want to print (e.g., '1 2' to print Middle and Rural): ")
 
 selected_score = {key: scores[key] for key in scores if key in user_input_results}
 
@@ -130,11 +107,22 @@ for value in selected_score.values():
     print(pd.DataFrame(data=value['scores']))
     print("\n")
 
-# Save to pickle file
+# Accuracy and F1 score of each class of the final labels against the manually labelled test hexagons
+test_summary, _ = evaluate_clustering({user_input: uk_hex_total}, test_file_path='../../data/test/test_set.csv',
+                                      label_column=name_label_column_total, n_classes=n_classes)
+print('Evaluation against the test set')
+print(test_summary.to_string(index=False))
+
+# Save to the feature store
 if user_input == 'weighted':
-    save_file = '../../outputs/01_weighted_interpolation/data/UK_clustering_labels_h8.pkl'
+    save_file = f'../../outputs/01_weighted_interpolation/data/UK_clustering_labels_h{resolution_id}.parquet'
+    model_file = f'../../outputs/01_weighted_interpolation/data/UK_clustering_model_h{resolution_id}.npz'
 else:
-    save_file = '../../outputs/02_uniform_interpolation/data/UK_clustering_labels_h7.pkl'
+    save_file = f'../../outputs/02_uniform_interpolation/data/UK_clustering_labels_h{resolution_id}.parquet'
+    model_file = f'../../outputs/02_uniform_interpolation/data/UK_clustering_model_h{resolution_id}.npz'
 
-uk_hex_total.to_pickle(save_file)
+write_features(uk_hex_total, save_file)
+# Save the scalers and centroids of every tier, to assign the 6-tier label of new hexagons with
+# src.clustering_model.predict
+clusterer.save(model_file)
 
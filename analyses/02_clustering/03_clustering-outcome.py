@@ -1,81 +1,103 @@
 # Visualize clustering outcome
 
-import pickle
-import folium
+from src.feature_store import read_features, read_features_arrow
+from src.h3_index import uint64_to_h3
+from src.map_export import label_colors, export_h3_map
 import datetime
 from shapely import Polygon
 from tqdm import tqdm
 from src.style_folium import style
+from src.pipeline import pipeline_parameter
 import geopandas as gpd
 
-# User input to obtain whether we are using the census data from uniform or weighted interpolation
-user_input = input("Enter 'uniform' or 'weighted' depending on how you want the census data to have been obtained")
+# Map written: 'deckgl' (only the hexagon ids and labels are written and the hexagons are drawn by the browser) or
+# 'folium' (the polygons of all the hexagons are embedded in the file, too large to be opened at resolution 8)
+map_format = 'deckgl'
 
-# Read pickle file with final clustering output
+# User input to obtain whether we are using the census data from uniform or weighted interpolation (the
+# variant of the run when run by the pipeline)
+user_input = pipeline_parameter('variant') or input(
+    "Enter 'uniform' or 'weighted' depending on how you want the census data to have been obtained")
+# Resolution of the hexagons: any coarser resolution saved by the feature pyramid scripts can also be used
+resolution_id = pipeline_parameter('resolution', 8 if user_input == 'weighted' else 7)
+
+# Read feature store file with final clustering output
 if user_input == 'weighted':
-    file_name = '../../outputs/01_weighted_interpolation/data/UK_clustering_labels_h8.pkl'
+    file_name = f'../../outputs/01_weighted_interpolation/data/UK_clustering_labels_h{resolution_id}.parquet'
 else:
-    file_name = '../../outputs/02_uniform_interpolation/data/UK_clustering_labels_h7.pkl'
-objects = []
-with (open(file_name, "rb")) as openfile:
-    while True:
-        try:
-            objects.append(pickle.load(openfile))
-        except EOFError:
-            break
-uk_hex_total = objects[0]
-column_names = list(uk_hex_total.columns.values)
+    file_name = f'../../outputs/02_uniform_interpolation/data/UK_clustering_labels_h{resolution_id}.parquet'
+column_names = read_features_arrow(file_name).column_names
 column_names_labels = [name for name in column_names if name.startswith('label')]
 # Name of column that contains final classification
 name_label_column_total = column_names_labels[1]
-# Drop geojson column and only keep geometry column
-uk_hex_total.drop(columns=['geojson'], inplace=True)
-# Convert dataframe to GeoDataFrame format
-uk_hex_total = gpd.GeoDataFrame(uk_hex_total, geometry=uk_hex_total['geometry'])
-# Define EPSG Geodetic Parameter
-uk_hex_total.crs = {'init': 'epsg:4326'}
-
-# Create folium plot with classification
-title_progress_bar = "Folium plot is created using labels from the column " +  name_label_column_total
-with tqdm(desc=title_progress_bar) as pbar_folium_plot:
-
-    layer = 'Light_3857'
-    key = "M4ACNwQ2vRAGGGT2teFgPtuhLq1YSx4L"
-    zxy_path = 'https://api.os.uk/maps/raster/v1/zxy/{}/{{z}}/{{x}}/{{y}}.png?key={}'.format(layer, key)
-
-    # Create a new Folium map
-    # Ordnance Survey basemap using the OS Data Hub OS Maps API centred on the boundary centroid location
-    # Zoom levels 7 - 16 correspond to the open data zoom scales only
-    uk_bbox_coords = [[58.6350001085, 1.68153079591], [58.6350001085, -7.57216793459], [49.959999905, -7.57216793459],
-                      [49.959999905, 1.68153079591]]
-    loc = list(Polygon(uk_bbox_coords).centroid.coords[0])
-    m = folium.Map(location=loc,  # centred geocoordinates
-                   zoom_start=10,
-                   scrollWheelZoom=False,
-                   tiles=zxy_path,
-                   attr='Contains OS data © Crown copyright and database right {}'.format(datetime.date.today().year))
-
-    date = datetime.datetime.today()  # Obtain date and time
-
-    # List of colors for the different categories
-    colors = ['red', 'maroon', 'dodgerblue', 'greenyellow', 'forestgreen', 'orange']
-    # Check that the number of colors is greater or equal than the number of classes
-    max_value = uk_hex_total[name_label_column_total].max()
-    assert len(colors) > max_value, "Error: The length of the vector is smaller than the number of classes."
-
-    # Add color to each element in the dataframe based on clustering labels
-    for i in uk_hex_total.index:
-        color_id = uk_hex_total.iloc[i][name_label_column_total]
-        uk_hex_total.at[i, 'color'] = colors[color_id]
-
-    # Add data to the plot
-    folium.GeoJson(data=uk_hex_total, style_function=style).add_to(m)
-
-    if user_input == 'weighted':
-        file_name_folium_plot = "../../outputs/01_weighted_interpolation/figures/uk_cluster_6_tier_plot.html"
-    else:
-        file_name_folium_plot = "../../outputs/02_uniform_interpolation/figures/uk_cluster_6_tier_plot.html"
-
-    m.save(file_name_folium_plot)
-
-    pbar_folium_plot.update(1)
\ No newline at end of file
+if map_format == 'folium':
+    uk_hex_total = read_features(file_name)
+    # Drop geojson column and only keep geometry column
+    uk_hex_total.drop(columns=['geojson'], inplace=True)
+else:
+    # Only the hexagon ids and the labels are needed
+    uk_hex_total = read_features(file_name, columns=['index', name_label_column_total])
+
+# List of colors for the different categories
+colors = ['red', 'maroon', 'dodgerblue', 'greenyellow', 'forestgreen', 'orange']
+# Add color to each element in the dataframe based on clustering labels (raises an error if there are fewer colors
+# than classes)
+uk_hex_total['color'] = label_colors(uk_hex_total[name_label_column_total].to_numpy(), colors)
+
+# Basemap: Ordnance Survey basemap using the OS Data Hub OS Maps API
+layer = 'Light_3857'
+key = "M4ACNwQ2vRAGGGT2teFgPtuhLq1YSx4L"
+zxy_path = 'https://api.os.uk/maps/raster/v1/zxy/{}/{{z}}/{{x}}/{{y}}.png?key={}'.format(layer, key)
+attribution = 'Contains OS data © Crown copyright and database right {}'.format(datetime.date.today().year)
+# Centred on the centroid of the UK bounding box
+uk_bbox_coords = [[58.6350001085, 1.68153079591], [58.6350001085, -7.57216793459], [49.959999905, -7.57216793459],
+                  [49.959999905, 1.68153079591]]
+loc = list(Polygon(uk_bbox_coords).centroid.coords[0])
+
+if map_format == 'deckgl':
+    # Map drawn by the browser from the hexagon ids with the H3HexagonLayer of deck.gl
+    title_progress_bar = "deck.gl map is created using labels from the column " + name_label_column_total
+    with tqdm(desc=title_progress_bar) as pbar_map:
+        if user_input == 'weighted':
+            file_name_map = "../../outputs/01_weighted_interpolation/figures/uk_cluster_6_tier_map.html"
+        else:
+            file_name_map = "../../outputs/02_uniform_interpolation/figures/uk_cluster_6_tier_map.html"
+
+        export_h3_map(uk_hex_total['index'], uk_hex_total[name_label_column_total], file_name_map, colors,
+                      title='6-tier classification of the UK hexagons', center=loc, tile_url=zxy_path,
+                      attribution=attribution)
+        pbar_map.update(1)
+
+else:
+    import folium
+
+    # Hexagon ids are written to the map as strings
+    uk_hex_total['index'] = uint64_to_h3(uk_hex_total['index'].to_numpy())
+    # Convert dataframe to GeoDataFrame format
+    uk_hex_total = gpd.GeoDataFrame(uk_hex_total, geometry=uk_hex_total['geometry'])
+    # Define EPSG Geodetic Parameter
+    uk_hex_total.crs = {'init': 'epsg:4326'}
+
+    # Create folium plot with classification
+    title_progress_bar = "Folium plot is created using labels from the column " + name_label_column_total
+    with tqdm(desc=title_progress_bar) as pbar_folium_plot:
+
+        # Create a new Folium map
+        # Zoom levels 7 - 16 correspond to the open data zoom scales only
+        m = folium.Map(location=loc,  # centred geocoordinates
+                       zoom_start=10,
+                       scrollWheelZoom=False,
+                       tiles=zxy_path,
+                       attr=attribution)
+
+        # Add data to the plot
+        folium.GeoJson(data=uk_hex_total, style_function=style).add_to(m)
+
+        if user_input == 'weighted':
+            file_name_folium_plot = "../../outputs/01_weighted_interpolation/figures/uk_cluster_6_tier_plot.html"
+        else:
+            file_name_folium_plot = "../../outputs/02_uniform_interpolation/figures/uk_cluster_6_tier_plot.html"
+
+        m.save(file_name_folium_plot)
+
+        pbar_folium_plot.update(1)
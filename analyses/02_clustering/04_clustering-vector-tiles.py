@@ -0,0 +1,54 @@
+# Export the final classification as vector tiles and serve them locally
+
+import os
+from src.feature_store import read_features, read_features_arrow
+from src.vector_tiles import export_vector_tiles, serve_tiles
+from src.pipeline import pipeline_parameter
+
+# Format of the tiles: 'directory' ({z}/{x}/{y}.pbf files) or 'mbtiles' (a single SQLite file)
+output_format = 'directory'
+# Zoom levels of the tiles (hexagons are aggregated to coarser parents by majority label at low zooms)
+min_zoom, max_zoom = 0, 10
+# Number of worker processes that encode the tiles
+n_jobs = pipeline_parameter('n_jobs', os.cpu_count())
+# Serve the tiles and their viewer with a local HTTP server once they are written
+serve = pipeline_parameter('serve', True)
+port = 8000
+
+# With the spawn start method (macOS, Windows), the worker processes encoding the tiles import this script again
+if __name__ == '__main__':
+    # User input to obtain whether we are using the census data from uniform or weighted interpolation (the
+    # variant of the run when run by the pipeline)
+    user_input = pipeline_parameter('variant') or input(
+        "Enter 'uniform' or 'weighted' depending on how you want the census data to have been obtained")
+    # Resolution of the hexagons: any coarser resolution saved by the feature pyramid scripts can also be used
+    resolution_id = pipeline_parameter('resolution', 8 if user_input == 'weighted' else 7)
+
+    # Read feature store file with final clustering output (only the hexagon ids and the final labels)
+    if user_input == 'weighted':
+        file_name = f'../../outputs/01_weighted_interpolation/data/UK_clustering_labels_h{resolution_id}.parquet'
+        tiles_path = '../../outputs/01_weighted_interpolation/figures/uk_cluster_6_tier_tiles'
+    else:
+        file_name = f'../../outputs/02_uniform_interpolation/data/UK_clustering_labels_h{resolution_id}.parquet'
+        tiles_path = '../../outputs/02_uniform_interpolation/figures/uk_cluster_6_tier_tiles'
+    if output_format == 'mbtiles':
+        tiles_path += '.mbtiles'
+    column_names = read_features_arrow(file_name).column_names
+    column_names_labels = [name for name in column_names if name.startswith('label')]
+    # Name of column that contains final classification
+    name_label_column_total = column_names_labels[1]
+    uk_hex_total = read_features(file_name, columns=['index', name_label_column_total])
+
+    ###############
+    # Vector tiles
+    ###############
+    # List of colors for the different categories
+    colors = ['red', 'maroon', 'dodgerblue', 'greenyellow', 'forestgreen', 'orange']
+    tilejson = export_vector_tiles(uk_hex_total['index'], uk_hex_total[name_label_column_total], tiles_path, colors,
+                                   min_zoom=min_zoom, max_zoom=max_zoom, output_format=output_format, n_jobs=n_jobs,
+                                   title='6-tier classification of the UK hexagons')
+    print(f"{sum(tilejson['tile_counts'].values())} tiles written to {tiles_path}")
+
+    if serve:
+        # Open the printed address in a browser; stop the server with Ctrl+C
+        serve_tiles(tiles_path, port=port)
@@ -0,0 +1,44 @@
+# Dissolve the hexagons of each class of the final classification into one multipolygon per class (e.g. the urban
+# area polygons), for the consumers that do not need the individual hexagons
+
+import os
+from src.feature_store import read_features, read_features_arrow
+from src.class_regions import dissolve_labels, write_class_regions
+from src.pipeline import pipeline_parameter
+
+# Number of worker processes (the hexagons are partitioned by their parent cell at resolution 4)
+n_jobs = pipeline_parameter('n_jobs', os.cpu_count())
+# Names of the classes of the 6-tier classification (labels 0-1 middle, 2 urban, 3-5 rural)
+class_names = ['middle 1', 'middle 2', 'urban', 'rural 1', 'rural 2', 'rural 3']
+
+# With the spawn start method (macOS, Windows), the worker processes import this script again
+if __name__ == '__main__':
+    # User input to obtain whether we are using the census data from uniform or weighted interpolation (the
+    # variant of the run when run by the pipeline)
+    user_input = pipeline_parameter('variant') or input(
+        "Enter 'uniform' or 'weighted' depending on how you want the census data to have been obtained")
+    # Resolution of the hexagons: any coarser resolution saved by the feature pyramid scripts can also be used
+    resolution_id = pipeline_parameter('resolution', 8 if user_input == 'weighted' else 7)
+
+    # Read feature store file with final clustering output (only the hexagon ids and the final labels)
+    if user_input == 'weighted':
+        output_directory = '../../outputs/01_weighted_interpolation/data'
+    else:
+        output_directory = '../../outputs/02_uniform_interpolation/data'
+    file_name = f'{output_directory}/UK_clustering_labels_h{resolution_id}.parquet'
+    column_names = read_features_arrow(file_name).column_names
+    column_names_labels = [name for name in column_names if name.startswith('label')]
+    # Name of column that contains final classification
+    name_label_column_total = column_names_labels[1]
+    uk_hex_total = read_features(file_name, columns=['index', name_label_column_total])
+
+    ###############
+    # Dissolve the hexagons of each class
+    ###############
+    gdf_regions = dissolve_labels(uk_hex_total['index'], uk_hex_total[name_label_column_total], n_jobs=n_jobs,
+                                  names=class_names)
+    print(gdf_regions.drop(columns='geometry'))
+
+    # Save to the feature store (GeoParquet) and as GeoJSON
+    write_class_regions(gdf_regions, f'{output_directory}/UK_class_regions_h{resolution_id}.parquet',
+                        f'{output_directory}/UK_class_regions_h{resolution_id}.geojson')
@@ -0,0 +1,24 @@
+# Evaluate the final classification of the weighted and uniform variants against the manually labelled test hexagons
+
+import pandas as pd
+from src.evaluation import evaluate_clustering
+from src.pipeline import pipeline_parameter
+
+# Variants to evaluate and resolution of the clustering output of each of them (the test hexagons, at resolution 8,
+# are mapped to their parent cells for the coarser resolutions)
+variants = pipeline_parameter('variants', ['weighted', 'uniform'])
+resolutions = pipeline_parameter('resolutions', {'weighted': 8, 'uniform': 7})
+
+output_directories = {'weighted': '../../outputs/01_weighted_interpolation/data',
+                      'uniform': '../../outputs/02_uniform_interpolation/data'}
+outputs = {variant: f'{output_directories[variant]}/UK_clustering_labels_h{resolutions[variant]}.parquet'
+           for variant in variants}
+
+summary, details = evaluate_clustering(outputs, test_file_path='../../data/test/test_set.csv')
+
+pd.set_option('display.width', 200)
+print('Accuracy and F1 score of each class against the test set')
+print(summary.to_string(index=False))
+for variant, metrics in details.items():
+    print(f'\nConfusion matrix ({variant})')
+    print(metrics['Confusion Matrix'])
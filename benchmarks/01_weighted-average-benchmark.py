@@ -0,0 +1,80 @@
+# Benchmark the vectorized weighted average kernels against the column-by-column loop previously used in the
+# census feature extraction, on a synthetic frame with the size of the UK at the hexagon resolution 8 level
+
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from src.weighted_average import weighted_average, downcast_counts, AGE_WEIGHTS_HEXAGON
+
+# Approximate number of resolution 8 hexagons covering the UK
+n_hexagons = 350000
+n_repeats = 3
+
+###############
+# Synthetic age histogram (101 columns of small counts, as in db.age)
+###############
+rng = np.random.default_rng(0)
+df_age = pd.DataFrame(rng.poisson(5, size=(n_hexagons, len(AGE_WEIGHTS_HEXAGON))), columns=list(AGE_WEIGHTS_HEXAGON))
+# Memory-lean copy with the counts stored as 32-bit integers
+df_age_int32 = downcast_counts(df_age, AGE_WEIGHTS_HEXAGON)
+
+
+def loop_average_age(df):
+    """
+    Column-by-column computation of the average age used before the vectorized kernels.
+    """
+    cumsum_age = df['0'].astype('int64') * 0
+    total_p = df['0'].astype('int64') * 0
+    for age in range(101):
+        age_column = f'{age}'
+        cumsum_age = cumsum_age + df[age_column].astype('int64') * (age + 1)
+        total_p = total_p + df[age_column].astype('int64')
+    return cumsum_age / total_p
+
+
+def best_time(function):
+    """
+    Best wall time (in seconds) of n_repeats runs of function.
+    """
+    times = []
+    for _ in range(n_repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def peak_memory(function):
+    """
+    Peak memory (in MB) allocated while running function.
+    """
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2 ** 20
+
+
+def frame_memory(df):
+    """
+    Memory (in MB) used by the columns of a DataFrame.
+    """
+    return df.memory_usage(index=False).sum() / 2 ** 20
+
+
+reference = loop_average_age(df_age)
+time_loop = best_time(lambda: loop_average_age(df_age))
+results = [{'method': 'loop (int64)', 'time (s)': time_loop, 'speedup': 1.0, 'frame (MB)': frame_memory(df_age),
+            'peak temporaries (MB)': peak_memory(lambda: loop_average_age(df_age)), 'max abs diff': 0.0}]
+for dtype, df in [('int64', df_age), ('int32', df_age_int32)]:
+    estimate = weighted_average(df, AGE_WEIGHTS_HEXAGON, dtype=dtype)
+    time_kernel = best_time(lambda: weighted_average(df, AGE_WEIGHTS_HEXAGON, dtype=dtype))
+    results.append({'method': f'matrix-vector ({dtype})', 'time (s)': time_kernel, 'speedup': time_loop / time_kernel,
+                    'frame (MB)': frame_memory(df),
+                    'peak temporaries (MB)': peak_memory(
+                        lambda: weighted_average(df, AGE_WEIGHTS_HEXAGON, dtype=dtype)),
+                    'max abs diff': float(np.abs(estimate - reference).max())})
+
+print(f'Average age of {n_hexagons} hexagons over {len(AGE_WEIGHTS_HEXAGON)} age columns')
+print(pd.DataFrame(results).to_string(index=False))
@@ -0,0 +1,60 @@
+# Benchmark the parallel construction of the area weights between census areas and H3 hexagons against the number
+# of worker processes, on the UK census boundaries saved by the uniform census extraction (or, if they have not been
+# extracted yet, on a synthetic tessellation of the UK with a comparable number of areas)
+
+import os
+import time
+import numpy as np
+import pandas as pd
+import shapely
+import geopandas as gpd
+from src.feature_store import read_features
+from src.h3_interpolation import build_h3_area_weights
+
+boundaries_file = 'data/filter/staging/uk_census_boundaries.parquet'
+resolution_id = 7
+n_repeats = 1
+
+
+def best_time(function):
+    """
+    Best wall time (in seconds) of n_repeats runs of function.
+    """
+    times = []
+    for _ in range(n_repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+# With the spawn start method (macOS, Windows), the worker processes import this script again
+if __name__ == '__main__':
+    ###############
+    # Census boundaries
+    ###############
+    if os.path.exists(boundaries_file):
+        gdf_boundaries = read_features(boundaries_file)
+        gdf_boundaries = gdf_boundaries.set_geometry('geojson')
+        boundaries_name = 'UK census boundaries'
+    else:
+        # Voronoi tessellation of the UK bounding box, with as many areas as local authorities in England and Wales
+        rng = np.random.default_rng(0)
+        uk_bbox = shapely.box(-7.57216793459, 49.959999905, 1.68153079591, 58.6350001085)
+        seeds = shapely.MultiPoint(rng.uniform([-7.5, 50.0], [1.6, 58.6], size=(330, 2)))
+        gdf_boundaries = gpd.GeoDataFrame(geometry=[cell.intersection(uk_bbox) for cell in
+                                                    shapely.voronoi_polygons(seeds).geoms], crs='EPSG:4326')
+        boundaries_name = 'synthetic tessellation of the UK'
+
+    core_counts = sorted({1, 2, 4, 8, os.cpu_count()} & set(range(1, os.cpu_count() + 1)))
+    reference = build_h3_area_weights(gdf_boundaries, resolution_id, n_jobs=1)['matrix']
+    results = []
+    for n_jobs in core_counts:
+        time_build = best_time(lambda: build_h3_area_weights(gdf_boundaries, resolution_id, n_jobs=n_jobs))
+        matrix = build_h3_area_weights(gdf_boundaries, resolution_id, n_jobs=n_jobs)['matrix']
+        results.append({'processes': n_jobs, 'time (s)': time_build, 'speedup': results[0]['time (s)'] / time_build
+                        if results else 1.0, 'max abs diff': abs(matrix - reference).max()})
+
+    print(f'Area weights of {len(gdf_boundaries)} areas ({boundaries_name}) at the hexagon resolution {resolution_id} '
+          f'level, {reference.shape[0]} hexagons, {os.cpu_count()} cores available')
+    print(pd.DataFrame(results).to_string(index=False))
@@ -0,0 +1,2 @@
+# Command line entry point of the pipeline (python -m hexclust run --config configs/pipeline.toml), implemented in
+# src/pipeline.py
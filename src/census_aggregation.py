@@ -0,0 +1,107 @@
+import warnings
+import pandas as pd
+
+
+def _weighted_sum_expression(columns, weights):
+    # Server-side equivalent of sum(df[column].astype('int64') * weight)
+    return {'$add': [{'$multiply': [{'$toLong': f'${column}'}, weight]} for column, weight in zip(columns, weights)]}
+
+
+def _safe_divide_expression(numerator, denominator):
+    # Return null instead of raising a server error when the denominator is 0
+    return {'$cond': [{'$eq': [denominator, 0]}, None, {'$divide': [numerator, denominator]}]}
+
+
+def census_features_pipeline(household_collection='householdsize', n_ages=101, n_household_sizes=8):
+    """
+    Build the MongoDB aggregation pipeline computing the census features of each hexagon server-side.
+
+    The pipeline runs on the age collection and joins the household size collection on the hexagon 'index', so
+    that only the hexagon id, the total population, the average age and the average household size are
+    transferred, instead of the 101 age columns and the 8 household size columns of every document.
+
+    The features follow the definitions used in the weighted census extraction:
+        - avg_age = sum((age + 1) * count_age) / sum(count_age) over the age columns '0', ..., '100'.
+        - avg_household_size = sum(size * count_size) / total over the household size columns '1', ..., '8'.
+
+    Args:
+        household_collection (str, optional): Name of the household size collection in the same database.
+            Default is 'householdsize'.
+        n_ages (int, optional): Number of age columns ('0' to str(n_ages - 1)). Default is 101.
+        n_household_sizes (int, optional): Number of household size columns ('1' to str(n_household_sizes)).
+            Default is 8.
+
+    Returns:
+        list of dict: The aggregation pipeline.
+    """
+    age_columns = [f'{age}' for age in range(n_ages)]
+    household_columns = [f'{size}' for size in range(1, n_household_sizes + 1)]
+
+    return [
+        # Reduce the age histogram to two numbers per hexagon and keep only the fields needed for the join
+        {'$project': {
+            '_id': 0,
+            'index': 1,
+            'total': 1,
+            'cumsum_age': _weighted_sum_expression(age_columns, range(1, n_ages + 1)),
+            'total_p': _weighted_sum_expression(age_columns, [1] * n_ages),
+        }},
+        # Join the household size document of the same hexagon (inner join after the unwind)
+        {'$lookup': {'from': household_collection, 'localField': 'index', 'foreignField': 'index',
+                     'as': 'household'}},
+        {'$unwind': '$household'},
+        # Reduce the household size histogram to its average
+        {'$project': {
+            'index': 1,
+            'total': 1,
+            'avg_age': _safe_divide_expression('$cumsum_age', '$total_p'),
+            'avg_household_size': _safe_divide_expression(
+                _weighted_sum_expression([f'household.{column}' for column in household_columns],
+                                         range(1, n_household_sizes + 1)),
+                {'$toLong': '$household.total'}),
+        }},
+    ]
+
+
+def aggregate_census_features(db, age_collection='age', household_collection='householdsize', batch_size=50000,
+                              pipeline=None, ensure_index=False):
+    """
+    Compute the census features of each hexagon with a MongoDB aggregation pipeline.
+
+    The join of each age document is an index lookup only if the 'index' field of the household size collection is
+    indexed, which can be ensured with ensure_index (this needs write access to the database).
+
+    Args:
+        db (pymongo.database.Database): The census database at the hexagon level (e.g. client.h3r8data). Any
+            object with the pymongo interface can be used, e.g. a mongomock database for testing.
+        age_collection (str, optional): Name of the age collection. Default is 'age'.
+        household_collection (str, optional): Name of the household size collection. Default is 'householdsize'.
+        batch_size (int, optional): Number of documents per cursor batch. Default is 50000.
+        pipeline (list of dict, optional): Pipeline to run. Default is census_features_pipeline(household_collection).
+        ensure_index (bool, optional): Whether to create the index on the 'index' field of the household size
+            collection if missing. A warning is emitted if it cannot be created (e.g. read-only user). Default is
+            False.
+
+    Returns:
+        pandas.DataFrame: A DataFrame with the columns 'index', 'total' (population), 'avg_age' and
+            'avg_household_size', without duplicated rows. The population density is total / hexagon area.
+
+    Example:
+        >>> df_census = aggregate_census_features(pymongo.MongoClient().h3r8data)
+        >>> df_census['population_density'] = df_census['total'] / df_census['index'].apply(h3.cell_area)
+    """
+    if ensure_index:
+        from pymongo.errors import OperationFailure
+        # The $lookup scans the whole household size collection for every age document without an index on 'index'
+        # (a no-op if the index already exists)
+        try:
+            db[household_collection].create_index('index')
+        except OperationFailure as error:
+            warnings.warn(f"Could not create the index on '{household_collection}.index', the join will scan the "
+                          f"collection: {error}")
+    if pipeline is None:
+        pipeline = census_features_pipeline(household_collection=household_collection)
+    cursor = db[age_collection].aggregate(pipeline, allowDiskUse=True, batchSize=batch_size)
+    df_census = pd.DataFrame(list(cursor), columns=['index', 'total', 'avg_age', 'avg_household_size'])
+    return df_census.astype({'total': 'float64', 'avg_age': 'float64', 'avg_household_size': 'float64'}) \
+        .drop_duplicates()
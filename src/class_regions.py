@@ -0,0 +1,119 @@
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import shapely
+import geopandas as gpd
+import h3.api.numpy_int as h3_int
+from src.h3_index import as_uint64_cells, cell_areas, cell_resolution, cell_to_parent
+from src.h3_interpolation import DEFAULT_PARTITION_RESOLUTION
+from src.feature_store import write_features
+
+
+def _dissolve_partition(cells, labels):
+    # Worker task: the polygons of the regions of contiguous cells of each label of one partition
+    regions = []
+    for label in np.unique(labels).tolist():
+        polygons = h3_int.h3_set_to_multi_polygon(cells[labels == label], geo_json=True)
+        # Each polygon is a list of closed rings in (lng, lat) order, the first one being the outer ring
+        regions.append((label, shapely.MultiPolygon([shapely.Polygon(rings[0], rings[1:]) for rings in polygons])))
+    return regions
+
+
+def dissolve_labels(hex_ids, labels, partition_resolution=DEFAULT_PARTITION_RESOLUTION, n_jobs=1,
+                    merge_partitions=True, grid_size=1e-9, names=None):
+    """
+    Merge the contiguous H3 cells with the same label into one multipolygon per label (e.g. the urban area
+    polygons), with the H3-native set-to-polygon operation.
+
+    The cells are partitioned by their parent cell at partition_resolution and the cells of each label of each
+    partition are dissolved with h3_set_to_multi_polygon, on a process pool with n_jobs > 1. The pieces of the
+    regions that cross the boundaries of the partitions are then merged per label, on a grid of grid_size degrees
+    so that the vertices shared by neighbouring partitions match exactly.
+
+    Args:
+        hex_ids (array-like): H3 ids as strings or integers, all at the same resolution.
+        labels (array-like): The integer label of each cell (e.g. the 'label_6_tier' column).
+        partition_resolution (int, optional): The resolution of the parent cells of the partitions, at most the
+            resolution of the cells. Default is 4.
+        n_jobs (int, optional): The number of worker processes. Default is 1 (no pool).
+        merge_partitions (bool, optional): Whether to merge the pieces of each label across partitions. If False,
+            there is one row per label and partition. Default is True.
+        grid_size (float, optional): The precision grid (in degrees) of the merge of the partitions. Default is
+            1e-9.
+        names (list of str, optional): The name of each label, added as a 'name' column. Default is None.
+
+    Returns:
+        geopandas.GeoDataFrame: One row per label (and partition, with merge_partitions=False, with the parent cell
+            in 'partition') with the 'label', the number of cells ('n_cells'), their area in km^2 ('area_km2') and
+            the multipolygon ('geometry', in EPSG:4326), sorted by label.
+
+    Example:
+        >>> gdf_regions = dissolve_labels(uk_hex_total['index'], uk_hex_total['label_6_tier'], n_jobs=os.cpu_count())
+    """
+    cells = as_uint64_cells(hex_ids)
+    labels = np.asarray(labels).astype(np.int64)
+    # Cells coarser than the partition resolution are their own partition
+    if len(cells):
+        partition_resolution = min(partition_resolution, int(cell_resolution(cells[:1])[0]))
+    partitions = cell_to_parent(cells, partition_resolution)
+    order = np.argsort(partitions, kind='stable')
+    partition_keys, starts = np.unique(partitions[order], return_index=True)
+    tasks = [(cells[positions], labels[positions]) for positions in np.split(order, starts[1:])] if len(cells) \
+        else []
+
+    if n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            # map returns the regions in the order of the partitions
+            results = list(executor.map(_dissolve_partition, *zip(*tasks))) if tasks else []
+    else:
+        results = [_dissolve_partition(*task) for task in tasks]
+
+    pieces = gpd.GeoDataFrame(
+        {'partition': np.repeat(partition_keys, [len(regions) for regions in results]),
+         'label': np.array([label for regions in results for label, _ in regions], dtype=np.int64)},
+        geometry=[region for regions in results for _, region in regions], crs='EPSG:4326')
+    # Number of cells and area of each label of each partition
+    # (the pieces are in the order of the partitions, then of the labels)
+    order = np.lexsort((labels, partitions))
+    pair_starts = np.flatnonzero(np.r_[True, (partitions[order][1:] != partitions[order][:-1]) |
+                                       (labels[order][1:] != labels[order][:-1])]) if len(cells) else []
+    pieces['n_cells'] = np.diff(np.r_[pair_starts, len(cells)]).astype(np.int64)
+    pieces['area_km2'] = np.add.reduceat(cell_areas(cells[order]), pair_starts) if len(cells) else []
+
+    if merge_partitions:
+        regions = []
+        for label, pieces_label in pieces.groupby('label', sort=True):
+            geometry = shapely.union_all(np.asarray(pieces_label.geometry.values), grid_size=grid_size)
+            if not isinstance(geometry, shapely.MultiPolygon):
+                geometry = shapely.MultiPolygon([geometry] if not geometry.is_empty else [])
+            regions.append({'label': label, 'n_cells': pieces_label['n_cells'].sum(),
+                            'area_km2': pieces_label['area_km2'].sum(), 'geometry': geometry})
+        gdf_regions = gpd.GeoDataFrame(regions, columns=['label', 'n_cells', 'area_km2', 'geometry'],
+                                       geometry='geometry', crs='EPSG:4326')
+    else:
+        gdf_regions = pieces[['partition', 'label', 'n_cells', 'area_km2', 'geometry']] \
+            .sort_values(['label', 'partition'], kind='stable').reset_index(drop=True)
+    if names is not None:
+        gdf_regions.insert(1, 'name', [names[label] for label in gdf_regions['label']])
+    return gdf_regions
+
+
+def write_class_regions(gdf_regions, file_path, geojson_file_path=None):
+    """
+    Write the dissolved regions of each label to the feature store as GeoParquet, and optionally as GeoJSON.
+
+    Args:
+        gdf_regions (geopandas.GeoDataFrame): The regions returned by dissolve_labels.
+        file_path (str): Path of the GeoParquet file to write.
+        geojson_file_path (str, optional): Path of the GeoJSON file to write. Default is None (not written).
+
+    Returns:
+        str: The path of the GeoParquet file.
+
+    Example:
+        >>> write_class_regions(gdf_regions, '../../outputs/01_weighted_interpolation/data/UK_class_regions_h8.parquet',
+        ...                     '../../outputs/01_weighted_interpolation/data/UK_class_regions_h8.geojson')
+    """
+    write_features(gdf_regions, file_path)
+    if geojson_file_path is not None:
+        gdf_regions.to_file(geojson_file_path, driver='GeoJSON')
+    return file_path
@@ -1,12 +1,158 @@
 from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 from sklearn.metrics import silhouette_score, davies_bouldin_score
+from src.clustering_model import tier_from_sklearn, single_tier_model, save_model
+from src.feature_store import iter_features, read_features
+from src.post_analysis_plots import plot_post_analysis
+from src.clustering_metrics import chunked_silhouette_score, sampled_silhouette_score, silhouette_from_sample
+
+CLUSTERING_BACKENDS = ('kmeans', 'minibatch', 'streaming')
+SILHOUETTE_METHODS = ('exact', 'chunked', 'sampled')
+
+
+def _iter_chunks(df, features_file_path, columns_clustering, chunk_size):
+    # Chunks of the clustering variables as float64 arrays, read from the feature store file if given
+    if features_file_path is not None:
+        for chunk in iter_features(features_file_path, columns=columns_clustering, batch_size=chunk_size):
+            yield chunk[columns_clustering].to_numpy(dtype=np.float64)
+    else:
+        df_clustering = df[columns_clustering]
+        for start in range(0, len(df_clustering), chunk_size):
+            yield df_clustering.iloc[start:start + chunk_size].to_numpy(dtype=np.float64)
+
+
+def partial_fit_k_means(chunks, n_clusters=3, scaler=None, clustering_kmeans=None, batch_size=4096,
+                        random_state=0):
+    """
+    Update a standardization and a mini-batch k-means model with one pass over chunks of data.
+
+    Each chunk is shuffled and split in mini-batches of batch_size rows before being passed to
+    MiniBatchKMeans.partial_fit, since the chunks read from disk are ordered by hexagon (i.e. spatially).
+
+    Args:
+        chunks (iterable of numpy.ndarray): Chunks of the clustering variables (not standardized).
+        n_clusters (int, optional): The number of clusters. Default is 3.
+        scaler (sklearn.preprocessing.StandardScaler, optional): A scaler already fitted on all the data (e.g.
+            with StandardScaler.partial_fit). Default is a scaler fitted on the first chunk.
+        clustering_kmeans (sklearn.cluster.MiniBatchKMeans, optional): The model to update. Default is a new model.
+        batch_size (int, optional): The number of rows of each mini-batch. Default is 4096.
+        random_state (int, optional): Seed of the model and of the shuffling. Default is 0.
+
+    Returns:
+        sklearn.preprocessing.StandardScaler: The scaler.
+        sklearn.cluster.MiniBatchKMeans: The updated model.
+    """
+    rng = np.random.default_rng(random_state)
+    if clustering_kmeans is None:
+        clustering_kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=random_state, batch_size=batch_size,
+                                            n_init="auto")
+    for chunk in chunks:
+        if scaler is None:
+            scaler = StandardScaler().fit(chunk)
+        chunk = scaler.transform(chunk)[rng.permutation(len(chunk))]
+        for start in range(0, len(chunk), batch_size):
+            batch = chunk[start:start + batch_size]
+            # The first mini-batch initialises the centroids, it needs at least n_clusters rows
+            if len(batch) >= n_clusters or hasattr(clustering_kmeans, 'cluster_centers_'):
+                clustering_kmeans.partial_fit(batch)
+    return scaler, clustering_kmeans
+
+
+def _clustering_streaming(df, features_file_path, columns_clustering, n_clusters, batch_size, chunk_size, max_epochs,
+                          tol, metrics, silhouette_sample_size, silhouette_random_state, confidence):
+    # Out-of-core k-means: every pass reads the data chunk by chunk, only the labels are kept in memory
+    def chunks():
+        return _iter_chunks(df, features_file_path, columns_clustering, chunk_size)
+
+    # First pass: standardization
+    scaler = StandardScaler()
+    for chunk in chunks():
+        scaler.partial_fit(chunk)
+    n_rows = int(scaler.n_samples_seen_) if np.ndim(scaler.n_samples_seen_) == 0 \
+        else int(np.max(scaler.n_samples_seen_))
+
+    # Mini-batch k-means epochs until the centroids stop moving (the data has unit variance after standardization)
+    clustering_kmeans = None
+    center_shifts = []
+    for epoch in range(max_epochs):
+        previous_centers = None if clustering_kmeans is None else clustering_kmeans.cluster_centers_.copy()
+        scaler, clustering_kmeans = partial_fit_k_means(chunks(), n_clusters=n_clusters, scaler=scaler,
+                                                        clustering_kmeans=clustering_kmeans, batch_size=batch_size,
+                                                        random_state=epoch)
+        if previous_centers is not None:
+            center_shifts.append(float(((clustering_kmeans.cluster_centers_ - previous_centers) ** 2).sum()))
+            if center_shifts[-1] <= tol:
+                break
+    centers = clustering_kmeans.cluster_centers_
+
+    # Labelling pass: labels, inertia and the sums of each cluster
+    labels = np.empty(n_rows, dtype=np.int64)
+    counts = np.zeros(n_clusters, dtype=np.int64)
+    sums = np.zeros((n_clusters, len(columns_clustering)))
+    inertia = 0.0
+    start = 0
+    for chunk in chunks():
+        chunk = scaler.transform(chunk)
+        distances = ((chunk[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        chunk_labels = distances.argmin(axis=1)
+        labels[start:start + len(chunk)] = chunk_labels
+        start += len(chunk)
+        inertia += float(distances[np.arange(len(chunk)), chunk_labels].sum())
+        counts += np.bincount(chunk_labels, minlength=n_clusters)
+        np.add.at(sums, chunk_labels, chunk)
+
+    scores = None
+    if metrics:
+        # Davies-Bouldin index with the mean distance of each cluster to its mean (one more pass), and a sample
+        # stratified by cluster for the silhouette score
+        rng = np.random.default_rng(silhouette_random_state)
+        # Proportional allocation, with at least about 2 rows of every cluster
+        sample_fractions = np.minimum(1.0, np.maximum(silhouette_sample_size / max(n_rows, 1),
+                                                      2 / np.maximum(counts, 1)))
+        sample, sample_labels = [], []
+        cluster_means = sums / np.maximum(counts, 1)[:, None]
+        intra_distances = np.zeros(n_clusters)
+        start = 0
+        for chunk in chunks():
+            chunk = scaler.transform(chunk)
+            chunk_labels = labels[start:start + len(chunk)]
+            start += len(chunk)
+            np.add.at(intra_distances, chunk_labels, np.sqrt(((chunk - cluster_means[chunk_labels]) ** 2).sum(axis=1)))
+            in_sample = rng.random(len(chunk)) < sample_fractions[chunk_labels]
+            sample.append(chunk[in_sample])
+            sample_labels.append(chunk_labels[in_sample])
+        intra_distances /= np.maximum(counts, 1)
+        centroid_distances = np.sqrt(((cluster_means[:, None, :] - cluster_means[None, :, :]) ** 2).sum(axis=2))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratios = (intra_distances[:, None] + intra_distances[None, :]) / centroid_distances
+        np.fill_diagonal(ratios, -np.inf)
+        db_index = float(np.mean(np.max(ratios, axis=1)))
+
+        silhouette = silhouette_from_sample(np.concatenate(sample), np.concatenate(sample_labels), counts,
+                                            confidence=confidence)
+        scores = (silhouette, db_index, inertia)
+
+    tier = {'columns': list(columns_clustering), 'mean': scaler.mean_, 'scale': scaler.scale_,
+            'centroids': centers.copy(), 'counts': counts}
+    diagnostics = {
+        'backend': 'streaming',
+        'n_iter': len(center_shifts) + 1,
+        'n_steps': int(clustering_kmeans.n_steps_),
+        'converged': bool(center_shifts) and center_shifts[-1] <= tol,
+        'center_shifts': center_shifts,
+    }
+    return labels, tier, scores, diagnostics
 
 
 def clustering_k_means(df, columns_clustering, n_clusters=3, label_column_name='label',
-                       post_analysis=True, figure_file_path=None, colors_plot=None, metrics=True):
+                       post_analysis=True, figure_file_path=None, colors_plot=None, metrics=True,
+                       model_file_path=None, backend='kmeans', batch_size=4096, features_file_path=None,
+                       chunk_size=100000, max_epochs=10, tol=1e-4, silhouette_method='exact',
+                       silhouette_sample_size=50000, silhouette_random_state=0, confidence=0.95,
+                       return_diagnostics=False, density_method='kde', kde_sample_size=10000, show_plot=False,
+                       random_state=0):
     """
     Perform k-means clustering on a DataFrame using specified columns and optionally conduct post-analysis.
 
@@ -17,13 +163,57 @@ def clustering_k_means(df, columns_clustering, n_clusters=3, label_column_name='
         label_column_name (str, optional): The name of the column where cluster labels will be added to the DataFrame.
             Default is 'label'.
         post_analysis (bool, optional): Whether to conduct post-analysis and generate density plots. Default is True.
+            With post_analysis=False, matplotlib is never imported.
         figure_file_path (str, optional): The file path to save the generated density plot figure.
         colors_plot (list of str, optional): A list of colors for plotting each cluster's density distribution.
         metrics (bool, optional): Whether to compute and return internal evaluation metrics. Default is True.
+        model_file_path (str, optional): The file path to save the fitted scaler and centroids as a clustering model
+            (npz), to label new hexagons later with src.clustering_model.predict.
+        backend (str, optional): The k-means implementation. Default is 'kmeans'.
+            - 'kmeans': full-batch KMeans on the in-memory data.
+            - 'minibatch': MiniBatchKMeans on the in-memory data (much faster for millions of hexagons).
+            - 'streaming': out-of-core mini-batch k-means (see partial_fit_k_means) over chunks of chunk_size rows,
+              read from features_file_path if given (otherwise from df). Only the labels are kept in memory; the
+              silhouette score is always 'sampled'.
+        batch_size (int, optional): The number of rows of each mini-batch ('minibatch' and 'streaming'). Default is
+            4096.
+        features_file_path (str, optional): Feature store file read chunk by chunk by the 'streaming' backend. If df
+            is None, the returned DataFrame is read from it (the 'index' column, plus columns_clustering if
+            post_analysis).
+        chunk_size (int, optional): The number of rows read at a time by the 'streaming' backend. Default is 100000.
+        max_epochs (int, optional): The maximum number of passes over the data of the 'streaming' backend. Default
+            is 10.
+        tol (float, optional): The 'streaming' backend stops when the squared shift of the centroids over a pass
+            (in standardized units) is at most tol. Default is 1e-4.
+        silhouette_method (str, optional): How the silhouette score is computed. The Davies-Bouldin index and the
+            inertia always use the full data. Default is 'exact'.
+            - 'exact': sklearn silhouette_score on the full data (O(n^2) time and memory).
+            - 'chunked': the same exact score with pairwise distances computed in memory-bounded blocks.
+            - 'sampled': estimate from a sample stratified by cluster, with a confidence interval (added to the
+              metrics as 'Confidence Interval').
+        silhouette_sample_size (int, optional): The size of the sample of the 'sampled' silhouette. Default is
+            50000.
+        silhouette_random_state (int, optional): Seed of the sample of the 'sampled' silhouette. Default is 0.
+        confidence (float, optional): The confidence level of the interval of the 'sampled' silhouette. Default is
+            0.95.
+        return_diagnostics (bool, optional): Whether to also return the convergence diagnostics of the fit.
+            Default is False.
+        density_method (str, optional): The density estimate of the post-analysis plots: 'kde' (Gaussian KDE on a
+            sample of at most kde_sample_size rows per cluster) or 'histogram' (fixed bins). Default is 'kde'.
+        kde_sample_size (int, optional): The maximum number of rows of each cluster used for its KDE. Default is
+            10000.
+        show_plot (bool, optional): Whether to display the post-analysis figure (blocking). If False, the figure is
+            rendered headless and written in a background thread (see src.post_analysis_plots.wait_for_figures).
+            Default is False.
+        random_state (int, optional): Seed of the 'kmeans' and 'minibatch' models. Default is 0.
 
     Returns:
         pandas.DataFrame: A DataFrame with an additional column containing cluster labels.
         dict or None: A dictionary containing internal evaluation metrics if metrics=True, otherwise None.
+        dict: If return_diagnostics=True, the convergence diagnostics: 'backend', 'n_iter' (iterations or passes
+            over the data), 'n_steps' (mini-batch updates), 'converged', 'center_shifts' (squared shift of the
+            centroids after each pass, 'streaming' only) and 'tier' (the fitted scaler and centroids, see
+            src.clustering_model.tier_from_sklearn).
 
     Example:
         >>> data = {
@@ -47,80 +237,107 @@ def clustering_k_means(df, columns_clustering, n_clusters=3, label_column_name='
             'Inertia': 2.371
         }
     """
-    # Obtain dataframe with the variables for clustering
-    df_clustering = df[columns_clustering]
+    if backend not in CLUSTERING_BACKENDS:
+        raise ValueError(f"backend must be one of {CLUSTERING_BACKENDS}.")
+    if silhouette_method not in SILHOUETTE_METHODS:
+        raise ValueError(f"silhouette_method must be one of {SILHOUETTE_METHODS}.")
 
-    # Standardize data before clustering
-    scaler = StandardScaler()
-    df_clustering = scaler.fit_transform(df_clustering)
+    if backend == 'streaming':
+        if df is None:
+            if features_file_path is None:
+                raise ValueError("Either df or features_file_path must be provided.")
+            df = read_features(features_file_path,
+                               columns=['index'] + (list(columns_clustering) if post_analysis else []))
+        labels, tier, scores, diagnostics = _clustering_streaming(
+            df, features_file_path, columns_clustering, n_clusters, batch_size, chunk_size, max_epochs, tol, metrics,
+            silhouette_sample_size, silhouette_random_state, confidence)
+        df[label_column_name] = labels
+        diagnostics['tier'] = tier
+        if model_file_path:
+            save_model(single_tier_model(tier), model_file_path)
+    else:
+        # Obtain dataframe with the variables for clustering
+        df_clustering = df[columns_clustering]
 
-    # Perform k-means clustering for the specified number of clusters
-    clustering_kmeans = KMeans(n_clusters=n_clusters, random_state=0, n_init="auto").fit(df_clustering)
+        # Standardize data before clustering
+        scaler = StandardScaler()
+        df_clustering = scaler.fit_transform(df_clustering)
 
-    # Add cluster labels to the original dataframe
-    df[label_column_name] = list(clustering_kmeans.labels_)
+        # Perform k-means clustering for the specified number of clusters
+        if backend == 'kmeans':
+            clustering_kmeans = KMeans(n_clusters=n_clusters, random_state=random_state,
+                                       n_init="auto").fit(df_clustering)
+        else:
+            clustering_kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=random_state,
+                                                batch_size=batch_size, n_init="auto").fit(df_clustering)
 
-    if post_analysis:
-        # Plot density distribution for each variable by clustering label
+        # Add cluster labels to the original dataframe
+        df[label_column_name] = list(clustering_kmeans.labels_)
 
-        # Set up the figure and subplots
-        # Calculate the number of rows and columns based on the length of columns_clustering
-        num_plots = len(columns_clustering)
-        num_cols = min(3, num_plots)
-        num_rows = -(-num_plots // num_cols)  # Ceiling division to ensure enough rows
+        # Save the fitted scaler and centroids
+        tier = tier_from_sklearn(scaler, clustering_kmeans, columns_clustering)
+        if model_file_path:
+            save_model(single_tier_model(tier), model_file_path)
 
-        fig, axe = plt.subplots(nrows=num_rows, ncols=num_cols, figsize=(15, 5))
-        # Unpack all the axes subplots
-        axes = axe.ravel()
+        diagnostics = {
+            'backend': backend,
+            'n_iter': int(clustering_kmeans.n_iter_),
+            'n_steps': int(getattr(clustering_kmeans, 'n_steps_', clustering_kmeans.n_iter_)),
+            'converged': int(clustering_kmeans.n_iter_) < clustering_kmeans.max_iter,
+            'center_shifts': [],
+            'tier': tier,
+        }
 
+    if post_analysis:
+        # Plot density distribution for each variable by clustering label (matplotlib is only imported here)
         # Generate colors for plotting if not provided
         if colors_plot is None:
-            colors_plot = [plt.cm.jet(i / n_clusters) for i in range(n_clusters)]
+            from matplotlib import colormaps
+            colors_plot = [colormaps['jet'](i / n_clusters) for i in range(n_clusters)]
         else:
             # Check if the length of colors_plot matches the number of clusters
             if len(colors_plot) != n_clusters:
                 raise ValueError("The length of colors_plot must be the same as the number of clusters.")
 
+        plot_post_analysis(df, columns_clustering, label_column_name, colors_plot, figure_file_path=figure_file_path,
+                           density_method=density_method, kde_sample_size=kde_sample_size, show_plot=show_plot)
 
-        # Loop through the continuous variables to create plots
-        for i, var in enumerate(columns_clustering):
-            ax = axes[i]
-            for group_label in df[label_column_name].unique():
-                group_data = df[df[label_column_name] == group_label]
-                group_color = colors_plot[group_label]
-                group_data[var].plot(kind='kde', legend=True, ax=ax, label=group_label, color=group_color)
-
-            # Set title and legend for each subplot
-            ax.set_title(f'Density Plot of {var}')
-            ax.legend()
-
-        # Add overall title
-        title_plot = "Clustering post-analysis"
-        fig.suptitle(title_plot, fontsize=16)
-        # Adjust layout and save the figure if a file path is provided
-        if figure_file_path:
-            plt.tight_layout()
-            plt.savefig(figure_file_path)
-        plt.show()
-
+    score = None
     if metrics:
-        # Compute Silhouette Score (a higher score is better)
-        silhouette_avg = silhouette_score(df_clustering, df[label_column_name])
+        if backend == 'streaming':
+            silhouette, db_index, inertia = scores
+        else:
+            labels = clustering_kmeans.labels_
+
+            # Compute Silhouette Score (a higher score is better)
+            if silhouette_method == 'exact':
+                silhouette = silhouette_score(df_clustering, labels)
+            elif silhouette_method == 'chunked':
+                silhouette = chunked_silhouette_score(df_clustering, labels)
+            else:
+                silhouette = sampled_silhouette_score(df_clustering, labels, sample_size=silhouette_sample_size,
+                                                      random_state=silhouette_random_state, confidence=confidence)
 
-        # Compute Davies-Bouldin Index (lower values are better)
-        db_index = davies_bouldin_score(df_clustering, df[label_column_name])
+            # Compute Davies-Bouldin Index (lower values are better)
+            db_index = davies_bouldin_score(df_clustering, labels)
 
-        # Compute Inertia (within-cluster sum of squares) (lower values are better)
-        inertia = clustering_kmeans.inertia_
+            # Compute Inertia (within-cluster sum of squares) (lower values are better)
+            inertia = clustering_kmeans.inertia_
 
         # Create a dictionary with score information
         score = {
             'Type of Score': ['Silhouette Score', 'Davies-Bouldin Index', 'Inertia'],
             'Range of Values': ['[-1, 1]', '[0, Inf)', '[0, Inf)'],
             'Best Value': ['Higher', 'Lower', 'Lower'],
-            'Value for the Score': [silhouette_avg, db_index, inertia]
+            'Value for the Score': [silhouette, db_index, inertia]
         }
+        if isinstance(silhouette, dict):
+            # Sampled silhouette: estimate and confidence interval
+            score['Value for the Score'][0] = silhouette['Silhouette Score']
+            score['Confidence Interval'] = [(silhouette['CI Lower'], silhouette['CI Upper']), None, None]
 
+    if return_diagnostics:
+        return df, score, diagnostics
     return df, score
 
 
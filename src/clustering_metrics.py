@@ -0,0 +1,154 @@
+import numpy as np
+from statistics import NormalDist
+
+
+def silhouette_samples_chunked(features, labels, chunk_size=2048):
+    """
+    Compute the silhouette coefficient of every row with pairwise distances computed in memory-bounded blocks.
+
+    The result is the same as sklearn.metrics.silhouette_samples, but at most chunk_size x chunk_size distances
+    are held in memory at a time, instead of the full n x n distance matrix. The time is still quadratic in the
+    number of rows.
+
+    Args:
+        features (numpy.ndarray): The (standardized) points, shape (n_rows, n_columns).
+        labels (numpy.ndarray): The cluster label of each row, integers from 0 to n_clusters - 1.
+        chunk_size (int, optional): The number of rows and columns of each block of distances. Default is 2048.
+
+    Returns:
+        numpy.ndarray: The silhouette coefficient of each row (0 for the rows of clusters with a single row).
+    """
+    features = np.asarray(features, dtype=np.float64)
+    labels = np.asarray(labels)
+    n_rows = len(features)
+    n_clusters = int(labels.max()) + 1 if n_rows else 0
+    cluster_sizes = np.bincount(labels, minlength=n_clusters)
+    squared_norms = (features ** 2).sum(axis=1)
+
+    # Sum of the distances of each row to the rows of every cluster, accumulated block by block
+    distance_sums = np.zeros((n_rows, n_clusters))
+    for start_column in range(0, n_rows, chunk_size):
+        stop_column = min(start_column + chunk_size, n_rows)
+        one_hot = np.zeros((stop_column - start_column, n_clusters))
+        one_hot[np.arange(stop_column - start_column), labels[start_column:stop_column]] = 1
+        for start_row in range(0, n_rows, chunk_size):
+            stop_row = min(start_row + chunk_size, n_rows)
+            squared_distances = squared_norms[start_row:stop_row, None] \
+                + squared_norms[None, start_column:stop_column] \
+                - 2 * features[start_row:stop_row] @ features[start_column:stop_column].T
+            distance_sums[start_row:stop_row] += np.sqrt(np.maximum(squared_distances, 0)) @ one_hot
+
+    rows = np.arange(n_rows)
+    own_sizes = cluster_sizes[labels]
+    # Mean distance to the other rows of the same cluster, and to the rows of the nearest other cluster
+    with np.errstate(divide='ignore', invalid='ignore'):
+        intra = distance_sums[rows, labels] / (own_sizes - 1)
+        mean_distances = distance_sums / cluster_sizes[None, :]
+    mean_distances[rows, labels] = np.inf
+    nearest = mean_distances.min(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = (nearest - intra) / np.maximum(intra, nearest)
+    return np.where(own_sizes > 1, np.nan_to_num(values), 0.0)
+
+
+def chunked_silhouette_score(features, labels, chunk_size=2048):
+    """
+    Compute the exact mean silhouette coefficient with memory-bounded blocks of pairwise distances.
+
+    Args:
+        features (numpy.ndarray): The (standardized) points, shape (n_rows, n_columns).
+        labels (numpy.ndarray): The cluster label of each row.
+        chunk_size (int, optional): The number of rows and columns of each block of distances. Default is 2048.
+
+    Returns:
+        float: The silhouette score, equal to sklearn.metrics.silhouette_score.
+    """
+    return float(np.mean(silhouette_samples_chunked(features, labels, chunk_size=chunk_size)))
+
+
+def stratified_sample(labels, sample_size, random_state=0):
+    """
+    Draw a sample of rows stratified by cluster, with a size per cluster proportional to the size of the cluster.
+
+    Args:
+        labels (numpy.ndarray): The cluster label of each row.
+        sample_size (int): The total size of the sample (approximately, every cluster gets at least 2 rows when it
+            has them).
+        random_state (int, optional): Seed of the sample. Default is 0.
+
+    Returns:
+        numpy.ndarray: The sorted positions of the sampled rows.
+    """
+    rng = np.random.default_rng(random_state)
+    labels = np.asarray(labels)
+    cluster_sizes = np.bincount(labels)
+    allocation = np.round(sample_size * cluster_sizes / max(len(labels), 1)).astype(np.int64)
+    allocation = np.minimum(np.maximum(allocation, 2), cluster_sizes)
+    positions = [rng.choice(np.flatnonzero(labels == cluster), size=size, replace=False)
+                 for cluster, size in enumerate(allocation) if size > 0]
+    return np.sort(np.concatenate(positions)) if positions else np.array([], dtype=np.int64)
+
+
+def silhouette_from_sample(sample, sample_labels, cluster_sizes, confidence=0.95, chunk_size=2048):
+    """
+    Estimate the silhouette score from a sample stratified by cluster, with a normal confidence interval.
+
+    The silhouette coefficient of each sampled row is computed with respect to the sample. The score is the
+    stratified mean of the coefficients (each cluster weighted by its size in the full data) and its variance is the
+    stratified variance with the finite population correction.
+
+    Args:
+        sample (numpy.ndarray): The (standardized) sampled points, shape (sample_size, n_columns).
+        sample_labels (numpy.ndarray): The cluster label of each sampled point.
+        cluster_sizes (numpy.ndarray): The number of rows of each cluster in the full data.
+        confidence (float, optional): The confidence level of the interval. Default is 0.95.
+        chunk_size (int, optional): The number of rows and columns of each block of distances. Default is 2048.
+
+    Returns:
+        dict: The estimate ('Silhouette Score'), the bounds of the confidence interval ('CI Lower', 'CI Upper'),
+            the confidence level and the sample size.
+    """
+    sample_labels = np.asarray(sample_labels)
+    cluster_sizes = np.asarray(cluster_sizes, dtype=np.float64)
+    values = silhouette_samples_chunked(sample, sample_labels, chunk_size=chunk_size)
+
+    weights = cluster_sizes / cluster_sizes.sum()
+    estimate, variance = 0.0, 0.0
+    for cluster, weight in enumerate(weights):
+        cluster_values = values[sample_labels == cluster]
+        n_sampled = len(cluster_values)
+        if n_sampled == 0:
+            continue
+        estimate += weight * cluster_values.mean()
+        if n_sampled > 1:
+            finite_population_correction = 1 - n_sampled / cluster_sizes[cluster]
+            variance += weight ** 2 * cluster_values.var(ddof=1) / n_sampled * finite_population_correction
+    half_width = NormalDist().inv_cdf(0.5 + confidence / 2) * np.sqrt(variance)
+    return {'Silhouette Score': float(estimate), 'CI Lower': float(estimate - half_width),
+            'CI Upper': float(estimate + half_width), 'Confidence': confidence, 'Sample Size': len(values)}
+
+
+def sampled_silhouette_score(features, labels, sample_size=10000, random_state=0, confidence=0.95, chunk_size=2048):
+    """
+    Estimate the silhouette score of a large data set from a sample stratified by cluster.
+
+    Args:
+        features (numpy.ndarray): The (standardized) points, shape (n_rows, n_columns).
+        labels (numpy.ndarray): The cluster label of each row.
+        sample_size (int, optional): The size of the sample. Default is 10000.
+        random_state (int, optional): Seed of the sample. Default is 0.
+        confidence (float, optional): The confidence level of the interval. Default is 0.95.
+        chunk_size (int, optional): The number of rows and columns of each block of distances. Default is 2048.
+
+    Returns:
+        dict: See silhouette_from_sample.
+
+    Example:
+        >>> sampled_silhouette_score(df_clustering, labels, sample_size=20000)
+        {'Silhouette Score': 0.412, 'CI Lower': 0.409, 'CI Upper': 0.415, 'Confidence': 0.95, 'Sample Size': 20000}
+    """
+    features = np.asarray(features)
+    labels = np.asarray(labels)
+    positions = stratified_sample(labels, sample_size, random_state=random_state)
+    return silhouette_from_sample(features[positions], labels[positions], np.bincount(labels),
+                                  confidence=confidence, chunk_size=chunk_size)
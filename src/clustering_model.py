@@ -0,0 +1,252 @@
+import json
+import numpy as np
+import pandas as pd
+from src.h3_index import as_uint64_cells, hash_join_indexer
+
+# A clustering model is a dict of plain NumPy arrays, so labels can be assigned without importing sklearn:
+#     {'columns': list of str (columns of the feature matrix),
+#      'tiers': {'first_step': tier, <first-step label>: tier, ...},
+#      'offsets': {<first-step label>: first final label of the tier, ...} (empty for a single k-means)}
+# where each tier is {'columns': list of str, 'mean': (n_columns,), 'scale': (n_columns,),
+# 'centroids': (n_clusters, n_columns) in standardized units, 'counts': (n_clusters,) points per centroid}.
+FIRST_STEP = 'first_step'
+
+
+def tier_from_sklearn(scaler, kmeans, columns):
+    """
+    Extract the parameters of a fitted StandardScaler and KMeans pair as NumPy arrays.
+
+    Args:
+        scaler (sklearn.preprocessing.StandardScaler): The fitted scaler.
+        kmeans (sklearn.cluster.KMeans): The k-means model fitted on the standardized features.
+        columns (list of str): Columns the models were fitted on, in order.
+
+    Returns:
+        dict: The tier, with its columns, means, scales, centroids and number of points per centroid.
+    """
+    return {
+        'columns': list(columns),
+        'mean': np.asarray(scaler.mean_, dtype=np.float64),
+        'scale': np.asarray(scaler.scale_, dtype=np.float64),
+        'centroids': np.asarray(kmeans.cluster_centers_, dtype=np.float64),
+        'counts': np.bincount(kmeans.labels_, minlength=kmeans.n_clusters).astype(np.int64),
+    }
+
+
+def single_tier_model(tier):
+    """
+    Build the model of a single k-means clustering (e.g. the one of clustering_k_means).
+
+    Args:
+        tier (dict): The tier returned by tier_from_sklearn.
+
+    Returns:
+        dict: The model; its labels are the k-means labels.
+    """
+    return {'columns': list(tier['columns']), 'tiers': {FIRST_STEP: tier}, 'offsets': {}}
+
+
+def save_model(model, file_path):
+    """
+    Save a clustering model as a compact npz file (the arrays of every tier and a JSON header).
+
+    Args:
+        model (dict): The clustering model.
+        file_path (str): Path of the npz file to write.
+
+    Returns:
+        str: The path of the written file.
+
+    Example:
+        >>> save_model(clusterer.to_model(), '../../outputs/01_weighted_interpolation/data/UK_clustering_model_h8.npz')
+    """
+    header = {
+        'columns': model['columns'],
+        'tiers': {str(key): tier['columns'] for key, tier in model['tiers'].items()},
+        'offsets': {str(key): int(offset) for key, offset in model['offsets'].items()},
+    }
+    arrays = {'header': np.array(json.dumps(header))}
+    for key, tier in model['tiers'].items():
+        for name in ('mean', 'scale', 'centroids', 'counts'):
+            arrays[f'{key}/{name}'] = tier[name]
+    with open(file_path, 'wb') as file:
+        np.savez_compressed(file, **arrays)
+    return file_path
+
+
+def _parse_key(key):
+    return key if key == FIRST_STEP else int(key)
+
+
+def load_model(file_path):
+    """
+    Load a clustering model saved by save_model.
+
+    Args:
+        file_path (str): Path of the npz file.
+
+    Returns:
+        dict: The clustering model.
+    """
+    with np.load(file_path) as arrays:
+        header = json.loads(str(arrays['header']))
+        tiers = {_parse_key(key): {'columns': columns,
+                                   **{name: arrays[f'{key}/{name}'] for name in ('mean', 'scale', 'centroids',
+                                                                                 'counts')}}
+                 for key, columns in header['tiers'].items()}
+    offsets = {_parse_key(key): offset for key, offset in header['offsets'].items()}
+    return {'columns': header['columns'], 'tiers': tiers, 'offsets': offsets}
+
+
+def nearest_centroid(features, centroids, block_size=100000):
+    """
+    Index of the nearest centroid (Euclidean distance) of each row, computed by blocks of rows.
+
+    Args:
+        features (numpy.ndarray): The points, shape (n_rows, n_columns).
+        centroids (numpy.ndarray): The centroids, shape (n_clusters, n_columns).
+        block_size (int, optional): Number of rows processed at a time, bounds the size of the distance matrix.
+            Default is 100000.
+
+    Returns:
+        numpy.ndarray: The index of the nearest centroid of each row.
+    """
+    labels = np.empty(len(features), dtype=np.int64)
+    # |x - c|^2 = |x|^2 - 2 x.c + |c|^2, and |x|^2 does not change the argmin
+    centroids_norm = (centroids ** 2).sum(axis=1)
+    for start in range(0, len(features), block_size):
+        block = features[start:start + block_size]
+        labels[start:start + block_size] = np.argmin(centroids_norm - 2 * block @ centroids.T, axis=1)
+    return labels
+
+
+def _standardize(tier, features):
+    return (features - tier['mean']) / tier['scale']
+
+
+def feature_matrix(model, data, features=None, index_column='index'):
+    """
+    Build the feature matrix of a model from hexagon features or hexagon ids.
+
+    Args:
+        model (dict): The clustering model.
+        data (pandas.DataFrame, numpy.ndarray or array-like of H3 ids): A DataFrame with the columns of the model,
+            a 2D matrix with the columns of the model in order, or a 1D array of H3 ids (strings or uint64) looked up
+            in features.
+        features (pandas.DataFrame, optional): Features of the hexagons with the H3 index column, needed when data
+            contains H3 ids (e.g. a table read with read_features).
+        index_column (str, optional): Column with the H3 index in features. Default is 'index'.
+
+    Returns:
+        numpy.ndarray: The feature matrix (float64), with a row of NaN for H3 ids missing from features.
+    """
+    if isinstance(data, pd.DataFrame):
+        return data[model['columns']].to_numpy(dtype=np.float64)
+    data = np.asarray(data)
+    if data.ndim == 2:
+        if data.shape[1] != len(model['columns']):
+            raise ValueError(f"The feature matrix must have {len(model['columns'])} columns: {model['columns']}")
+        return data.astype(np.float64, copy=False)
+    if features is None:
+        raise ValueError("features must be provided to predict from H3 ids.")
+    rows = hash_join_indexer(as_uint64_cells(data), as_uint64_cells(features[index_column].to_numpy()))
+    matrix = features[model['columns']].to_numpy(dtype=np.float64)[np.maximum(rows, 0)]
+    matrix[rows < 0] = np.nan
+    return matrix
+
+
+def _tier_labels(model, matrix):
+    # First-step label and label within the tier of every row (-1 for rows with missing values)
+    columns = model['columns']
+    valid = ~np.isnan(matrix).any(axis=1)
+    labels_first_step = np.full(len(matrix), -1, dtype=np.int64)
+    labels_tier = np.full(len(matrix), -1, dtype=np.int64)
+
+    tier = model['tiers'][FIRST_STEP]
+    positions = [columns.index(column) for column in tier['columns']]
+    rows = np.flatnonzero(valid)
+    labels_first_step[rows] = nearest_centroid(_standardize(tier, matrix[np.ix_(rows, positions)]),
+                                               tier['centroids'])
+    for key, tier in model['tiers'].items():
+        if key == FIRST_STEP:
+            continue
+        positions = [columns.index(column) for column in tier['columns']]
+        rows = np.flatnonzero(labels_first_step == key)
+        labels_tier[rows] = nearest_centroid(_standardize(tier, matrix[np.ix_(rows, positions)]),
+                                             tier['centroids'])
+    return labels_first_step, labels_tier
+
+
+def _final_labels(model, labels_first_step, labels_tier):
+    if not model['offsets']:
+        return labels_first_step
+    offsets = np.array([model['offsets'][key] for key in range(len(model['offsets']))])
+    labels = np.where(labels_first_step >= 0, offsets[labels_first_step], -1)
+    return np.where(labels_tier >= 0, labels + labels_tier, labels)
+
+
+def predict(model, data, features=None, index_column='index'):
+    """
+    Assign the final label of hexagons by nearest centroid in pure NumPy (no sklearn import).
+
+    Args:
+        model (dict): The clustering model (e.g. returned by load_model).
+        data (pandas.DataFrame, numpy.ndarray or array-like of H3 ids): See feature_matrix.
+        features (pandas.DataFrame, optional): Features of the hexagons, needed when data contains H3 ids.
+        index_column (str, optional): Column with the H3 index in features. Default is 'index'.
+
+    Returns:
+        numpy.ndarray: The final label of each row or H3 id (-1 if a feature is missing).
+
+    Example:
+        >>> model = load_model('../../outputs/01_weighted_interpolation/data/UK_clustering_model_h8.npz')
+        >>> predict(model, ['88195a2453fffff', '88194e4151fffff'], features=uk_hex_total)
+        array([3, 2])
+    """
+    matrix = feature_matrix(model, data, features=features, index_column=index_column)
+    return _final_labels(model, *_tier_labels(model, matrix))
+
+
+def _update_tier(tier, features_scaled, labels):
+    # Online k-means update: each centroid moves to the mean of all the points it has been assigned so far
+    n_clusters = len(tier['centroids'])
+    batch_counts = np.bincount(labels, minlength=n_clusters)
+    batch_sums = np.zeros_like(tier['centroids'])
+    np.add.at(batch_sums, labels, features_scaled)
+    counts = tier['counts'] + batch_counts
+    updated = batch_counts > 0
+    tier['centroids'][updated] += (batch_sums[updated] - batch_counts[updated, None] * tier['centroids'][updated]) \
+        / counts[updated, None]
+    tier['counts'] = counts
+
+
+def update_model(model, data, features=None, index_column='index'):
+    """
+    Incrementally update the centroids of every tier with new (or refreshed) hexagons, without re-clustering.
+
+    Each hexagon is assigned to its nearest centroid, then each centroid moves to the running mean of all the points
+    assigned to it (the update of online k-means). The standardization of each tier is kept fixed. The model is
+    updated in place.
+
+    Args:
+        model (dict): The clustering model.
+        data (pandas.DataFrame, numpy.ndarray or array-like of H3 ids): See feature_matrix.
+        features (pandas.DataFrame, optional): Features of the hexagons, needed when data contains H3 ids.
+        index_column (str, optional): Column with the H3 index in features. Default is 'index'.
+
+    Returns:
+        numpy.ndarray: The final label of each row or H3 id before the update (-1 if a feature is missing).
+    """
+    matrix = feature_matrix(model, data, features=features, index_column=index_column)
+    labels_first_step, labels_tier = _tier_labels(model, matrix)
+    columns = model['columns']
+    for key, tier in model['tiers'].items():
+        positions = [columns.index(column) for column in tier['columns']]
+        if key == FIRST_STEP:
+            labels = labels_first_step
+            rows = np.flatnonzero(labels_first_step >= 0)
+        else:
+            labels = labels_tier
+            rows = np.flatnonzero(labels_first_step == key)
+        _update_tier(tier, _standardize(tier, matrix[np.ix_(rows, positions)]), labels[rows])
+    return _final_labels(model, labels_first_step, labels_tier)
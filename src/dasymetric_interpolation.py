@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from src.h3_index import as_uint64_cells, cell_areas, hash_join_indexer, merge_on_h3
+from src.h3_interpolation import DEFAULT_PROJECTED_CRS, h3_area_weights
+
+
+def dasymetric_shares(weights, residential_area):
+    """
+    Share of the count of each source allocated to each hexagon, in proportion to its residential area.
+
+    The residential area of a hexagon is assumed to be spread uniformly over the hexagon, so the residential area of
+    the part of a hexagon inside a source is residential_area * area(hexagon & source) / area(hexagon). Sources
+    without any residential area are allocated in proportion to the area of the intersections (uniform
+    interpolation).
+
+    Args:
+        weights (dict): The area weights of the sources (see src.h3_interpolation.h3_area_weights).
+        residential_area (numpy.ndarray): The residential area of each hexagon of weights['hex_ids'].
+
+    Returns:
+        scipy.sparse.csr_matrix: The shares, shape (n_hexagons, n_sources); every column sums to 1 (or 0 for sources
+            outside the hexagons).
+    """
+    matrix = weights['matrix'].tocsr()
+    hex_areas = cell_areas(weights['hex_ids'], unit='km^2')
+    # Residential area of the part of each hexagon inside each source
+    residential = sparse.diags(np.asarray(residential_area, dtype=np.float64) / hex_areas) @ matrix
+
+    residential_totals = np.asarray(residential.sum(axis=0)).ravel()
+    area_totals = np.asarray(matrix.sum(axis=0)).ravel()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        residential_scale = np.where(residential_totals > 0, 1 / residential_totals, 0)
+        area_scale = np.where((residential_totals == 0) & (area_totals > 0), 1 / area_totals, 0)
+    return (residential @ sparse.diags(residential_scale) + matrix @ sparse.diags(area_scale)).tocsr()
+
+
+def dasymetric_interpolate(source_df, count_columns, landuse_df, resolution, residential_column='area_residential',
+                           index_column='index', chunk_size=5000, projected_crs=DEFAULT_PROJECTED_CRS, n_jobs=1,
+                           cache_directory=None):
+    """
+    Allocate the counts of source polygons (e.g. census output areas) to H3 hexagons in proportion to their
+    residential area (dasymetric interpolation).
+
+    The sources are processed in chunks of chunk_size polygons, so that only the area weights of one chunk are in
+    memory at a time (e.g. at resolution 9). The counts of the hexagons shared by several chunks are summed in the
+    order of the hexagon ids, so the result does not depend on chunk_size.
+
+    Args:
+        source_df (geopandas.GeoDataFrame): The source polygons with their counts (e.g. number of people).
+        count_columns (list of str): The count (extensive) variables to allocate.
+        landuse_df (pandas.DataFrame): The landuse features of the hexagons at the same resolution, with the H3 index
+            and the residential area (e.g. read from the landuse features of the feature store).
+        resolution (int): The resolution of the H3 cells.
+        residential_column (str, optional): The column of the residential area. Default is 'area_residential'.
+        index_column (str, optional): The column of the H3 index in landuse_df. Default is 'index'.
+        chunk_size (int, optional): The number of sources processed at a time. Default is 5000.
+        projected_crs (str, optional): The CRS used to clip the boundary cells. Default is 'EPSG:27700'.
+        n_jobs (int, optional): The number of worker processes used to build the area weights. Default is 1.
+        cache_directory (str, optional): Directory of the cached area weights of each chunk. Default is None.
+
+    Returns:
+        pandas.DataFrame: One row per hexagon with the H3 'index' (uint64) and the allocated counts.
+
+    Example:
+        >>> landuse_uk_hex = read_features('../../../data/filter/landuse_features_h8_uk.parquet',
+        ...                                columns=['index', 'area_residential'])
+        >>> df_census_hex = dasymetric_interpolate(gdf_output_areas, ['total_population'], landuse_uk_hex, 8)
+    """
+    count_columns = list(count_columns)
+    landuse_keys = as_uint64_cells(landuse_df[index_column].to_numpy())
+    landuse_residential = landuse_df[residential_column].to_numpy(dtype=np.float64)
+
+    hex_ids, counts = [], []
+    for start in range(0, len(source_df), chunk_size):
+        source_chunk = source_df.iloc[start:start + chunk_size]
+        weights = h3_area_weights(source_chunk, resolution, projected_crs=projected_crs,
+                                  cache_directory=cache_directory, n_jobs=n_jobs)
+        # Residential area of the hexagons of the chunk (0 for hexagons without landuse features)
+        rows = hash_join_indexer(weights['hex_ids'], landuse_keys)
+        residential_area = np.where(rows >= 0, np.nan_to_num(landuse_residential[np.maximum(rows, 0)]), 0)
+        shares = dasymetric_shares(weights, residential_area)
+        hex_ids.append(weights['hex_ids'])
+        counts.append(shares @ np.nan_to_num(source_chunk[count_columns].to_numpy(dtype=np.float64)))
+
+    if not hex_ids:
+        return pd.DataFrame({'index': np.array([], dtype=np.uint64), **{column: [] for column in count_columns}})
+    # Sum the counts of the hexagons shared by several chunks
+    unique_ids, positions = np.unique(np.concatenate(hex_ids), return_inverse=True)
+    totals = np.zeros((len(unique_ids), len(count_columns)))
+    np.add.at(totals, positions, np.concatenate(counts))
+    df_hex = pd.DataFrame(totals, columns=count_columns)
+    df_hex.insert(0, 'index', unique_ids)
+    return df_hex
+
+
+def validate_interpolation(estimated, reference, columns, reference_columns=None, index_column='index'):
+    """
+    Compare interpolated hexagon values with reference values (e.g. the existing resolution 8 census features) on
+    the hexagons present in both.
+
+    Args:
+        estimated (pandas.DataFrame): The interpolated values, with the H3 index.
+        reference (pandas.DataFrame): The reference values, with the H3 index.
+        columns (list of str): The columns of estimated to compare.
+        reference_columns (list of str, optional): The matching columns of reference. Default is columns.
+        index_column (str, optional): The column of the H3 index in both DataFrames. Default is 'index'.
+
+    Returns:
+        pandas.DataFrame: One row per column with the number of hexagons compared, the totals and their relative
+            difference, the mean absolute error, the root mean squared error, the largest absolute difference and
+            the correlation.
+
+    Example:
+        >>> validate_interpolation(df_census_hex, weighted_census_hex, ['total_population'], ['total'])
+    """
+    reference_columns = list(reference_columns or columns)
+    estimated = estimated[[index_column] + list(columns)]
+    reference = reference[[index_column] + reference_columns] \
+        .rename(columns=dict(zip(reference_columns, [f'{column}_reference' for column in columns])))
+    merged = merge_on_h3(estimated, reference, on=index_column, how='inner')
+
+    results = []
+    for column in columns:
+        values = merged[column].to_numpy(dtype=np.float64)
+        reference_values = merged[f'{column}_reference'].to_numpy(dtype=np.float64)
+        differences = values - reference_values
+        results.append({
+            'Variable': column,
+            'Hexagons': len(merged),
+            'Total': values.sum(),
+            'Reference Total': reference_values.sum(),
+            'Relative Total Difference': (values.sum() - reference_values.sum()) / reference_values.sum()
+            if reference_values.sum() else np.nan,
+            'MAE': np.abs(differences).mean() if len(merged) else np.nan,
+            'RMSE': np.sqrt((differences ** 2).mean()) if len(merged) else np.nan,
+            'Max Abs Difference': np.abs(differences).max() if len(merged) else np.nan,
+            'Correlation': np.corrcoef(values, reference_values)[0, 1] if len(merged) > 1 else np.nan,
+        })
+    return pd.DataFrame(results)
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+from src.feature_store import read_features
+from src.h3_index import as_uint64_cells, cell_resolution, cell_to_parent, hash_join_indexer
+
+
+def read_test_set(file_path='data/test/test_set.csv'):
+    """
+    Read the manually labelled test hexagons.
+
+    Args:
+        file_path (str, optional): Path to the semicolon-separated file with the 'hex_id' and 'class' of each
+            hexagon. Default is 'data/test/test_set.csv'.
+
+    Returns:
+        pandas.DataFrame: The H3 'index' (uint64) and the 'class' of each test hexagon.
+    """
+    # utf-8-sig drops the byte order mark at the start of the file
+    df_test = pd.read_csv(file_path, sep=';', encoding='utf-8-sig', dtype={'hex_id': str})
+    return pd.DataFrame({'index': as_uint64_cells(df_test['hex_id'].to_numpy()),
+                         'class': df_test['class'].to_numpy(dtype=np.int64)})
+
+
+def lookup_labels(test_cells, cells, labels):
+    """
+    Get the label of the hexagon of the clustering output containing each test hexagon, with an indexed lookup.
+
+    When the clustering output is at a coarser resolution than the test hexagons (e.g. resolution 7 for the uniform
+    pipeline and 8 for the test set), the test hexagons are mapped to their parent cells.
+
+    Args:
+        test_cells (array-like): The H3 ids of the test hexagons.
+        cells (array-like): The H3 ids of the clustering output, all at the same resolution.
+        labels (array-like): The label of each hexagon of the clustering output.
+
+    Returns:
+        numpy.ndarray: The label of each test hexagon, -1 if it is not in the clustering output.
+    """
+    test_cells, cells = as_uint64_cells(test_cells), as_uint64_cells(cells)
+    if len(cells) and len(test_cells):
+        resolution = int(cell_resolution(cells[:1])[0])
+        if (cell_resolution(test_cells) > resolution).any():
+            test_cells = cell_to_parent(test_cells, resolution)
+    positions = hash_join_indexer(test_cells, cells)
+    return np.where(positions >= 0, np.asarray(labels, dtype=np.int64)[np.maximum(positions, 0)], -1)
+
+
+def classification_metrics(true_labels, predicted_labels, n_classes=None):
+    """
+    Compute the accuracy, the confusion matrix and the F1 score of each class of a set of predicted labels.
+
+    Hexagons without a prediction (label -1) count as errors in the accuracy and the recall.
+
+    Args:
+        true_labels (array-like): The true class of each hexagon (0 to n_classes - 1).
+        predicted_labels (array-like): The predicted label of each hexagon, -1 if missing.
+        n_classes (int, optional): The number of classes. Default is the largest label plus one.
+
+    Returns:
+        dict: 'Accuracy', 'Macro F1', 'Coverage' (share of hexagons with a prediction), 'Confusion Matrix'
+            (pandas.DataFrame, true classes in rows and predicted labels in columns) and 'Per Class'
+            (pandas.DataFrame with the precision, recall, F1 score and support of each class).
+
+    Example:
+        >>> classification_metrics(df_test['class'], lookup_labels(df_test['index'], uk_hex_total['index'],
+        ...                                                        uk_hex_total['label_6_tier']))['Accuracy']
+    """
+    true_labels = np.asarray(true_labels, dtype=np.int64)
+    predicted_labels = np.asarray(predicted_labels, dtype=np.int64)
+    if n_classes is None:
+        n_classes = int(max(true_labels.max(initial=-1), predicted_labels.max(initial=-1))) + 1
+    covered = predicted_labels >= 0
+    confusion = np.bincount(true_labels[covered] * n_classes + predicted_labels[covered],
+                            minlength=n_classes * n_classes).reshape(n_classes, n_classes)
+
+    true_positives = np.diag(confusion).astype(np.float64)
+    support = np.bincount(true_labels, minlength=n_classes)
+    predicted = confusion.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(predicted > 0, true_positives / predicted, 0)
+        recall = np.where(support > 0, true_positives / support, 0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0)
+
+    return {
+        'Accuracy': true_positives.sum() / len(true_labels) if len(true_labels) else np.nan,
+        'Macro F1': f1[support > 0].mean() if (support > 0).any() else np.nan,
+        'Coverage': covered.mean() if len(true_labels) else np.nan,
+        'Confusion Matrix': pd.DataFrame(confusion, index=pd.Index(range(n_classes), name='class'),
+                                         columns=pd.Index(range(n_classes), name='predicted')),
+        'Per Class': pd.DataFrame({'Precision': precision, 'Recall': recall, 'F1': f1, 'Support': support},
+                                  index=pd.Index(range(n_classes), name='class')),
+    }
+
+
+def evaluate_clustering(outputs, test_file_path='data/test/test_set.csv', label_column='label_6_tier',
+                        n_classes=6):
+    """
+    Evaluate the final labels of one or several clustering outputs (e.g. the weighted and uniform variants) against
+    the manually labelled test hexagons.
+
+    Only the H3 index and the label column of each output are read from the feature store, and the test hexagons
+    are looked up in them by H3 id (mapped to their parents when the output is at a coarser resolution), so the
+    evaluation is fast enough to run after every clustering.
+
+    Args:
+        outputs (dict): The clustering output of each variant, as the path of its feature store file or as a
+            DataFrame, keyed by variant name (e.g. {'weighted': ..., 'uniform': ...}).
+        test_file_path (str, optional): Path to the test set. Default is 'data/test/test_set.csv'.
+        label_column (str, optional): The column of the final labels. Default is 'label_6_tier'.
+        n_classes (int, optional): The number of classes. Default is 6.
+
+    Returns:
+        pandas.DataFrame: The accuracy, macro F1, coverage and F1 score of each class of each variant (one row per
+            variant).
+        dict: The metrics of each variant (see classification_metrics), with the confusion matrices.
+
+    Example:
+        >>> summary, details = evaluate_clustering(
+        ...     {'weighted': 'outputs/01_weighted_interpolation/data/UK_clustering_labels_h8.parquet',
+        ...      'uniform': 'outputs/02_uniform_interpolation/data/UK_clustering_labels_h7.parquet'})
+    """
+    df_test = read_test_set(test_file_path)
+    details = {}
+    for variant, output in outputs.items():
+        if isinstance(output, str):
+            output = read_features(output, columns=['index', label_column])
+        predicted_labels = lookup_labels(df_test['index'], output['index'], output[label_column])
+        details[variant] = classification_metrics(df_test['class'], predicted_labels, n_classes=n_classes)
+
+    summary = pd.DataFrame([{'Variant': variant, 'Accuracy': metrics['Accuracy'], 'Macro F1': metrics['Macro F1'],
+                             'Coverage': metrics['Coverage'],
+                             **{f'F1 class {label}': f1 for label, f1 in metrics['Per Class']['F1'].items()}}
+                            for variant, metrics in details.items()])
+    return summary, details
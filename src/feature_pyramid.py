@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+from src.feature_store import _is_geometry_column, write_features
+from src.h3_index import as_uint64_cells, cell_areas, cell_resolution, cell_to_parent
+from src.hex_geometry import hex_ids_to_geoseries
+
+# Features summed over the children of a cell (counts, lengths and areas)
+EXTENSIVE_FEATURES = ['total', 'length_residential', 'length_tertiary', 'area_commercial', 'area_industrial',
+                      'area_residential', 'area_retail']
+# Features averaged over the children of a cell, weighted by their area (densities and averages)
+INTENSIVE_FEATURES = ['population_density', 'avg_age', 'avg_household_size']
+
+
+def rollup_features(df, resolution, extensive_columns=None, intensive_columns=None, index_column='index',
+                    weight_columns=None):
+    """
+    Aggregate the features of H3 cells to their parent cells at a coarser resolution.
+
+    The parent of every cell is computed with bit operations on the uint64 ids and the cells are grouped with a
+    single np.unique, so the sums of all the columns are computed at once with np.bincount. Extensive variables
+    (e.g. road length, landuse area) are summed; intensive variables (e.g. population density, average age) are
+    averaged weighted by the area of the children, ignoring the children where they are missing. A parent only
+    covers the children present in df (e.g. at the coast), and its mean is taken over them.
+
+    Args:
+        df (pandas.DataFrame): The features, one row per cell, all the cells at the same resolution.
+        resolution (int): The resolution of the parent cells.
+        extensive_columns (list of str, optional): The columns to sum. Default is the columns of
+            EXTENSIVE_FEATURES present in df.
+        intensive_columns (list of str, optional): The columns to average. Default is the columns of
+            INTENSIVE_FEATURES present in df.
+        index_column (str, optional): The column of the H3 index (uint64 or strings). Default is 'index'.
+        weight_columns (dict, optional): The column with the weight of each cell for each intensive column (e.g.
+            the area of the children where the variable is known, to aggregate an aggregated level again). Default
+            is None (the area of the cells in km^2 for all of them).
+
+    Returns:
+        pandas.DataFrame: One row per parent cell, sorted by id, with the H3 'index' (uint64) and the aggregated
+            features. With weight_columns, the weight columns hold the summed weights of the children where the
+            variable is known.
+
+    Example:
+        >>> uk_hex_h7 = rollup_features(uk_hex_total, 7)
+    """
+    extensive_columns = [column for column in EXTENSIVE_FEATURES if column in df.columns] \
+        if extensive_columns is None else list(extensive_columns)
+    intensive_columns = [column for column in INTENSIVE_FEATURES if column in df.columns] \
+        if intensive_columns is None else list(intensive_columns)
+
+    cells = as_uint64_cells(df[index_column].to_numpy())
+    parents, positions = np.unique(cell_to_parent(cells, resolution), return_inverse=True)
+
+    df_parent = pd.DataFrame({index_column: parents})
+    if extensive_columns:
+        values = np.nan_to_num(df[extensive_columns].to_numpy(dtype=np.float64))
+        sums = np.stack([np.bincount(positions, weights=column, minlength=len(parents)) for column in values.T], 1)
+        df_parent[extensive_columns] = sums
+    if intensive_columns:
+        values = df[intensive_columns].to_numpy(dtype=np.float64)
+        if weight_columns is None:
+            weights = np.repeat(cell_areas(cells)[:, None], len(intensive_columns), axis=1)
+        else:
+            weights = df[[weight_columns[column] for column in intensive_columns]].to_numpy(dtype=np.float64)
+        # Children where a variable is missing do not weigh in its mean
+        weights = np.where(np.isnan(values), 0, weights)
+        weighted_sums = np.stack([np.bincount(positions, weights=column, minlength=len(parents))
+                                  for column in (np.nan_to_num(values) * weights).T], 1)
+        weight_sums = np.stack([np.bincount(positions, weights=column, minlength=len(parents))
+                                for column in weights.T], 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            df_parent[intensive_columns] = np.where(weight_sums > 0, weighted_sums / weight_sums, np.nan)
+        if weight_columns is not None:
+            df_parent[[weight_columns[column] for column in intensive_columns]] = weight_sums
+    return df_parent
+
+
+def build_feature_pyramid(df, resolutions, extensive_columns=None, intensive_columns=None, index_column='index',
+                          file_path_template=None):
+    """
+    Derive the features at coarser resolutions from the features extracted once at the finest resolution.
+
+    Each level is aggregated from the previous (finer) one with rollup_features, carrying the area of the children
+    where each intensive variable is known, so that the area-weighted means are the same as if they were computed
+    directly from the finest resolution. The geometry columns of df (e.g. 'geojson') are rebuilt with the polygons
+    of the parent cells. With file_path_template, each level is written to the feature store, so that the
+    clustering can start at any resolution without re-extracting the data.
+
+    Args:
+        df (pandas.DataFrame): The features at the finest resolution, one row per cell (e.g. the merged features of
+            the resolution 8 hexagons).
+        resolutions (list of int): The coarser resolutions to build.
+        extensive_columns (list of str, optional): The columns to sum. Default is the columns of
+            EXTENSIVE_FEATURES present in df.
+        intensive_columns (list of str, optional): The columns to average weighted by area. Default is the columns
+            of INTENSIVE_FEATURES present in df.
+        index_column (str, optional): The column of the H3 index (uint64 or strings). Default is 'index'.
+        file_path_template (str, optional): Path of the Parquet file of each level, formatted with its resolution
+            (e.g. '../../../data/filter/UK_weighted_merged_features_h{resolution}_uk.parquet'). Default is None
+            (the levels are not written).
+
+    Returns:
+        dict: The features of each resolution of resolutions (pandas.DataFrame), keyed by resolution.
+
+    Example:
+        >>> pyramid = build_feature_pyramid(uk_hex_total, [7, 6, 5], file_path_template=
+        ...                                 '../../../data/filter/UK_weighted_merged_features_h{resolution}_uk.parquet')
+    """
+    extensive_columns = [column for column in EXTENSIVE_FEATURES if column in df.columns] \
+        if extensive_columns is None else list(extensive_columns)
+    intensive_columns = [column for column in INTENSIVE_FEATURES if column in df.columns] \
+        if intensive_columns is None else list(intensive_columns)
+    geometry_columns = [column for column in df.columns if _is_geometry_column(df[column])]
+
+    cells = as_uint64_cells(df[index_column].to_numpy())
+    finest_resolutions = np.unique(cell_resolution(cells))
+    if len(finest_resolutions) > 1:
+        raise ValueError("All the cells must have the same resolution.")
+    if len(finest_resolutions) and (np.asarray(resolutions) > finest_resolutions[0]).any():
+        raise ValueError("The resolutions of the pyramid must be coarser than the resolution of the cells.")
+
+    level = df[extensive_columns + intensive_columns].copy()
+    level.insert(0, index_column, cells)
+    weight_columns = {column: f'_area_{column}' for column in intensive_columns}
+    areas = cell_areas(cells)
+    for weight_column in weight_columns.values():
+        level[weight_column] = areas
+
+    pyramid = {}
+    # From the finest to the coarsest level, each one aggregated from the previous one
+    for resolution in sorted(resolutions, reverse=True):
+        level = rollup_features(level, resolution, extensive_columns, intensive_columns, index_column=index_column,
+                                weight_columns=weight_columns)
+        df_level = level.drop(columns=list(weight_columns.values()))
+        for column in geometry_columns:
+            df_level[column] = hex_ids_to_geoseries(df_level[index_column], index=df_level.index)
+        if file_path_template is not None:
+            write_features(df_level, file_path_template.format(resolution=resolution), index_column=index_column)
+        pyramid[resolution] = df_level
+    return pyramid
@@ -0,0 +1,186 @@
+import os
+import json
+import pickle
+import geopandas as gpd
+import pyarrow.parquet as pq
+from shapely.geometry.base import BaseGeometry
+from src.h3_index import as_uint64_cells, uint64_to_h3
+
+
+def _is_geometry_column(series):
+    # Object columns of shapely geometries (e.g. 'geojson') are stored as WKB geometry columns
+    if isinstance(series.dtype, gpd.array.GeometryDtype):
+        return True
+    if series.dtype != object:
+        return False
+    first_valid = series.first_valid_index()
+    return first_valid is not None and isinstance(series[first_valid], BaseGeometry)
+
+
+def read_pickle(file_name):
+    """
+    Read the first object stored in a pickle file.
+
+    Args:
+        file_name (str): Path to the pickle file.
+
+    Returns:
+        object: The first object of the file (the DataFrame written by to_pickle in the previous stages).
+    """
+    with open(file_name, 'rb') as openfile:
+        return pickle.load(openfile)
+
+
+def write_features(df, file_path, index_column='index', crs='EPSG:4326'):
+    """
+    Write a stage of the pipeline to the feature store as a (Geo)Parquet file keyed by the H3 index.
+
+    The H3 index is stored in its uint64 form rather than as 15-character strings. Geometry columns (including
+    object columns of shapely geometries such as 'geojson') are stored as WKB following the GeoParquet
+    specification, so they do not have to be unpickled.
+
+    Args:
+        df (pandas.DataFrame or geopandas.GeoDataFrame): The features of the stage, one row per hexagon.
+        file_path (str): Path of the Parquet file to write.
+        index_column (str, optional): Column with the H3 index of each hexagon. Default is 'index'.
+        crs (str, optional): CRS assigned to the geometry columns if they do not have one. Default is 'EPSG:4326'.
+
+    Returns:
+        str: The path of the written file.
+
+    Example:
+        >>> write_features(landuse_uk_hex, '../../../data/filter/landuse_features_h7_uk.parquet')
+    """
+    df = df.copy()
+    if index_column in df.columns:
+        df[index_column] = as_uint64_cells(df[index_column].to_numpy())
+
+    geometry_columns = [column for column in df.columns if _is_geometry_column(df[column])]
+    if geometry_columns:
+        for column in geometry_columns:
+            geoseries = gpd.GeoSeries(df[column], index=df.index)
+            if geoseries.crs is None:
+                geoseries = geoseries.set_crs(crs)
+            df[column] = geoseries
+        # Keep the active geometry of a GeoDataFrame, otherwise use the first geometry column
+        active_geometry = geometry_columns[0]
+        if isinstance(df, gpd.GeoDataFrame) and 'geometry' in geometry_columns:
+            active_geometry = 'geometry'
+        gpd.GeoDataFrame(df, geometry=active_geometry).to_parquet(file_path, index=False)
+    else:
+        df.to_parquet(file_path, index=False)
+    return file_path
+
+
+def read_features_arrow(file_path, columns=None, memory_map=True):
+    """
+    Read a stage of the pipeline from the feature store as an Arrow table, without converting it to pandas.
+
+    Args:
+        file_path (str): Path of the Parquet file written by write_features.
+        columns (list of str, optional): Columns to read; the others are not loaded from disk. Default is all.
+        memory_map (bool, optional): Whether to memory-map the file instead of reading it into a buffer. Default is
+            True.
+
+    Returns:
+        pyarrow.Table: The features; the H3 index is a uint64 column and geometries are WKB binary columns.
+    """
+    return pq.read_table(file_path, columns=columns, memory_map=memory_map)
+
+
+def iter_features(file_path, columns=None, batch_size=100000, memory_map=True):
+    """
+    Read a stage of the pipeline from the feature store in chunks of rows, so that it never has to fit in memory.
+
+    Args:
+        file_path (str): Path of the Parquet file written by write_features.
+        columns (list of str, optional): Columns to read. Default is all (geometries are returned as WKB bytes).
+        batch_size (int, optional): Maximum number of rows of each chunk. Default is 100000.
+        memory_map (bool, optional): Whether to memory-map the file instead of reading it into a buffer. Default is
+            True.
+
+    Yields:
+        pandas.DataFrame: The next chunk of rows.
+
+    Example:
+        >>> for chunk in iter_features('../../data/filter/UK_weighted_merged_features_h8_uk.parquet',
+        ...                            columns=['population_density', 'avg_age']):
+        ...     scaler.partial_fit(chunk)
+    """
+    parquet_file = pq.ParquetFile(file_path, memory_map=memory_map)
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        yield batch.to_pandas()
+
+
+def count_features(file_path):
+    """
+    Number of rows (hexagons) of a stage of the pipeline, read from the Parquet metadata.
+
+    Args:
+        file_path (str): Path of the Parquet file written by write_features.
+
+    Returns:
+        int: The number of rows.
+    """
+    return pq.ParquetFile(file_path).metadata.num_rows
+
+
+def _geometry_columns(file_path):
+    # Names of the geometry columns recorded in the GeoParquet metadata, if any
+    metadata = pq.read_schema(file_path).metadata or {}
+    if b'geo' not in metadata:
+        return []
+    return list(json.loads(metadata[b'geo'])['columns'])
+
+
+def read_features(file_path, columns=None, index_column='index', h3_as_string=False, memory_map=True):
+    """
+    Read a stage of the pipeline from the feature store.
+
+    Args:
+        file_path (str): Path of the Parquet file written by write_features.
+        columns (list of str, optional): Columns to read; the others are not loaded from disk. Default is all.
+        index_column (str, optional): Column with the H3 index of each hexagon. Default is 'index'.
+        h3_as_string (bool, optional): Whether to convert the uint64 H3 index back to strings. Default is False.
+        memory_map (bool, optional): Whether to memory-map the file instead of reading it into a buffer. Default is
+            True.
+
+    Returns:
+        pandas.DataFrame or geopandas.GeoDataFrame: The features, as a GeoDataFrame if the file contains geometry
+            columns and at least one of them is read.
+
+    Example:
+        >>> road_uk_hex = read_features('../../../data/filter/road_features_h7_uk.parquet',
+        ...                             columns=['index', 'length_residential'])
+    """
+    geometry_columns = _geometry_columns(file_path)
+    if any(columns is None or column in columns for column in geometry_columns):
+        df = gpd.read_parquet(file_path, columns=columns, memory_map=memory_map)
+    else:
+        df = read_features_arrow(file_path, columns=columns, memory_map=memory_map).to_pandas()
+
+    if h3_as_string and index_column in df.columns:
+        df[index_column] = uint64_to_h3(df[index_column].to_numpy())
+    return df
+
+
+def import_pickle(pickle_file, file_path=None, index_column='index'):
+    """
+    Import a pickle file written by a previous version of the pipeline into the feature store.
+
+    Args:
+        pickle_file (str): Path to the pickle file (e.g. '../../../data/filter/landuse_features_h7_uk.pkl').
+        file_path (str, optional): Path of the Parquet file to write. Default is the path of the pickle file with
+            the '.parquet' extension.
+        index_column (str, optional): Column with the H3 index of each hexagon. Default is 'index'.
+
+    Returns:
+        str: The path of the written file.
+
+    Example:
+        >>> import_pickle('data/filter/landuse_features_h7_uk.pkl')
+        'data/filter/landuse_features_h7_uk.parquet'
+    """
+    if file_path is None:
+        file_path = os.path.splitext(pickle_file)[0] + '.parquet'
+    return write_features(read_pickle(pickle_file), file_path, index_column=index_column)
@@ -1,4 +1,4 @@
-import h3
+import h3.api.numpy_int as h3_int
 
 def geometry_to_h3r7(row):
     """
@@ -8,7 +8,7 @@ def geometry_to_h3r7(row):
     row (pandas.Series): A row from a dataframe containing a 'geometry' column.
 
     Returns:
-    str: The H3 hexagon index.
+    int: The H3 hexagon index in its uint64 form.
 
     Usage Example:
     df['h3_index'] = df.apply(convert_to_h3, axis=1)
@@ -20,7 +20,7 @@ def geometry_to_h3r7(row):
     # Get the centroid of the geometry
     centroid = row['geometry'].centroid
     # Convert centroid coordinates to H3 hexagon index
-    h3_index = h3.geo_to_h3(centroid.y, centroid.x, resolution=7)
+    h3_index = h3_int.geo_to_h3(centroid.y, centroid.x, resolution=7)
     return h3_index
 
 
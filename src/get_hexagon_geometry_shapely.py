@@ -6,12 +6,16 @@ def get_hexagon_geometry_shapely(hex_id):
     Get the geometry of a H3 hexagon given its hexagon ID.
 
     Parameters:
-    - hex_id (str): The H3 hexagon ID.
+    - hex_id (str or int): The H3 hexagon ID, as a string or in its uint64 form.
 
     Returns:
     - shapely.geometry.Polygon: The geometry of the H3 hexagon in shapely.geometry.shape format.
     """
 
-    h3_boundary = h3.h3_to_geo_boundary(hex_id)
+    if not isinstance(hex_id, str):
+        hex_id = h3.h3_to_string(int(hex_id))
+    # geo_json=True returns (lng, lat) pairs, the axis order of EPSG:4326 geometries
+    # For many hexagons, use src.hex_geometry.hex_ids_to_geoseries instead
+    h3_boundary = h3.h3_to_geo_boundary(hex_id, geo_json=True)
     hex_polygon = shapely.geometry.Polygon(h3_boundary)
     return(hex_polygon)
\ No newline at end of file
@@ -0,0 +1,242 @@
+import numpy as np
+import pandas as pd
+import h3.api.numpy_int as h3_int
+
+# Value of each ASCII character as a hexadecimal digit (0 for any other character)
+_HEX_DIGIT_VALUES = np.zeros(256, dtype=np.uint64)
+for _i, _char in enumerate(b'0123456789abcdef'):
+    _HEX_DIGIT_VALUES[_char] = _i
+for _i, _char in enumerate(b'ABCDEF'):
+    _HEX_DIGIT_VALUES[_char] = 10 + _i
+_HEX_DIGIT_CHARS = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+
+# Layout of the 64-bit H3 index: the resolution is stored in bits 52-55 and the digit of resolution r (3 bits) in
+# bits 3 * (15 - r) to 3 * (15 - r) + 2; digits finer than the resolution of the cell are set to 7
+H3_RESOLUTION_OFFSET = 52
+H3_RESOLUTION_MASK = np.uint64(0xF) << np.uint64(H3_RESOLUTION_OFFSET)
+H3_MAX_RESOLUTION = 15
+
+
+def h3_to_uint64(hex_ids):
+    """
+    Convert H3 ids from their string form to their uint64 form in a vectorized way.
+
+    Args:
+        hex_ids (array-like of str): H3 ids as hexadecimal strings (e.g. '87195a245ffffff').
+
+    Returns:
+        numpy.ndarray: The H3 ids as uint64.
+
+    Example:
+        >>> h3_to_uint64(['87195a245ffffff', '8709a0826ffffff'])
+        array([608431948863373311, 608155309499744255], dtype=uint64)
+    """
+    hex_ids = np.asarray(hex_ids)
+    if hex_ids.size == 0:
+        return np.zeros(hex_ids.shape, dtype=np.uint64)
+    # Fixed-width byte strings, shorter ids are padded with null bytes on the right
+    as_bytes = hex_ids.astype('S16')
+    chars = as_bytes.view(np.uint8).reshape(len(as_bytes), 16)
+    lengths = (chars != 0).sum(axis=1)
+
+    # Shift of each character: the last character of each id is the least significant digit
+    positions = np.arange(16)
+    shifts = 4 * (lengths[:, None] - 1 - positions[None, :])
+    valid = shifts >= 0
+    digits = _HEX_DIGIT_VALUES[chars] << np.where(valid, shifts, 0).astype(np.uint64)
+    return np.bitwise_or.reduce(np.where(valid, digits, np.uint64(0)), axis=1)
+
+
+def uint64_to_h3(cells):
+    """
+    Convert H3 ids from their uint64 form to their string form in a vectorized way.
+
+    Args:
+        cells (array-like of int): H3 ids as (u)int64.
+
+    Returns:
+        numpy.ndarray: The H3 ids as hexadecimal strings (object array), without leading zeros.
+
+    Example:
+        >>> uint64_to_h3(np.array([608431948863373311], dtype=np.uint64))
+        array(['87195a245ffffff'], dtype=object)
+    """
+    cells = np.asarray(cells).astype(np.uint64)
+    shifts = np.arange(60, -4, -4, dtype=np.uint64)
+    digits = ((cells[:, None] >> shifts[None, :]) & np.uint64(0xF)).astype(np.intp)
+    as_bytes = np.ascontiguousarray(_HEX_DIGIT_CHARS[digits]).view('S16').ravel()
+    return np.char.lstrip(as_bytes, b'0').astype(str).astype(object)
+
+
+def as_uint64_cells(hex_ids):
+    """
+    Return H3 ids in their uint64 form, converting them only if they are strings.
+
+    Args:
+        hex_ids (array-like): H3 ids as strings or integers.
+
+    Returns:
+        numpy.ndarray: The H3 ids as uint64.
+    """
+    hex_ids = np.asarray(hex_ids)
+    if hex_ids.dtype.kind in 'iu':
+        return hex_ids.astype(np.uint64, copy=False)
+    return h3_to_uint64(hex_ids.astype(str))
+
+
+def cell_resolution(cells):
+    """
+    Get the resolution of H3 cells given in their uint64 form.
+
+    Args:
+        cells (numpy.ndarray): H3 ids as uint64.
+
+    Returns:
+        numpy.ndarray: The resolution of each cell.
+    """
+    return ((np.asarray(cells, dtype=np.uint64) & H3_RESOLUTION_MASK) >> np.uint64(H3_RESOLUTION_OFFSET)) \
+        .astype(np.int64)
+
+
+def cell_to_parent(cells, resolution):
+    """
+    Get the parent of H3 cells at a coarser resolution with bit operations on their uint64 form.
+
+    Args:
+        cells (numpy.ndarray): H3 ids as uint64, all at a resolution finer than or equal to resolution.
+        resolution (int): Resolution of the parent cells.
+
+    Returns:
+        numpy.ndarray: The parent cell of each cell as uint64.
+
+    Example:
+        >>> cell_to_parent(h3_to_uint64(['88194e4151fffff']), 7)
+        array([608431132014280703], dtype=uint64)
+    """
+    cells = np.asarray(cells, dtype=np.uint64)
+    if not 0 <= resolution <= H3_MAX_RESOLUTION:
+        raise ValueError(f"The resolution must be between 0 and {H3_MAX_RESOLUTION}.")
+    if (cell_resolution(cells) < resolution).any():
+        raise ValueError("All the cells must have a resolution finer than or equal to the parent resolution.")
+    # Set the resolution field and all the digits finer than the parent resolution to 7
+    fine_digits_mask = np.uint64((1 << (3 * (H3_MAX_RESOLUTION - resolution))) - 1)
+    parents = (cells & ~H3_RESOLUTION_MASK) | (np.uint64(resolution) << np.uint64(H3_RESOLUTION_OFFSET))
+    return parents | fine_digits_mask
+
+
+def cell_areas(cells, unit='km^2'):
+    """
+    Get the area of H3 cells given in their uint64 form.
+
+    Args:
+        cells (numpy.ndarray): H3 ids as uint64.
+        unit (str, optional): Unit of the areas, 'km^2', 'm^2' or 'rads^2'. Default is 'km^2'.
+
+    Returns:
+        numpy.ndarray: The area of each cell.
+    """
+    return np.array([h3_int.cell_area(cell, unit=unit) for cell in np.asarray(cells, dtype=np.uint64).tolist()],
+                    dtype=np.float64)
+
+
+def hash_join_indexer(left_keys, right_keys):
+    """
+    Positions of the left keys in the right keys using a hash table on native uint64 keys.
+
+    Args:
+        left_keys (numpy.ndarray): Keys to look up (uint64).
+        right_keys (numpy.ndarray): Unique keys to search in (uint64).
+
+    Returns:
+        numpy.ndarray: For each left key, its position in right_keys or -1 if it is missing.
+    """
+    return pd.Index(np.asarray(right_keys, dtype=np.uint64)).get_indexer(np.asarray(left_keys, dtype=np.uint64))
+
+
+def sorted_join_indexer(left_keys, right_keys, right_sorter=None):
+    """
+    Positions of the left keys in the right keys using a binary search on the sorted uint64 keys.
+
+    Args:
+        left_keys (numpy.ndarray): Keys to look up (uint64).
+        right_keys (numpy.ndarray): Unique keys to search in (uint64).
+        right_sorter (numpy.ndarray, optional): Permutation sorting right_keys (e.g. np.argsort(right_keys)), to
+            reuse it between joins. Computed if None.
+
+    Returns:
+        numpy.ndarray: For each left key, its position in right_keys or -1 if it is missing.
+    """
+    left_keys = np.asarray(left_keys, dtype=np.uint64)
+    right_keys = np.asarray(right_keys, dtype=np.uint64)
+    if right_sorter is None:
+        right_sorter = np.argsort(right_keys, kind='stable')
+    if len(right_keys) == 0:
+        return np.full(len(left_keys), -1, dtype=np.intp)
+    sorted_positions = np.searchsorted(right_keys, left_keys, sorter=right_sorter)
+    sorted_positions = np.minimum(sorted_positions, len(right_keys) - 1)
+    indexer = right_sorter[sorted_positions]
+    return np.where(right_keys[indexer] == left_keys, indexer, -1)
+
+
+def _take(df, indexer):
+    # Rows of df at the positions of indexer; -1 gives a row of NaN
+    df = df.reset_index(drop=True)
+    if (indexer >= 0).all():
+        return df.iloc[indexer].reset_index(drop=True)
+    return df.reindex(indexer).reset_index(drop=True)
+
+
+def merge_on_h3(left, right, on='index', how='inner', method='hash'):
+    """
+    Merge two DataFrames of hexagons on their uint64 H3 index with native array joins.
+
+    The right DataFrame must have at most one row per hexagon (e.g. a table of features). The result has the same
+    rows as pandas.merge with the same arguments and sort=False (for 'outer', the rows of left come first, followed
+    by the rows only in right).
+
+    Args:
+        left (pandas.DataFrame): The left DataFrame.
+        right (pandas.DataFrame): The right DataFrame.
+        on (str, optional): Name of the H3 index column (uint64 or strings). Default is 'index'.
+        how (str, optional): 'inner', 'left' or 'outer'. Default is 'inner'.
+        method (str, optional): 'hash' (hash_join_indexer) or 'sorted' (sorted_join_indexer). Default is 'hash'.
+
+    Returns:
+        pandas.DataFrame: The merged DataFrame (of the type of left, e.g. a GeoDataFrame), with the H3 index as
+            uint64.
+    """
+    left_keys = as_uint64_cells(left[on].to_numpy())
+    right_keys = as_uint64_cells(right[on].to_numpy())
+    if pd.Index(right_keys).has_duplicates:
+        raise ValueError("merge_on_h3 requires at most one row per hexagon in the right DataFrame.")
+
+    join_indexer = hash_join_indexer if method == 'hash' else sorted_join_indexer
+    right_indexer = join_indexer(left_keys, right_keys)
+    if how == 'inner':
+        left_indexer = np.flatnonzero(right_indexer >= 0)
+        right_indexer = right_indexer[left_indexer]
+        keys = left_keys[left_indexer]
+    elif how == 'left':
+        left_indexer = np.arange(len(left_keys))
+        keys = left_keys
+    elif how == 'outer':
+        # Rows of the left frame followed by the rows of the right frame missing from the left one
+        right_only = np.setdiff1d(np.arange(len(right_keys)), right_indexer[right_indexer >= 0])
+        left_indexer = np.concatenate([np.arange(len(left_keys)), np.full(len(right_only), -1)])
+        right_indexer = np.concatenate([right_indexer, right_only])
+        keys = np.concatenate([left_keys, right_keys[right_only]])
+    else:
+        raise ValueError("how must be 'inner', 'left' or 'outer'.")
+
+    left_part = _take(left.drop(columns=on), left_indexer)
+    right_part = _take(right.drop(columns=on), right_indexer)
+    overlap = left_part.columns.intersection(right_part.columns)
+    left_part = left_part.rename(columns={column: f'{column}_x' for column in overlap})
+    right_part = right_part.rename(columns={column: f'{column}_y' for column in overlap})
+
+    merged = pd.concat([left_part, right_part], axis=1)
+    merged.insert(list(left.columns).index(on), on, keys)
+    # Keep the type of the left frame (e.g. a GeoDataFrame)
+    if type(left) is not pd.DataFrame:
+        merged = type(left)(merged)
+    return merged
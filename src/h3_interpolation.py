@@ -0,0 +1,291 @@
+import os
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import shapely
+import geopandas as gpd
+import h3.api.numpy_int as h3_int
+from scipy import sparse
+from src.h3_index import cell_areas
+from src.hex_geometry import hex_ids_to_geoseries
+
+# Projected CRS used to clip the boundary cells (British National Grid, in metres)
+DEFAULT_PROJECTED_CRS = 'EPSG:27700'
+# Resolution of the H3 parent cells used to partition the sources between workers
+DEFAULT_PARTITION_RESOLUTION = 4
+
+
+def _polygon_parts(geometry):
+    # Polygons of a Polygon or MultiPolygon geometry
+    if geometry is None or geometry.is_empty:
+        return []
+    if geometry.geom_type == 'Polygon':
+        return [geometry]
+    return [part for part in getattr(geometry, 'geoms', []) if part.geom_type == 'Polygon']
+
+
+def _boundary_cells(polygon, resolution, spacing):
+    # Cells crossed by the rings of a polygon: the cells of points sampled along the rings every `spacing` degrees,
+    # and their neighbours, which covers the cells only touched by a corner between two samples
+    points = shapely.get_coordinates(shapely.segmentize(polygon.boundary, spacing))
+    point_cells = np.unique([h3_int.geo_to_h3(lat, lng, resolution) for lng, lat in points.tolist()])
+    return np.unique(np.concatenate([h3_int.k_ring(cell, 1) for cell in point_cells.tolist()]))
+
+
+def _cell_source_pairs(geometries, resolution):
+    # For every source, the cells fully inside it (polyfill minus the boundary cells) and the cells on its boundary
+    # (to be clipped exactly)
+    # Half the edge length of a cell, in degrees of latitude (smaller in km along the longitude)
+    spacing = h3_int.edge_length(resolution, unit='km') / 111.0 / 2
+    interior_cells, interior_sources, boundary_cells, boundary_sources = [], [], [], []
+    for source, geometry in enumerate(geometries):
+        parts = _polygon_parts(geometry)
+        if not parts:
+            continue
+        filled = np.unique(np.concatenate([
+            h3_int.polyfill(shapely.geometry.mapping(part), resolution, geo_json_conformant=True)
+            for part in parts]).astype(np.uint64))
+        boundary = np.unique(np.concatenate([_boundary_cells(part, resolution, spacing) for part in parts])
+                             .astype(np.uint64))
+        interior = np.setdiff1d(filled, boundary, assume_unique=True)
+        interior_cells.append(interior)
+        interior_sources.append(np.full(len(interior), source))
+        boundary_cells.append(boundary)
+        boundary_sources.append(np.full(len(boundary), source))
+
+    def concatenate(arrays, dtype):
+        return np.concatenate(arrays).astype(dtype) if arrays else np.array([], dtype=dtype)
+    return (concatenate(interior_cells, np.uint64), concatenate(interior_sources, np.int64),
+            concatenate(boundary_cells, np.uint64), concatenate(boundary_sources, np.int64))
+
+
+def source_digest(source_df, resolution, projected_crs=DEFAULT_PROJECTED_CRS):
+    """
+    Digest identifying a set of source geometries at a resolution, used as the key of the cached weights.
+
+    Args:
+        source_df (geopandas.GeoDataFrame): The source polygons.
+        resolution (int): The resolution of the H3 cells.
+        projected_crs (str, optional): The CRS used to clip the boundary cells. Default is 'EPSG:27700'.
+
+    Returns:
+        str: A hexadecimal digest.
+    """
+    digest = hashlib.sha1(f'{resolution}|{projected_crs}|{source_df.crs}'.encode())
+    for wkb in shapely.to_wkb(np.asarray(source_df.geometry.values)):
+        digest.update(wkb if wkb is not None else b'')
+    return digest.hexdigest()
+
+
+def save_weights(weights, file_path):
+    """
+    Save source-to-hexagon area weights (see h3_area_weights) as an npz file.
+
+    Args:
+        weights (dict): The weights.
+        file_path (str): Path of the npz file to write.
+
+    Returns:
+        str: The path of the written file.
+    """
+    matrix = weights['matrix'].tocsr()
+    with open(file_path, 'wb') as file:
+        np.savez(file, data=matrix.data, indices=matrix.indices, indptr=matrix.indptr, shape=np.array(matrix.shape),
+                 hex_ids=weights['hex_ids'], resolution=weights['resolution'])
+    return file_path
+
+
+def load_weights(file_path):
+    """
+    Load source-to-hexagon area weights saved by save_weights.
+
+    Args:
+        file_path (str): Path of the npz file.
+
+    Returns:
+        dict: The weights.
+    """
+    with np.load(file_path) as arrays:
+        matrix = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                                   shape=tuple(arrays['shape']))
+        return {'matrix': matrix, 'hex_ids': arrays['hex_ids'], 'resolution': int(arrays['resolution'])}
+
+
+def _area_weight_triplets(geometries, geometries_projected, resolution, projected_crs):
+    # Intersection areas (cell, source position, area in km^2) of a group of sources
+    interior_cells, interior_sources, boundary_cells, boundary_sources = _cell_source_pairs(geometries, resolution)
+
+    # Exact clipping of the boundary cells, all the (cell, source) pairs in one vectorized intersection
+    unique_boundary, boundary_positions = np.unique(boundary_cells, return_inverse=True)
+    hexagons = np.asarray(hex_ids_to_geoseries(unique_boundary).to_crs(projected_crs).values)
+    clipped_areas = shapely.area(shapely.intersection(hexagons[boundary_positions],
+                                                      np.asarray(geometries_projected)[boundary_sources]))
+    boundary_fractions = clipped_areas / shapely.area(hexagons)[boundary_positions]
+    keep = boundary_fractions > 0
+
+    # Geodesic area of every cell, scaled by the clipped fraction for the boundary cells
+    cells = np.concatenate([interior_cells, boundary_cells[keep]])
+    unique_cells, positions = np.unique(cells, return_inverse=True)
+    areas = cell_areas(unique_cells, unit='km^2')[positions]
+    areas[len(interior_cells):] *= boundary_fractions[keep]
+    return cells, np.concatenate([interior_sources, boundary_sources[keep]]), areas
+
+
+def _partition_triplets(source_positions, geometries, geometries_projected, resolution, projected_crs):
+    # Worker task: triplets of one spatial partition, with the positions of its sources in the full source set
+    cells, sources, areas = _area_weight_triplets(geometries, geometries_projected, resolution, projected_crs)
+    return cells, source_positions[sources], areas
+
+
+def partition_sources(geometries, partition_resolution=DEFAULT_PARTITION_RESOLUTION):
+    """
+    Partition source polygons spatially by the H3 parent cell of a point on their surface.
+
+    Args:
+        geometries (geopandas.GeoSeries): The source polygons, in EPSG:4326.
+        partition_resolution (int, optional): The resolution of the parent cells (3 or 4 gives a few tens to a few
+            hundreds of partitions over the UK). Default is 4.
+
+    Returns:
+        dict: The positions of the sources of each partition, keyed by parent cell (uint64) in increasing order.
+    """
+    points = shapely.point_on_surface(np.asarray(geometries.values))
+    keys = np.fromiter((h3_int.geo_to_h3(lat, lng, partition_resolution) if not np.isnan(lat) else 0
+                        for lat, lng in zip(shapely.get_y(points).tolist(), shapely.get_x(points).tolist())),
+                       dtype=np.uint64, count=len(points))
+    return {key: np.flatnonzero(keys == key) for key in np.unique(keys).tolist()}
+
+
+def build_h3_area_weights(source_df, resolution, projected_crs=DEFAULT_PROJECTED_CRS, n_jobs=1,
+                          partition_resolution=DEFAULT_PARTITION_RESOLUTION):
+    """
+    Build the sparse matrix of the area of the intersection of every source polygon with every H3 cell.
+
+    The cells whose center is inside a source are found with polyfill, and the cells crossed by the boundary of the
+    source are found by sampling its rings. Only the boundary cells are clipped exactly against the source, in a
+    projected CRS; every other cell of the polyfill is fully inside the source. Areas are geodesic (km^2): the
+    area of a clipped cell is its geodesic area times the clipped fraction of its projected area.
+
+    With n_jobs > 1 the sources are partitioned by H3 parent cell (see partition_sources) and the partitions are
+    processed on a process pool. The partial results are reduced in the order of the parent cells, so the matrix
+    does not depend on the number of workers.
+
+    Args:
+        source_df (geopandas.GeoDataFrame): The source polygons (e.g. local authorities or output areas).
+        resolution (int): The resolution of the H3 cells.
+        projected_crs (str, optional): The CRS used to clip the boundary cells. Default is 'EPSG:27700' (British
+            National Grid).
+        n_jobs (int, optional): The number of worker processes. Default is 1 (no pool).
+        partition_resolution (int, optional): The resolution of the parent cells of the partitions, at most
+            resolution. Default is 4.
+
+    Returns:
+        dict: 'matrix' (scipy.sparse.csr_matrix of shape (n_hexagons, n_sources), the intersection areas),
+            'hex_ids' (numpy.ndarray, the uint64 id of each row, sorted) and 'resolution'.
+    """
+    geometries = source_df.geometry.to_crs('EPSG:4326')
+    geometries_projected = np.asarray(source_df.geometry.to_crs(projected_crs).values)
+    if n_jobs > 1:
+        # The partitions are never finer than the cells of the weights
+        partitions = partition_sources(geometries, partition_resolution=min(partition_resolution, resolution))
+        tasks = [(positions, list(geometries.values[positions]), geometries_projected[positions])
+                 for positions in partitions.values()]
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            # map returns the partial results in the order of the partitions
+            triplets = list(executor.map(_partition_triplets, *zip(*tasks), [resolution] * len(tasks),
+                                         [projected_crs] * len(tasks)))
+        cells, sources, areas = (np.concatenate(arrays) for arrays in zip(*triplets)) if triplets \
+            else (np.array([], dtype=np.uint64), np.array([], dtype=np.int64), np.array([]))
+    else:
+        cells, sources, areas = _area_weight_triplets(list(geometries.values), geometries_projected, resolution,
+                                                      projected_crs)
+
+    hex_ids, rows = np.unique(cells, return_inverse=True)
+    matrix = sparse.csr_matrix((areas, (rows, sources)), shape=(len(hex_ids), len(source_df)))
+    matrix.sort_indices()
+    return {'matrix': matrix, 'hex_ids': hex_ids, 'resolution': resolution}
+
+
+def h3_area_weights(source_df, resolution, projected_crs=DEFAULT_PROJECTED_CRS, cache_directory=None, n_jobs=1):
+    """
+    Get the source-to-hexagon area weights of a set of source polygons, from the disk cache if available.
+
+    Args:
+        source_df (geopandas.GeoDataFrame): The source polygons.
+        resolution (int): The resolution of the H3 cells.
+        projected_crs (str, optional): The CRS used to clip the boundary cells. Default is 'EPSG:27700'.
+        cache_directory (str, optional): Directory of the cached weights, one npz file per (source geometries,
+            resolution). Default is None (no cache).
+        n_jobs (int, optional): The number of worker processes used to build the weights if they are not cached.
+            Default is 1.
+
+    Returns:
+        dict: The weights (see build_h3_area_weights).
+
+    Example:
+        >>> weights = h3_area_weights(gdf_final, resolution=7, cache_directory='../../../data/filter/staging')
+    """
+    if cache_directory is None:
+        return build_h3_area_weights(source_df, resolution, projected_crs=projected_crs, n_jobs=n_jobs)
+    cache_file = os.path.join(cache_directory, f'h3_area_weights_r{resolution}_'
+                                               f'{source_digest(source_df, resolution, projected_crs)}.npz')
+    if os.path.exists(cache_file):
+        return load_weights(cache_file)
+    weights = build_h3_area_weights(source_df, resolution, projected_crs=projected_crs, n_jobs=n_jobs)
+    os.makedirs(cache_directory, exist_ok=True)
+    save_weights(weights, cache_file)
+    return weights
+
+
+def interpolate_to_h3(weights, source_df, extensive_variables=None, intensive_variables=None, geometry=True):
+    """
+    Interpolate variables of source polygons to H3 cells with precomputed area weights.
+
+    The semantics are those of tobler.area_weighted.area_interpolate with the hexgrid of tobler.util.h3fy clipped
+    to the sources:
+        - extensive (e.g. counts): value_hex = sum_s value_s * area(s & hex) / area(s)
+        - intensive (e.g. densities, averages): value_hex = sum_s value_s * area(s & hex) / area(hex & sources)
+    All the variables of each kind are interpolated together with one sparse matrix product. Missing values are
+    treated as 0, as in tobler.
+
+    Args:
+        weights (dict): The weights returned by h3_area_weights for source_df.
+        source_df (pandas.DataFrame): The variables of the sources, one row per source polygon, in the order used
+            to build the weights.
+        extensive_variables (list of str, optional): The extensive variables.
+        intensive_variables (list of str, optional): The intensive variables.
+        geometry (bool, optional): Whether to return a GeoDataFrame with the hexagon polygons. Default is True.
+
+    Returns:
+        pandas.DataFrame or geopandas.GeoDataFrame: One row per hexagon with the H3 'index' (uint64) and the
+            interpolated variables.
+
+    Example:
+        >>> dc_hex_interpolated = interpolate_to_h3(weights, gdf_final,
+        ...                                         intensive_variables=['population_density', 'avg_age'])
+    """
+    extensive_variables = list(extensive_variables or [])
+    intensive_variables = list(intensive_variables or [])
+    matrix = weights['matrix'].tocsr()
+    df_hex = pd.DataFrame({'index': weights['hex_ids']})
+
+    if extensive_variables:
+        # Each source spreads its value over its cells in proportion to the area of the intersections
+        source_areas = np.asarray(matrix.sum(axis=0)).ravel()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            column_scale = np.where(source_areas > 0, 1 / source_areas, 0)
+        values = np.nan_to_num(source_df[extensive_variables].to_numpy(dtype=np.float64))
+        df_hex[extensive_variables] = (matrix @ sparse.diags(column_scale)) @ values
+
+    if intensive_variables:
+        # Area-weighted mean of the sources intersecting each cell
+        hex_areas = np.asarray(matrix.sum(axis=1)).ravel()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            row_scale = np.where(hex_areas > 0, 1 / hex_areas, 0)
+        values = np.nan_to_num(source_df[intensive_variables].to_numpy(dtype=np.float64))
+        df_hex[intensive_variables] = sparse.diags(row_scale) @ (matrix @ values)
+
+    if geometry:
+        return gpd.GeoDataFrame(df_hex, geometry=hex_ids_to_geoseries(df_hex['index']))
+    return df_hex
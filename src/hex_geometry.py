@@ -0,0 +1,86 @@
+import itertools
+import numpy as np
+import shapely
+import geopandas as gpd
+import h3.api.numpy_int as h3_int
+from src.h3_index import as_uint64_cells
+
+
+def hex_boundaries(cells):
+    """
+    Get the boundary vertices of many H3 cells as a single coordinate array in (lng, lat) order.
+
+    Args:
+        cells (array-like): H3 ids as strings or integers.
+
+    Returns:
+        numpy.ndarray: The (lng, lat) coordinates of the vertices of all the cells, shape (n_vertices, 2).
+        numpy.ndarray: The number of vertices of each cell (6 for hexagons, 5 for pentagons, and up to 10 when the
+            cell crosses an edge of the icosahedron).
+    """
+    boundaries = [h3_int.h3_to_geo_boundary(cell) for cell in as_uint64_cells(cells).tolist()]
+    n_vertices = np.fromiter(map(len, boundaries), dtype=np.int64, count=len(boundaries))
+    coordinates = np.fromiter(itertools.chain.from_iterable(itertools.chain.from_iterable(boundaries)),
+                              dtype=np.float64, count=2 * int(n_vertices.sum())).reshape(-1, 2)
+    # h3 returns (lat, lng) pairs, while the x axis of EPSG:4326 geometries is the longitude
+    return coordinates[:, ::-1], n_vertices
+
+
+def hex_ids_to_geoseries(ids, index=None, crs='EPSG:4326'):
+    """
+    Build the polygons of many H3 cells at once with the vectorized constructors of shapely 2.
+
+    The vertices of all the cells are gathered in a single coordinate array, in (lng, lat) order so that the
+    geometries really are in EPSG:4326, and the polygons are built with a single call to shapely.polygons.
+
+    Args:
+        ids (array-like): H3 ids as strings or integers (e.g. the 'index' column of the feature store).
+        index (pandas.Index, optional): The index of the returned GeoSeries (e.g. the index of the DataFrame of
+            the ids). Default is a RangeIndex.
+        crs (str, optional): The CRS of the GeoSeries. Default is 'EPSG:4326'.
+
+    Returns:
+        geopandas.GeoSeries: The polygon of each cell.
+
+    Example:
+        >>> df_final['geojson'] = hex_ids_to_geoseries(df_final['index'], index=df_final.index)
+    """
+    coordinates, n_vertices = hex_boundaries(ids)
+    if len(n_vertices) and (n_vertices == n_vertices[0]).all():
+        # Usual case, only hexagons (or only pentagons): one (n, 6, 2) array of rings
+        polygons = shapely.polygons(coordinates.reshape(len(n_vertices), n_vertices[0], 2))
+    else:
+        rings = shapely.linearrings(coordinates, indices=np.repeat(np.arange(len(n_vertices)), n_vertices))
+        polygons = shapely.polygons(rings)
+    return gpd.GeoSeries(polygons, index=index, crs=crs)
+
+
+def geometries_to_h3(geoseries, resolution, use_index=False):
+    """
+    Assign to each geometry the H3 cell containing its centroid, for all the geometries at once.
+
+    The centroids are computed with the array functions of shapely 2 and converted to H3 ids in a single batch.
+    With use_index=True the H3 ids are instead taken from the index of the GeoSeries, e.g. the 'hex_id' index of
+    the hexagon grid returned by tobler.util.h3fy. This is faster and exact even for the hexagons clipped to the
+    boundary of the area (whose centroid may fall in a neighbouring cell).
+
+    Args:
+        geoseries (geopandas.GeoSeries): The geometries, in EPSG:4326 (e.g. the 'geometry' column of a
+            GeoDataFrame).
+        resolution (int): The resolution of the H3 cells. Not used with use_index=True.
+        use_index (bool, optional): Whether to take the H3 ids from the index of geoseries. Default is False.
+
+    Returns:
+        numpy.ndarray: The H3 id of each geometry as uint64.
+
+    Example:
+        >>> gdf_hex = h3fy(gdf_final, resolution=7, clip=True)
+        >>> gdf_hex['index'] = geometries_to_h3(gdf_hex.geometry, resolution=7, use_index=True)
+    """
+    if use_index:
+        return as_uint64_cells(geoseries.index.to_numpy())
+    centroids = shapely.centroid(np.asarray(geoseries.values))
+    latitudes, longitudes = shapely.get_y(centroids), shapely.get_x(centroids)
+    return np.fromiter((h3_int.geo_to_h3(latitude, longitude, resolution)
+                        for latitude, longitude in zip(latitudes.tolist(), longitudes.tolist())),
+                       dtype=np.uint64, count=len(centroids))
@@ -0,0 +1,221 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from src.clustering_k_means import clustering_k_means
+from src.clustering_model import FIRST_STEP, predict as predict_labels, save_model
+from src.post_analysis_plots import wait_for_figures
+
+# Keys of a tier spec that are not keyword arguments of clustering_k_means
+_SPEC_KEYS = ('columns', 'columns_clustering', 'label_column_name', 'return_diagnostics')
+
+
+def _fit_tier(df_tier, spec, random_state=0, wait=False):
+    # Fit the k-means model of one tier with clustering_k_means (top-level so that it can run in a process)
+    options = {'post_analysis': False, 'metrics': False, 'random_state': random_state,
+               **{key: value for key, value in spec.items() if key not in _SPEC_KEYS}}
+    df_tier, metrics, diagnostics = clustering_k_means(df=df_tier, columns_clustering=spec['columns'],
+                                                       label_column_name='_label', return_diagnostics=True,
+                                                       **options)
+    if wait:
+        # Worker processes exit without running the atexit hooks, so the figures are written before returning
+        wait_for_figures()
+    return df_tier['_label'].to_numpy(), diagnostics['tier'], metrics
+
+
+class HierarchicalHexClusterer:
+    """
+    Hierarchical k-means clustering of hexagons: a first-step clustering in tiers (e.g. middle, rural and urban)
+    followed by independent sub-clusterings of some of the tiers (e.g. middle in 2 and rural in 3 sub-classes).
+
+    Every tier is fitted with clustering_k_means from a single in-memory feature matrix with the union of the
+    columns of all the tiers. The sub-clusterings are independent, so they are fitted in parallel on a thread or
+    process pool. The final labels are numbered consecutively following tier_order: a tier without sub-clustering
+    gets one label, a sub-clustered tier gets n_clusters labels. The first step can also be given as the labels and
+    the model of a first-step clustering already run (e.g. by the first-step analysis script).
+
+    Args:
+        first_step (dict, optional): Spec of the first step, {'columns': list of str, 'n_clusters': int}, plus any
+            other keyword argument of clustering_k_means for that step (e.g. 'metrics', 'post_analysis',
+            'figure_file_path', 'backend'). Not needed when the first step is given to fit.
+        sub_clusterings (dict): Spec of each first-step label to sub-cluster, in the same format, e.g.
+            {0: {'columns': [...], 'n_clusters': 2}, 1: {'columns': [...], 'n_clusters': 3}}.
+        tier_order (list of int, optional): Order of the first-step labels in the final numbering. Default is
+            range(number of first-step clusters).
+        n_jobs (int, optional): Number of workers used to fit the sub-clusterings (1 fits them in turn, e.g. to
+            display the post-analysis plots). Default is one per sub-clustering.
+        backend (str, optional): 'thread' or 'process' pool. Default is 'thread' (k-means releases the GIL).
+        random_state (int, optional): Seed of every k-means model. Default is 0.
+
+    Attributes:
+        columns_ (list of str): Columns of the feature matrix, in the order they are first used by the tiers.
+        models_ (dict): Fitted tier (scaler and centroids, see src.clustering_model) of the first step (key
+            'first_step') and of each sub-clustered first-step label.
+        metrics_ (dict): The metrics returned by clustering_k_means for each fitted tier (None if not requested).
+        offsets_ (dict): First final label of each first-step label.
+        labels_ (numpy.ndarray): Final labels of the rows used to fit the models.
+
+    Example:
+        >>> clusterer = HierarchicalHexClusterer(
+        ...     first_step={'columns': ['population_density', 'avg_household_size', 'area_residential'],
+        ...                 'n_clusters': 3},
+        ...     sub_clusterings={0: {'columns': columns_sub_step, 'n_clusters': 2},
+        ...                      1: {'columns': columns_sub_step, 'n_clusters': 3}},
+        ...     tier_order=[0, 2, 1])
+        >>> uk_hex_total['label_6_tier'] = clusterer.fit_predict(uk_hex_total)
+        >>> # labels: middle sub-classes 0-1, urban 2, rural sub-classes 3-5
+    """
+
+    def __init__(self, first_step=None, sub_clusterings=None, tier_order=None, n_jobs=None, backend='thread',
+                 random_state=0):
+        if backend not in ('thread', 'process'):
+            raise ValueError("backend must be 'thread' or 'process'.")
+        self.first_step = first_step
+        self.sub_clusterings = sub_clusterings or {}
+        self.tier_order = tier_order
+        self.n_jobs = n_jobs
+        self.backend = backend
+        self.random_state = random_state
+
+    def _feature_matrix(self, df):
+        # Single float64 matrix with the columns of every tier
+        return df[self.columns_].to_numpy(dtype=np.float64)
+
+    def _tier_frame(self, features, columns, rows=None):
+        # DataFrame with the columns of one tier, for the rows of the tier
+        positions = [self.columns_.index(column) for column in columns]
+        values = features[:, positions] if rows is None else features[np.ix_(rows, positions)]
+        return pd.DataFrame(values, columns=list(columns))
+
+    def fit(self, df, labels_first_step=None, first_step_model=None):
+        """
+        Fit the first-step model and every sub-clustering model.
+
+        Args:
+            df (pandas.DataFrame): The hexagons, with the columns of every tier.
+            labels_first_step (array-like, optional): The first-step label of each row of df, if already computed.
+                The first step is then not fitted again.
+            first_step_model (dict, optional): The clustering model of the first step (e.g. loaded from the file
+                written by clustering_k_means with model_file_path). It labels the first step when
+                labels_first_step is None, and it is kept so that the clusterer can predict and be saved.
+
+        Returns:
+            HierarchicalHexClusterer: The fitted clusterer.
+        """
+        if self.first_step is None and labels_first_step is None and first_step_model is None:
+            raise ValueError("Either first_step, labels_first_step or first_step_model must be provided.")
+        first_step_tier = None if first_step_model is None else first_step_model['tiers'][FIRST_STEP]
+        if first_step_tier is not None:
+            first_step_columns, n_first_step = first_step_tier['columns'], len(first_step_tier['centroids'])
+        elif self.first_step is not None:
+            first_step_columns, n_first_step = self.first_step['columns'], self.first_step['n_clusters']
+        else:
+            first_step_columns, n_first_step = [], int(np.max(labels_first_step)) + 1
+
+        tier_order = self.tier_order
+        if tier_order is None:
+            tier_order = list(range(n_first_step))
+        if sorted(tier_order) != list(range(n_first_step)):
+            raise ValueError("tier_order must contain every first-step label exactly once.")
+        missing = [tier for tier in self.sub_clusterings if tier not in tier_order]
+        if missing:
+            raise ValueError(f"Sub-clusterings of unknown first-step labels: {missing}")
+
+        self.columns_ = []
+        for columns in [first_step_columns, *(spec['columns'] for spec in self.sub_clusterings.values())]:
+            self.columns_ += [column for column in columns if column not in self.columns_]
+        features = self._feature_matrix(df)
+
+        # First step on all the rows, unless it is given
+        self.models_, self.metrics_ = {}, {}
+        if first_step_tier is not None:
+            self.models_[FIRST_STEP] = first_step_tier
+        if labels_first_step is not None:
+            labels_first_step = np.asarray(labels_first_step, dtype=np.int64)
+        elif first_step_tier is not None:
+            labels_first_step = predict_labels(first_step_model, self._tier_frame(features, first_step_columns))
+        else:
+            labels_first_step, self.models_[FIRST_STEP], self.metrics_[FIRST_STEP] = _fit_tier(
+                self._tier_frame(features, first_step_columns), self.first_step, self.random_state)
+
+        # Independent sub-clusterings on the rows of each tier, in parallel
+        rows = {tier: np.flatnonzero(labels_first_step == tier) for tier in self.sub_clusterings}
+        tasks = {tier: (self._tier_frame(features, spec['columns'], rows[tier]), spec, self.random_state)
+                 for tier, spec in self.sub_clusterings.items()}
+        n_jobs = self.n_jobs or max(1, len(self.sub_clusterings))
+        if n_jobs == 1:
+            results = {tier: _fit_tier(*task) for tier, task in tasks.items()}
+        else:
+            executor_class = ThreadPoolExecutor if self.backend == 'thread' else ProcessPoolExecutor
+            with executor_class(max_workers=n_jobs) as executor:
+                futures = {tier: executor.submit(_fit_tier, *task, wait=self.backend == 'process')
+                           for tier, task in tasks.items()}
+                results = {tier: future.result() for tier, future in futures.items()}
+
+        # First final label of each tier
+        self.offsets_ = {}
+        offset = 0
+        for tier in tier_order:
+            self.offsets_[tier] = offset
+            offset += self.sub_clusterings[tier]['n_clusters'] if tier in self.sub_clusterings else 1
+        self.n_labels_ = offset
+
+        self.labels_ = np.array([self.offsets_[tier] for tier in range(len(tier_order))])[labels_first_step]
+        for tier, (labels_tier, self.models_[tier], self.metrics_[tier]) in results.items():
+            self.labels_[rows[tier]] = self.offsets_[tier] + labels_tier
+        return self
+
+    def predict(self, df):
+        """
+        Assign the final label of new hexagons by nearest centroid with the fitted models.
+
+        Args:
+            df (pandas.DataFrame): The hexagons, with the columns of every tier.
+
+        Returns:
+            numpy.ndarray: The final label of each row of df.
+        """
+        if not hasattr(self, 'models_'):
+            raise ValueError("The clusterer must be fitted before calling predict.")
+        return predict_labels(self.to_model(), df)
+
+    def fit_predict(self, df, labels_first_step=None, first_step_model=None):
+        """
+        Fit the models and return the final label of the rows used to fit them.
+
+        Args:
+            df (pandas.DataFrame): The hexagons, with the columns of every tier.
+            labels_first_step (array-like, optional): See fit.
+            first_step_model (dict, optional): See fit.
+
+        Returns:
+            numpy.ndarray: The final label of each row of df.
+        """
+        return self.fit(df, labels_first_step=labels_first_step, first_step_model=first_step_model).labels_
+
+    def to_model(self):
+        """
+        Export the fitted scalers and centroids of every tier as a clustering model of NumPy arrays.
+
+        Returns:
+            dict: The clustering model, to use with src.clustering_model.predict (no sklearn needed).
+        """
+        if not hasattr(self, 'models_'):
+            raise ValueError("The clusterer must be fitted before exporting it.")
+        if FIRST_STEP not in self.models_:
+            raise ValueError("The first-step model is needed to export the clusterer: fit it with first_step or "
+                             "first_step_model.")
+        tiers = {FIRST_STEP: self.models_[FIRST_STEP]}
+        tiers.update({tier: self.models_[tier] for tier in self.sub_clusterings})
+        return {'columns': list(self.columns_), 'tiers': tiers, 'offsets': dict(self.offsets_)}
+
+    def save(self, file_path):
+        """
+        Save the fitted clusterer as a compact npz clustering model (see src.clustering_model.save_model).
+
+        Args:
+            file_path (str): Path of the npz file to write.
+
+        Returns:
+            str: The path of the written file.
+        """
+        return save_model(self.to_model(), file_path)
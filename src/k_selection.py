@@ -0,0 +1,155 @@
+import os
+import itertools
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+from threadpoolctl import threadpool_limits
+from sklearn.preprocessing import StandardScaler
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import davies_bouldin_score, adjusted_rand_score
+from src.clustering_metrics import sampled_silhouette_score
+from src.post_analysis_plots import save_figure_async
+
+# Standardized matrix of the worker processes, attached to the shared memory block of the sweep
+_shared = {}
+
+
+def _attach_shared_matrix(name, shape, dtype):
+    # Initializer of the workers: view the standardized matrix in shared memory without copying it
+    block = shared_memory.SharedMemory(name=name)
+    _shared['block'] = block
+    _shared['matrix'] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def _fit_k_seed(n_clusters, seed, backend, silhouette_sample_size, limit_threads):
+    # Fit one (k, seed) combination on the shared matrix and compute its metrics
+    matrix = _shared['matrix']
+    with threadpool_limits(limits=1 if limit_threads else None):
+        if backend == 'kmeans':
+            clustering_kmeans = KMeans(n_clusters=n_clusters, random_state=seed, n_init=1).fit(matrix)
+        else:
+            clustering_kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=seed, n_init=1).fit(matrix)
+        labels = clustering_kmeans.labels_
+        silhouette = sampled_silhouette_score(matrix, labels, sample_size=silhouette_sample_size, random_state=seed)
+        return {
+            'labels': labels.astype(np.int16),
+            'Inertia': clustering_kmeans.inertia_,
+            'Davies-Bouldin Index': davies_bouldin_score(matrix, labels),
+            'Silhouette Score': silhouette['Silhouette Score'],
+        }
+
+
+def label_stability(labels_by_seed):
+    """
+    Mean adjusted Rand index between the labels of every pair of seeds (1 means the same partition for every seed).
+
+    Args:
+        labels_by_seed (list of numpy.ndarray): The labels of the same rows obtained with different seeds.
+
+    Returns:
+        float: The mean pairwise ARI (NaN with fewer than two seeds).
+    """
+    pairs = list(itertools.combinations(labels_by_seed, 2))
+    if not pairs:
+        return np.nan
+    return float(np.mean([adjusted_rand_score(labels_a, labels_b) for labels_a, labels_b in pairs]))
+
+
+def plot_sweep(results, figure_file_path=None):
+    """
+    Plot the elbow (inertia), the Davies-Bouldin index, the silhouette score and the stability against k.
+
+    The figure is built with the object-oriented API and written in a background thread (see save_figure_async), so
+    nothing is displayed and no display is needed.
+
+    Args:
+        results (pandas.DataFrame): The table returned by sweep_k.
+        figure_file_path (str, optional): The file path to save the figure.
+
+    Returns:
+        matplotlib.figure.Figure: The figure.
+    """
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(20, 4))
+    axes = fig.subplots(nrows=1, ncols=4)
+    for ax, column in zip(axes, ['Inertia', 'Davies-Bouldin Index', 'Silhouette Score', 'Stability (ARI)']):
+        ax.errorbar(results['n_clusters'], results[column], yerr=results.get(f'{column} Std'), marker='o')
+        ax.set_title(column)
+        ax.set_xlabel('Number of clusters')
+    fig.suptitle('Selection of the number of clusters', fontsize=16)
+    if figure_file_path:
+        save_figure_async(fig, figure_file_path)
+    return fig
+
+
+def sweep_k(df, columns, k_range, seeds=(0, 1, 2), n_jobs=None, backend='kmeans', silhouette_sample_size=10000,
+            plot=False, figure_file_path=None):
+    """
+    Fit k-means for every number of clusters and seed in parallel, to choose the number of clusters.
+
+    The variables are standardized once and the standardized matrix is placed in shared memory, so that the worker
+    processes read it without copying it. Every (k, seed) combination is fitted with a single initialisation.
+
+    Args:
+        df (pandas.DataFrame): The input DataFrame.
+        columns (list of str): The variables used for the clustering.
+        k_range (iterable of int): The numbers of clusters to evaluate.
+        seeds (iterable of int, optional): The seeds of the k-means initialisation. Default is (0, 1, 2).
+        n_jobs (int, optional): The number of worker processes. Default is the number of cores.
+        backend (str, optional): 'kmeans' or 'minibatch' (see clustering_k_means). Default is 'kmeans'.
+        silhouette_sample_size (int, optional): The size of the stratified sample of the silhouette score. Default
+            is 10000.
+        plot (bool, optional): Whether to plot the metrics against k (see plot_sweep). Default is False.
+        figure_file_path (str, optional): The file path to save the figure (nothing is displayed).
+
+    Returns:
+        pandas.DataFrame: One row per number of clusters with the mean (and standard deviation across seeds) of the
+            inertia, the Davies-Bouldin index and the sampled silhouette score, and the stability of the labels
+            (mean pairwise adjusted Rand index across seeds).
+
+    Example:
+        >>> sweep_k(uk_hex_total, ['population_density', 'avg_age', 'avg_household_size'], range(2, 8))
+           n_clusters       Inertia  Inertia Std  ...  Stability (ARI)
+        0           2  1.532112e+06    12.470311  ...         1.000000
+        ...
+    """
+    if backend not in ('kmeans', 'minibatch'):
+        raise ValueError("backend must be 'kmeans' or 'minibatch'.")
+    k_range, seeds = list(k_range), list(seeds)
+    n_jobs = n_jobs or os.cpu_count()
+
+    # Standardize once into a shared memory block
+    matrix = StandardScaler().fit_transform(df[columns].to_numpy(dtype=np.float64))
+    block = shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1))
+    try:
+        shared_matrix = np.ndarray(matrix.shape, dtype=matrix.dtype, buffer=block.buf)
+        shared_matrix[:] = matrix
+        del matrix
+
+        combinations = list(itertools.product(k_range, seeds))
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_attach_shared_matrix,
+                                 initargs=(block.name, shared_matrix.shape, shared_matrix.dtype)) as executor:
+            futures = [executor.submit(_fit_k_seed, n_clusters, seed, backend, silhouette_sample_size, n_jobs > 1)
+                       for n_clusters, seed in combinations]
+            fits = dict(zip(combinations, [future.result() for future in futures]))
+        del shared_matrix
+    finally:
+        block.close()
+        block.unlink()
+
+    rows = []
+    for n_clusters in k_range:
+        fits_k = [fits[(n_clusters, seed)] for seed in seeds]
+        row = {'n_clusters': n_clusters}
+        for metric in ['Inertia', 'Davies-Bouldin Index', 'Silhouette Score']:
+            values = [fit[metric] for fit in fits_k]
+            row[metric] = np.mean(values)
+            row[f'{metric} Std'] = np.std(values)
+        row['Stability (ARI)'] = label_stability([fit['labels'] for fit in fits_k])
+        rows.append(row)
+    results = pd.DataFrame(rows)
+
+    if plot:
+        plot_sweep(results, figure_file_path=figure_file_path)
+    return results
@@ -0,0 +1,161 @@
+import json
+import string
+import numpy as np
+import h3.api.numpy_int as h3_int
+from src.h3_index import as_uint64_cells, uint64_to_h3
+
+# Standalone page drawing the hexagons in the browser with the H3HexagonLayer of deck.gl (h3-js computes the
+# boundaries from the ids), over an optional raster basemap
+_MAP_TEMPLATE = string.Template("""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>$title</title>
+<script src="https://unpkg.com/h3-js@^4.1.0"></script>
+<script src="https://unpkg.com/deck.gl@^9.0.0/dist.min.js"></script>
+<style>
+html, body, #map {margin: 0; width: 100%; height: 100%; overflow: hidden;}
+#legend {position: absolute; bottom: 20px; left: 10px; padding: 8px; background: white; font: 12px sans-serif;}
+#legend span {display: inline-block; width: 12px; height: 12px; margin-right: 6px;}
+#attribution {position: absolute; bottom: 0; right: 0; padding: 2px 4px; background: white; font: 10px sans-serif;}
+</style>
+</head>
+<body>
+<div id="map"></div>
+<div id="legend"></div>
+<div id="attribution">$attribution</div>
+<script>
+const cells = $cells;
+const colors = $colors;
+const names = $names;
+const tileUrl = $tile_url;
+
+// One row per hexagon, built from the ids grouped by label
+const data = [];
+Object.keys(cells).forEach(function (label) {
+  cells[label].forEach(function (hex) { data.push({hex: hex, label: Number(label)}); });
+});
+
+const layers = [];
+if (tileUrl) {
+  layers.push(new deck.TileLayer({
+    data: tileUrl, minZoom: 0, maxZoom: 19, tileSize: 256,
+    renderSubLayers: function (props) {
+      const box = props.tile.boundingBox;
+      return new deck.BitmapLayer(props, {data: null, image: props.data,
+                                          bounds: [box[0][0], box[0][1], box[1][0], box[1][1]]});
+    }
+  }));
+}
+layers.push(new deck.H3HexagonLayer({
+  id: 'hexagons', data: data, extruded: false, stroked: false, opacity: $opacity, pickable: true,
+  getHexagon: function (d) { return d.hex; },
+  getFillColor: function (d) { return colors[d.label]; }
+}));
+
+new deck.DeckGL({
+  container: 'map',
+  initialViewState: {longitude: $longitude, latitude: $latitude, zoom: $zoom},
+  controller: true,
+  layers: layers,
+  getTooltip: function (info) { return info.object && (info.object.hex + ': ' + names[info.object.label]); }
+});
+
+document.getElementById('legend').innerHTML = Object.keys(cells).map(function (label) {
+  return '<div><span style="background: rgb(' + colors[label].join(',') + ')"></span>' + names[label] + '</div>';
+}).join('');
+</script>
+</body>
+</html>
+""")
+
+
+def label_colors(labels, colors):
+    """
+    Get the color of every hexagon from its cluster label with a single NumPy lookup.
+
+    Args:
+        labels (array-like): The integer cluster label of each hexagon.
+        colors (list): The color of each label (e.g. matplotlib color names), indexed by label.
+
+    Returns:
+        numpy.ndarray: The color of each hexagon.
+
+    Example:
+        >>> uk_hex_total['color'] = label_colors(uk_hex_total['label_6_tier'], ['red', 'maroon', 'dodgerblue'])
+    """
+    labels = np.asarray(labels)
+    if len(labels) and (labels.min() < 0 or labels.max() >= len(colors)):
+        raise ValueError("The number of colors must be greater than the largest label.")
+    return np.asarray(colors, dtype=object)[labels.astype(np.intp)]
+
+
+def export_h3_map(hex_ids, labels, file_path, colors, names=None, title='Clustering of hexagons', center=None,
+                  zoom=6, tile_url=None, attribution='', opacity=0.6):
+    """
+    Write an interactive map of the cluster labels of H3 hexagons as a standalone HTML page, drawn with the
+    H3HexagonLayer of deck.gl.
+
+    Only the H3 ids (grouped by label) are written to the page, and the browser computes the hexagons from them
+    with h3-js and draws them on the GPU. The file is more than 10 times smaller than a folium GeoJson layer with
+    the polygons, and it stays interactive with the millions of hexagons of resolution 8. Viewing the page requires
+    internet access to load deck.gl and h3-js.
+
+    Args:
+        hex_ids (array-like): H3 ids as strings or integers (e.g. the 'index' column of the feature store).
+        labels (array-like): The integer cluster label of each hexagon.
+        file_path (str): Path of the HTML file to write.
+        colors (list): The color of each label (e.g. matplotlib color names), indexed by label.
+        names (list of str, optional): The name of each label, shown in the legend and the tooltips. Default is
+            the labels.
+        title (str, optional): The title of the page. Default is 'Clustering of hexagons'.
+        center (tuple, optional): The (latitude, longitude) at the center of the initial view. Default is the
+            mean position of the hexagons.
+        zoom (float, optional): The initial zoom level. Default is 6.
+        tile_url (str, optional): URL template of a raster basemap with {z}, {x} and {y} placeholders. Default is
+            None (no basemap).
+        attribution (str, optional): Attribution of the basemap. Default is ''.
+        opacity (float, optional): The opacity of the hexagons. Default is 0.6.
+
+    Returns:
+        str: The path of the written file.
+
+    Example:
+        >>> export_h3_map(uk_hex_total['index'], uk_hex_total['label_6_tier'],
+        ...               '../../outputs/01_weighted_interpolation/figures/uk_cluster_6_tier_map.html',
+        ...               colors=['red', 'maroon', 'dodgerblue', 'greenyellow', 'forestgreen', 'orange'])
+    """
+    from matplotlib.colors import to_rgb
+
+    cells = as_uint64_cells(hex_ids)
+    labels = np.asarray(labels).astype(np.int64)
+    if len(labels) and (labels.min() < 0 or labels.max() >= len(colors)):
+        raise ValueError("The number of colors must be greater than the largest label.")
+    names = [str(label) for label in range(len(colors))] if names is None else list(names)
+
+    # Ids grouped by label, so the labels are not repeated for every hexagon
+    order = np.argsort(labels, kind='stable')
+    unique_labels, starts = np.unique(labels[order], return_index=True)
+    hex_strings = uint64_to_h3(cells[order]).tolist()
+    bounds = list(starts[1:]) + [len(order)]
+    cells_by_label = {int(label): hex_strings[start:end] for label, start, end in zip(unique_labels, starts, bounds)}
+
+    if center is None and len(cells):
+        # Mean position of a sample of hexagons
+        center = np.mean([h3_int.h3_to_geo(cell) for cell in cells[::max(1, len(cells) // 1000)].tolist()], axis=0)
+    latitude, longitude = center if center is not None else (0, 0)
+
+    html = _MAP_TEMPLATE.substitute(
+        title=title,
+        attribution=attribution,
+        cells=json.dumps(cells_by_label, separators=(',', ':')),
+        colors=json.dumps([[round(255 * channel) for channel in to_rgb(color)] for color in colors]),
+        names=json.dumps(names),
+        tile_url=json.dumps(tile_url),
+        opacity=float(opacity),
+        longitude=float(longitude),
+        latitude=float(latitude),
+        zoom=float(zoom))
+    with open(file_path, 'w', encoding='utf-8') as file:
+        file.write(html)
+    return file_path
@@ -0,0 +1,138 @@
+import os
+import shutil
+import pandas as pd
+
+DEFAULT_BATCH_SIZE = 50000
+
+
+def _with_default_projection(projection):
+    # Never transfer the MongoDB '_id' unless it is explicitly requested
+    projection = dict(projection or {})
+    projection.setdefault('_id', 0)
+    return projection
+
+
+def iter_collection_chunks(collection, query=None, projection=None, batch_size=DEFAULT_BATCH_SIZE, normalize=False):
+    """
+    Stream a MongoDB collection as a sequence of DataFrame chunks of bounded size.
+
+    Args:
+        collection (pymongo.collection.Collection): The collection to read.
+        query (dict, optional): Filter applied server-side. Default is {} (all documents).
+        projection (dict, optional): Projection applied server-side, e.g. {'geojson': 0} to drop the geometry.
+            '_id' is excluded unless the projection explicitly includes it.
+        batch_size (int, optional): Number of documents per chunk (and per cursor batch). Default is 50000.
+        normalize (bool, optional): Whether to flatten nested documents with pandas.json_normalize (nested keys
+            become 'parent.child' columns) instead of building the chunk with pandas.DataFrame. Default is False.
+
+    Yields:
+        pandas.DataFrame: One chunk of at most batch_size documents.
+
+    Example:
+        >>> for chunk in iter_collection_chunks(db.landuse, projection={'geojson': 0}, batch_size=10000):
+        ...     print(chunk.columns.tolist())
+        ['index', 'type', 'area']
+    """
+    cursor = collection.find(query or {}, _with_default_projection(projection), batch_size=batch_size)
+    to_frame = pd.json_normalize if normalize else pd.DataFrame
+
+    docs = []
+    for doc in cursor:
+        docs.append(doc)
+        if len(docs) == batch_size:
+            yield to_frame(docs)
+            docs = []
+    if docs:
+        yield to_frame(docs)
+
+
+def read_collection(collection, query=None, projection=None, batch_size=DEFAULT_BATCH_SIZE, normalize=False,
+                    transform=None):
+    """
+    Read a MongoDB collection into a single DataFrame, applying an optional transformation chunk by chunk.
+
+    Only the (transformed) chunks are kept in memory, never the raw list of documents, so this is suitable for
+    collections whose projected or transformed form fits in memory.
+
+    Args:
+        collection (pymongo.collection.Collection): The collection to read.
+        query (dict, optional): Filter applied server-side.
+        projection (dict, optional): Projection applied server-side ('_id' is excluded by default).
+        batch_size (int, optional): Number of documents per chunk. Default is 50000.
+        normalize (bool, optional): Whether to flatten nested documents with pandas.json_normalize.
+        transform (callable, optional): Function applied to each chunk (DataFrame -> DataFrame).
+
+    Returns:
+        pandas.DataFrame: The concatenation of all the (transformed) chunks.
+    """
+    chunks = iter_collection_chunks(collection, query=query, projection=projection, batch_size=batch_size,
+                                    normalize=normalize)
+    if transform is not None:
+        chunks = (transform(chunk) for chunk in chunks)
+    chunks = list(chunks)
+    if not chunks:
+        return pd.DataFrame()
+    return pd.concat(chunks, ignore_index=True)
+
+
+def extract_collection(collection, directory, query=None, projection=None, batch_size=DEFAULT_BATCH_SIZE,
+                       normalize=False, transform=None):
+    """
+    Stream a MongoDB collection to disk as a directory of Parquet chunks.
+
+    Each batch of documents is converted to a DataFrame, optionally transformed, and written to its own Parquet
+    file before the next batch is fetched, so peak memory is bounded by batch_size regardless of the size of the
+    collection.
+
+    Args:
+        collection (pymongo.collection.Collection): The collection to read.
+        directory (str): Output directory. Any previous content is removed.
+        query (dict, optional): Filter applied server-side.
+        projection (dict, optional): Projection applied server-side ('_id' is excluded by default).
+        batch_size (int, optional): Number of documents per chunk. Default is 50000.
+        normalize (bool, optional): Whether to flatten nested documents with pandas.json_normalize.
+        transform (callable, optional): Function applied to each chunk (DataFrame -> DataFrame) before writing,
+            e.g. to reduce nested road features to a few length columns.
+
+    Returns:
+        int: The number of chunks written.
+
+    Example:
+        >>> extract_collection(db.landuse, '../../../data/filter/staging/landuse_h8', projection={'geojson': 0})
+        3
+        >>> df_landuse = read_extracted('../../../data/filter/staging/landuse_h8')
+    """
+    if os.path.isdir(directory):
+        shutil.rmtree(directory)
+    os.makedirs(directory)
+
+    n_chunks = 0
+    for chunk in iter_collection_chunks(collection, query=query, projection=projection, batch_size=batch_size,
+                                        normalize=normalize):
+        if transform is not None:
+            chunk = transform(chunk)
+        chunk.reset_index(drop=True).to_parquet(os.path.join(directory, f'part-{n_chunks:05d}.parquet'),
+                                                index=False)
+        n_chunks += 1
+    return n_chunks
+
+
+def read_extracted(directory, columns=None):
+    """
+    Read the Parquet chunks written by extract_collection back into a single DataFrame.
+
+    Chunks may have different columns (e.g. a road type that only appears in some batches); missing values are
+    filled with NaN.
+
+    Args:
+        directory (str): Directory written by extract_collection.
+        columns (list of str, optional): Columns to read. Default is all columns.
+
+    Returns:
+        pandas.DataFrame: The concatenation of all the chunks.
+    """
+    part_files = sorted(name for name in os.listdir(directory) if name.endswith('.parquet'))
+    chunks = [pd.read_parquet(os.path.join(directory, name), columns=columns) for name in part_files]
+    if not chunks:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(chunks, ignore_index=True)
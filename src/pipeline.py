@@ -0,0 +1,245 @@
+import os
+import sys
+import json
+import time
+import runpy
+import argparse
+import tomllib
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+# Root of the repository (the analysis scripts are run from their own directory, with the repository on sys.path)
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Environment variable with the parameters of the stage run by the pipeline (see pipeline_parameter)
+PARAMETERS_VARIABLE = 'HEXCLUST_PARAMETERS'
+
+# Directory of the extraction scripts and resolution of the extracted hexagons of each variant
+VARIANT_DIRECTORIES = {'weighted': '01_weighted_interpolation', 'uniform': '02_uniform_interpolation'}
+EXTRACTION_RESOLUTIONS = {'weighted': 8, 'uniform': 7}
+PYRAMID_SCRIPTS = {'weighted': '06_feature-pyramid.py', 'uniform': '05_feature-pyramid.py'}
+
+# Stages of each variant: script (relative to analyses/) and dependencies
+VARIANT_STAGES = {
+    'census': {'script': '01_feature_extraction/{directory}/01_census-feature-extraction.py', 'depends_on': []},
+    'landuse': {'script': '01_feature_extraction/{directory}/02_osm-landuse-feature-extraction.py', 'depends_on': []},
+    'road': {'script': '01_feature_extraction/{directory}/03_osm-road-feature-extraction.py', 'depends_on': []},
+    'merge': {'script': '01_feature_extraction/{directory}/04_merge-features.py',
+              'depends_on': ['census', 'landuse', 'road']},
+    'pyramid': {'script': '01_feature_extraction/{directory}/{pyramid_script}', 'depends_on': ['merge']},
+    'first_step': {'script': '02_clustering/01_clustering-first-step-analysis.py', 'depends_on': ['pyramid']},
+    'second_step': {'script': '02_clustering/02_clustering-second-step-analysis.py', 'depends_on': ['first_step']},
+    'visualization': {'script': '02_clustering/03_clustering-outcome.py', 'depends_on': ['second_step']},
+    'tiles': {'script': '02_clustering/04_clustering-vector-tiles.py', 'depends_on': ['second_step']},
+    'regions': {'script': '02_clustering/05_clustering-class-regions.py', 'depends_on': ['second_step']},
+}
+# Stage run once for all the variants
+EVALUATION_STAGE = {'script': '02_clustering/06_clustering-evaluation.py', 'depends_on': ['second_step']}
+DEFAULT_STAGES = ['census', 'landuse', 'road', 'merge', 'pyramid', 'first_step', 'second_step', 'visualization',
+                  'evaluation']
+
+
+def pipeline_parameter(name, default=None):
+    """
+    Get a parameter of the stage being run by the pipeline, or a default value when the script is run by hand.
+
+    Args:
+        name (str): The name of the parameter (e.g. 'resolution').
+        default (object, optional): The value used outside the pipeline or if the parameter is not set. Default is
+            None.
+
+    Returns:
+        object: The value of the parameter.
+
+    Example:
+        >>> resolution_id = pipeline_parameter('resolution', 8 if user_input == 'weighted' else 7)
+    """
+    return json.loads(os.environ.get(PARAMETERS_VARIABLE, '{}')).get(name, default)
+
+
+def load_config(file_path):
+    """
+    Read the configuration of a pipeline run from a TOML or JSON file.
+
+    Args:
+        file_path (str): Path to the configuration file.
+
+    Returns:
+        dict: The configuration.
+    """
+    if file_path.endswith('.json'):
+        with open(file_path) as file:
+            return json.load(file)
+    with open(file_path, 'rb') as file:
+        return tomllib.load(file)
+
+
+def build_stages(config):
+    """
+    Build the DAG of the stages of a pipeline run from its configuration.
+
+    The stages of each variant are named '<variant>:<stage>' (e.g. 'weighted:census') and only depend on stages of
+    the same variant, so the variants run concurrently; the evaluation stage compares all the variants. The
+    'pyramid' stage is only part of the DAG when the clustering resolution is coarser than the extraction
+    resolution. Dependencies on stages that are not selected are dropped: their outputs are read from disk.
+
+    Args:
+        config (dict): The configuration: 'variants' (list of 'weighted' and/or 'uniform'), optionally
+            'resolution' (the clustering resolution of each variant, e.g. {'weighted': 8}; default is the extraction
+            resolution), 'stages' (the names of the stages to run; default is DEFAULT_STAGES), 'scores' (the scores
+            printed by the second step; default is '1 2'), 'n_jobs' (the number of processes used within each stage
+            that supports it, see run_pipeline) and 'parameters' (any other parameter passed to all the stages).
+
+    Returns:
+        dict: For each stage, its 'script' (absolute path), 'depends_on' and 'parameters' (read by the script with
+            pipeline_parameter).
+    """
+    variants = list(config.get('variants', ['weighted']))
+    selected = list(config.get('stages', DEFAULT_STAGES))
+    resolutions = {variant: EXTRACTION_RESOLUTIONS[variant] for variant in variants}
+    resolutions.update(config.get('resolution', {}))
+    unknown = set(selected) - set(VARIANT_STAGES) - {'evaluation'}
+    if unknown or set(variants) - set(VARIANT_DIRECTORIES):
+        raise ValueError(f"Unknown stages or variants: {sorted(unknown | (set(variants) - set(VARIANT_DIRECTORIES)))}")
+
+    stages = {}
+    for variant in variants:
+        if not 0 <= resolutions[variant] <= EXTRACTION_RESOLUTIONS[variant]:
+            raise ValueError(f"The resolution of the '{variant}' variant must be between 0 and "
+                             f"{EXTRACTION_RESOLUTIONS[variant]} (the resolution of the extracted hexagons).")
+        with_pyramid = resolutions[variant] < EXTRACTION_RESOLUTIONS[variant]
+        parameters = {**config.get('parameters', {}), 'variant': variant, 'resolution': resolutions[variant],
+                      'scores': str(config.get('scores', '1 2')), 'serve': False}
+        for name, stage in VARIANT_STAGES.items():
+            if name not in selected or (name == 'pyramid' and not with_pyramid):
+                continue
+            # The clustering starts from the merged features when there is no pyramid
+            depends_on = ['merge' if dependency == 'pyramid' and not with_pyramid else dependency
+                          for dependency in stage['depends_on']]
+            script = stage['script'].format(directory=VARIANT_DIRECTORIES[variant],
+                                            pyramid_script=PYRAMID_SCRIPTS[variant])
+            stages[f'{variant}:{name}'] = {
+                'script': os.path.join(REPO_ROOT, 'analyses', script),
+                'depends_on': [f'{variant}:{dependency}' for dependency in depends_on if dependency in selected],
+                'parameters': parameters}
+
+    if 'evaluation' in selected:
+        stages['evaluation'] = {
+            'script': os.path.join(REPO_ROOT, 'analyses', EVALUATION_STAGE['script']),
+            'depends_on': [f'{variant}:{dependency}' for variant in variants
+                           for dependency in EVALUATION_STAGE['depends_on'] if dependency in selected],
+            'parameters': {**config.get('parameters', {}), 'variants': variants, 'resolutions': resolutions}}
+    return stages
+
+
+def _run_stage(script, parameters, log_file_path):
+    # Worker task: run an analysis script from its own directory with the parameters of the stage (the scripts read
+    # them with pipeline_parameter instead of asking for them with input()), writing its output to a log file
+    os.environ[PARAMETERS_VARIABLE] = json.dumps(parameters)
+    # Figures are rendered headless, and a remaining input() call fails instead of waiting for the terminal
+    os.environ['MPLBACKEND'] = 'Agg'
+    sys.stdin = open(os.devnull)
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(os.path.dirname(script))
+    with open(log_file_path, 'w') as log_file, redirect_stdout(log_file), redirect_stderr(log_file):
+        try:
+            runpy.run_path(script, run_name='__main__')
+        except BaseException:
+            traceback.print_exc()
+            raise
+
+
+def run_pipeline(config, max_workers=None, dry_run=False):
+    """
+    Run the stages of a pipeline as a DAG: each stage starts as soon as all its dependencies have finished, so
+    independent stages (e.g. the census, landuse and road extractions, or two variants) run concurrently.
+
+    Every stage runs in a fresh worker process, from the directory of its script, without blocking on input(). Its
+    output is written to '<log_directory>/<stage>.log' (config 'log_directory', default 'outputs/logs'). When a
+    stage fails, the stages that depend on it are skipped and the others carry on. Unless config 'n_jobs' is set,
+    the cores are shared by the stages run at the same time: each stage uses at most cores // max_workers
+    processes.
+
+    Args:
+        config (dict): The configuration of the run (see build_stages).
+        max_workers (int, optional): The number of stages run at the same time. Default is config 'max_workers',
+            or the number of stages without dependencies.
+        dry_run (bool, optional): Whether to only print the stages in the order they would start. Default is False.
+
+    Returns:
+        dict: The status of each stage: 'done', 'failed' or 'skipped' ('planned' with dry_run).
+
+    Example:
+        >>> run_pipeline(load_config('configs/pipeline.toml'))
+    """
+    stages = build_stages(config)
+    if dry_run:
+        status = {}
+        while len(status) < len(stages):
+            ready = [name for name, stage in stages.items()
+                     if name not in status and all(dependency in status for dependency in stage['depends_on'])]
+            print(', '.join(ready))
+            status.update({name: 'planned' for name in ready})
+        return status
+
+    log_directory = os.path.join(REPO_ROOT, config.get('log_directory', 'outputs/logs'))
+    os.makedirs(log_directory, exist_ok=True)
+    max_workers = max_workers or config.get('max_workers') or \
+        max(1, sum(not stage['depends_on'] for stage in stages.values()))
+    n_jobs = config.get('n_jobs') or max(1, (os.cpu_count() or 1) // max_workers)
+    for stage in stages.values():
+        stage['parameters'] = {**stage['parameters'], 'n_jobs': n_jobs}
+
+    status, running, pending = {}, {}, list(stages)
+    # A fresh process per stage, so that the stages do not share imported modules or figures
+    with ProcessPoolExecutor(max_workers=max_workers, max_tasks_per_child=1) as executor:
+        while pending or running:
+            for name in list(pending):
+                dependencies = [status.get(dependency) for dependency in stages[name]['depends_on']]
+                if any(state in ('failed', 'skipped') for state in dependencies):
+                    status[name] = 'skipped'
+                    pending.remove(name)
+                    print(f"{time.strftime('%H:%M:%S')} skipped {name}")
+                elif all(state == 'done' for state in dependencies):
+                    stage = stages[name]
+                    log_file_path = os.path.join(log_directory, f"{name.replace(':', '_')}.log")
+                    running[executor.submit(_run_stage, stage['script'], stage['parameters'], log_file_path)] = name
+                    pending.remove(name)
+                    print(f"{time.strftime('%H:%M:%S')} started {name}")
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                status[name] = 'failed' if future.exception() is not None else 'done'
+                print(f"{time.strftime('%H:%M:%S')} {status[name]} {name}"
+                      + (f" ({future.exception()!r}, see the log)" if future.exception() is not None else ''))
+    return status
+
+
+def main(argv=None):
+    """
+    Command line entry point of the pipeline: python -m hexclust run --config configs/pipeline.toml
+    """
+    parser = argparse.ArgumentParser(prog='hexclust', description='Run the clustering pipeline of the UK hexagons.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help='Run the stages of the pipeline as a DAG.')
+    run_parser.add_argument('--config', required=True, help='TOML or JSON configuration file.')
+    run_parser.add_argument('--variants', nargs='+', choices=sorted(VARIANT_DIRECTORIES),
+                            help='Variants to run (overrides the configuration).')
+    run_parser.add_argument('--resolution', type=int,
+                            help='Clustering resolution of all the variants (overrides the configuration).')
+    run_parser.add_argument('--stages', nargs='+', help='Stages to run (overrides the configuration).')
+    run_parser.add_argument('--max-workers', type=int, help='Number of stages run at the same time.')
+    run_parser.add_argument('--dry-run', action='store_true', help='Only print the order of the stages.')
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    if args.variants:
+        config['variants'] = args.variants
+    if args.resolution is not None:
+        config['resolution'] = {variant: args.resolution for variant in config.get('variants', ['weighted'])}
+    if args.stages:
+        config['stages'] = args.stages
+    status = run_pipeline(config, max_workers=args.max_workers, dry_run=args.dry_run)
+    return 0 if all(state in ('done', 'planned') for state in status.values()) else 1
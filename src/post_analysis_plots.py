@@ -0,0 +1,180 @@
+import atexit
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+DENSITY_METHODS = ('histogram', 'kde')
+
+# Single background thread writing the figures, so that batch runs are not blocked by the rendering
+_figure_writer = None
+_pending_figures = []
+
+
+def _reset_figure_writer():
+    # A forked child (e.g. a worker of a process pool) inherits the writer but not its thread: the child starts
+    # its own writer instead of submitting figures that would never be written
+    global _figure_writer
+    _figure_writer = None
+    _pending_figures.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_figure_writer)
+
+
+def _write_figure(fig, figure_file_path):
+    # Render with the Agg canvas, which does not need a display nor pyplot
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    FigureCanvasAgg(fig)
+    fig.tight_layout()
+    fig.savefig(figure_file_path)
+    return figure_file_path
+
+
+def save_figure_async(fig, figure_file_path):
+    """
+    Write a matplotlib figure to disk in a background thread.
+
+    Args:
+        fig (matplotlib.figure.Figure): The figure, created with the object-oriented API (not with pyplot).
+        figure_file_path (str): The file path of the image.
+
+    Returns:
+        concurrent.futures.Future: Resolves to the file path once the figure is written.
+    """
+    global _figure_writer
+    if _figure_writer is None:
+        _figure_writer = ThreadPoolExecutor(max_workers=1)
+        atexit.register(wait_for_figures)
+    future = _figure_writer.submit(_write_figure, fig, figure_file_path)
+    _pending_figures.append(future)
+    return future
+
+
+def wait_for_figures():
+    """
+    Wait until every figure submitted to save_figure_async is written.
+
+    Returns:
+        list of str: The file paths of the written figures.
+    """
+    written = [future.result() for future in _pending_figures]
+    _pending_figures.clear()
+    return written
+
+
+def density_estimates(df, columns, label_column_name, method='kde', bins=100, kde_sample_size=10000,
+                      random_state=0):
+    """
+    Estimate the density of each variable in each cluster, going once over the rows of every cluster.
+
+    The rows are grouped by label with a single groupby. The densities are either fixed-bin histograms (with the
+    same bins for every cluster) or Gaussian KDEs fitted on a sample of at most kde_sample_size rows per cluster,
+    evaluated on a common grid.
+
+    Args:
+        df (pandas.DataFrame): The clustered DataFrame.
+        columns (list of str): The variables.
+        label_column_name (str): The column with the cluster labels.
+        method (str, optional): 'histogram' or 'kde'. Default is 'kde'.
+        bins (int, optional): The number of bins of the histograms or of points of the KDE grid. Default is 100.
+        kde_sample_size (int, optional): The maximum number of rows of each cluster used to fit its KDE. Default is
+            10000.
+        random_state (int, optional): Seed of the KDE samples. Default is 0.
+
+    Returns:
+        dict: For each variable, {'x': the bin centers or grid points, 'density': {label: density at x}}.
+
+    Example:
+        >>> densities = density_estimates(uk_hex_total, ['population_density'], 'label_3_tier', method='histogram')
+        >>> densities['population_density']['density'][0]
+        array([2.1e-04, ...])
+    """
+    if method not in DENSITY_METHODS:
+        raise ValueError(f"method must be one of {DENSITY_METHODS}.")
+    values = df[columns].to_numpy(dtype=np.float64)
+    low, high = np.nanmin(values, axis=0), np.nanmax(values, axis=0)
+    if method == 'histogram':
+        edges = [np.linspace(low[i], high[i], bins + 1) for i in range(len(columns))]
+        grids = [(edge[:-1] + edge[1:]) / 2 for edge in edges]
+    else:
+        from scipy.stats import gaussian_kde
+        margin = 0.1 * (high - low)
+        grids = [np.linspace(low[i] - margin[i], high[i] + margin[i], bins) for i in range(len(columns))]
+
+    densities = {column: {'x': grids[i], 'density': {}} for i, column in enumerate(columns)}
+    for label, group in df.groupby(label_column_name)[columns]:
+        if method == 'kde' and len(group) > kde_sample_size:
+            group = group.sample(n=kde_sample_size, random_state=random_state)
+        group_values = group.to_numpy(dtype=np.float64)
+        for i, column in enumerate(columns):
+            column_values = group_values[:, i]
+            column_values = column_values[~np.isnan(column_values)]
+            if method == 'histogram':
+                density = np.histogram(column_values, bins=edges[i], density=True)[0] if len(column_values) \
+                    else np.zeros(bins)
+            elif len(column_values) > 1 and np.ptp(column_values) > 0:
+                density = gaussian_kde(column_values)(grids[i])
+            else:
+                density = np.zeros(bins)
+            densities[column]['density'][label] = density
+    return densities
+
+
+def plot_post_analysis(df, columns, label_column_name, colors_plot, figure_file_path=None, density_method='kde',
+                       bins=100, kde_sample_size=10000, show_plot=False):
+    """
+    Plot the density of each variable by cluster label.
+
+    The figure is created with the object-oriented API of matplotlib (imported only here) and written in a
+    background thread (see save_figure_async), so nothing is displayed or blocks unless show_plot=True.
+
+    Args:
+        df (pandas.DataFrame): The clustered DataFrame.
+        columns (list of str): The variables to plot.
+        label_column_name (str): The column with the cluster labels.
+        colors_plot (list of str): The color of each cluster label.
+        figure_file_path (str, optional): The file path to save the figure.
+        density_method (str, optional): 'histogram' or 'kde', see density_estimates. Default is 'kde'.
+        bins (int, optional): The number of bins or of grid points. Default is 100.
+        kde_sample_size (int, optional): The maximum number of rows of each cluster used for its KDE. Default is
+            10000.
+        show_plot (bool, optional): Whether to display the figure with pyplot (blocking). Default is False.
+
+    Returns:
+        matplotlib.figure.Figure: The figure.
+    """
+    densities = density_estimates(df, columns, label_column_name, method=density_method, bins=bins,
+                                  kde_sample_size=kde_sample_size)
+
+    # Calculate the number of rows and columns based on the number of variables
+    num_plots = len(columns)
+    num_cols = min(3, num_plots)
+    num_rows = -(-num_plots // num_cols)  # Ceiling division to ensure enough rows
+    if show_plot:
+        import matplotlib.pyplot as plt
+        fig = plt.figure(figsize=(15, 5))
+    else:
+        from matplotlib.figure import Figure
+        fig = Figure(figsize=(15, 5))
+    axes = fig.subplots(nrows=num_rows, ncols=num_cols, squeeze=False).ravel()
+
+    for ax, var in zip(axes, columns):
+        for group_label, density in densities[var]['density'].items():
+            ax.plot(densities[var]['x'], density, label=group_label, color=colors_plot[group_label])
+        # Set title and legend for each subplot
+        ax.set_title(f'Density Plot of {var}')
+        ax.set_ylabel('Density')
+        ax.legend()
+
+    # Add overall title
+    fig.suptitle("Clustering post-analysis", fontsize=16)
+    if show_plot:
+        # Write the figure before displaying it, pyplot figures must stay in the main thread
+        if figure_file_path:
+            fig.tight_layout()
+            fig.savefig(figure_file_path)
+        plt.show()
+    elif figure_file_path:
+        save_figure_async(fig, figure_file_path)
+    return fig
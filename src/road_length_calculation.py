@@ -1,13 +1,140 @@
+import numpy as np
+import pandas as pd
 from geopy.distance import geodesic
 
+# Parameters of the WGS-84 ellipsoid (metres)
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+WGS84_E2 = WGS84_F * (2 - WGS84_F)
+# Mean Earth radius (IUGG) used by the spherical approximation
+MEAN_EARTH_RADIUS = 6371008.8
 
-def segment_length(coordinates_element):
+LENGTH_METHODS = ('vincenty', 'ellipsoidal', 'haversine')
+
+
+def _vincenty_inverse(lat1, lon1, lat2, lon2, tolerance=1e-12, max_iterations=200):
+    """
+    Vectorized Vincenty inverse formula on the WGS-84 ellipsoid.
+
+    Args:
+        lat1, lon1, lat2, lon2 (numpy.ndarray): Coordinates of the segment end points in degrees.
+        tolerance (float, optional): Convergence threshold on the longitude on the auxiliary sphere (radians).
+        max_iterations (int, optional): Maximum number of iterations of the fixed-point scheme.
+
+    Returns:
+        numpy.ndarray: Distances in metres. Points for which the iteration did not converge (nearly antipodal
+            points, which never occur within a road segment) are recomputed with geopy's Karney solver.
+    """
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    big_l = np.radians(lon2 - lon1)
+    u1 = np.arctan((1 - WGS84_F) * np.tan(phi1))
+    u2 = np.arctan((1 - WGS84_F) * np.tan(phi2))
+    sin_u1, cos_u1 = np.sin(u1), np.cos(u1)
+    sin_u2, cos_u2 = np.sin(u2), np.cos(u2)
+
+    lam = big_l.copy()
+    converged = np.zeros(lam.shape, dtype=bool)
+    # Initialise the outputs of the loop so that they are always defined
+    sin_sigma = cos_sigma = sigma = cos2_alpha = cos_2sigma_m = np.zeros(lam.shape)
+
+    for _ in range(max_iterations):
+        sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+        sin_sigma = np.hypot(cos_u2 * sin_lam, cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam)
+        cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+        sigma = np.arctan2(sin_sigma, cos_sigma)
+        # Coincident points have sin_sigma = 0, guard the divisions below
+        safe_sin_sigma = np.where(sin_sigma == 0, 1.0, sin_sigma)
+        sin_alpha = cos_u1 * cos_u2 * sin_lam / safe_sin_sigma
+        cos2_alpha = 1 - sin_alpha ** 2
+        # Equatorial lines have cos2_alpha = 0, in which case cos_2sigma_m is set to 0
+        safe_cos2_alpha = np.where(cos2_alpha == 0, 1.0, cos2_alpha)
+        cos_2sigma_m = np.where(cos2_alpha == 0, 0.0, cos_sigma - 2 * sin_u1 * sin_u2 / safe_cos2_alpha)
+        c = WGS84_F / 16 * cos2_alpha * (4 + WGS84_F * (4 - 3 * cos2_alpha))
+        lam_prev = lam
+        lam = big_l + (1 - c) * WGS84_F * sin_alpha * (
+            sigma + c * sin_sigma * (cos_2sigma_m + c * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)))
+        converged = np.abs(lam - lam_prev) <= tolerance
+        if converged.all():
+            break
+
+    u_sq = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    big_a = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    big_b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = big_b * sin_sigma * (cos_2sigma_m + big_b / 4 * (
+        cos_sigma * (-1 + 2 * cos_2sigma_m ** 2) -
+        big_b / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)))
+    dist = WGS84_B * big_a * (sigma - delta_sigma)
+
+    # Fall back to the (slow but always convergent) Karney solver for the few non-converged pairs
+    for i in np.flatnonzero(~converged):
+        dist[i] = geodesic((lat1[i], lon1[i]), (lat2[i], lon2[i])).m
+    return dist
+
+
+def _ellipsoidal_approximation(lat1, lon1, lat2, lon2):
+    """
+    Local flat-ellipsoid approximation using the radii of curvature at the mid latitude of each segment.
+    """
+    phi_m = np.radians((lat1 + lat2) / 2)
+    w = 1 - WGS84_E2 * np.sin(phi_m) ** 2
+    # Meridional (M) and prime vertical (N) radii of curvature
+    radius_m = WGS84_A * (1 - WGS84_E2) / w ** 1.5
+    radius_n = WGS84_A / np.sqrt(w)
+    d_lon = (lon2 - lon1 + 180) % 360 - 180
+    dx = radius_n * np.cos(phi_m) * np.radians(d_lon)
+    dy = radius_m * np.radians(lat2 - lat1)
+    return np.hypot(dx, dy)
+
+
+def _haversine(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance on a sphere of radius MEAN_EARTH_RADIUS.
+    """
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lam = np.radians(lon2 - lon1)
+    h = np.sin(d_phi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(d_lam / 2) ** 2
+    return 2 * MEAN_EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(h, 0, 1)))
+
+
+def pairwise_geodesic_length(lat1, lon1, lat2, lon2, method='vincenty'):
+    """
+    Compute the length of many segments at once on the WGS-84 ellipsoid.
+
+    Args:
+        lat1, lon1, lat2, lon2 (array-like): Coordinates of the start and end point of each segment in degrees.
+        method (str, optional): Distance formula. Default is 'vincenty'.
+            - 'vincenty': Vincenty inverse formula on the WGS-84 ellipsoid. Agrees with geopy's Karney geodesic
+              to better than 0.1 mm for any pair of points that are not nearly antipodal.
+            - 'ellipsoidal': local flat-ellipsoid approximation using the meridional and prime vertical radii of
+              curvature at the mid latitude. The error grows with the square of the segment length: the relative
+              error is below 1e-8 for segments shorter than 1 km (OSM road segments are typically much shorter)
+              and below 2e-6 for segments up to 40 km.
+            - 'haversine': great-circle distance on a sphere of mean Earth radius. Ignores the flattening, so
+              the relative error is up to 0.5% (up to 0.35% at UK latitudes), independently of the length.
+
+    Returns:
+        numpy.ndarray: The length of each segment in meters.
+    """
+    lat1, lon1, lat2, lon2 = (np.asarray(x, dtype=np.float64) for x in (lat1, lon1, lat2, lon2))
+    if method == 'vincenty':
+        return _vincenty_inverse(lat1, lon1, lat2, lon2)
+    elif method == 'ellipsoidal':
+        return _ellipsoidal_approximation(lat1, lon1, lat2, lon2)
+    elif method == 'haversine':
+        return _haversine(lat1, lon1, lat2, lon2)
+    raise ValueError(f"Unknown method '{method}'. Choose one of {LENGTH_METHODS}.")
+
+
+def segment_length(coordinates_element, method='vincenty'):
     """
     Calculate the total length of a path defined by a sequence of coordinates.
 
     Args:
         coordinates_element (list of tuples): A list of coordinate tuples representing a path.
             Each tuple should contain two elements: latitude and longitude (in that order).
+        method (str, optional): Distance formula, see pairwise_geodesic_length. Default is 'vincenty'.
 
     Returns:
         float: The total length of the path in meters.
@@ -17,8 +144,153 @@ def segment_length(coordinates_element):
         >>> segment_length(coordinates)
         1474317.640126704
     """
-    dist = [geodesic(coord1, coord2).m for coord1, coord2 in zip(coordinates_element, coordinates_element[1:])]
-    return sum(dist)
+    if len(coordinates_element) < 2:
+        return 0.0
+    coords = np.asarray(coordinates_element, dtype=np.float64)
+    dist = pairwise_geodesic_length(coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1], method=method)
+    return float(dist.sum())
+
+
+def flatten_road_features(rows, road_types=None):
+    """
+    Flatten the road features of many hexagons into contiguous NumPy arrays.
+
+    Args:
+        rows (iterable of list of dict): One list of road features per hexagon, with the structure described in
+            road_length.
+        road_types (list of str, optional): Road types to keep. Features of any other type are skipped. If None,
+            every type found in the data is kept.
+
+    Returns:
+        dict: A dictionary with the following arrays:
+            - 'coordinates' (numpy.ndarray of shape (n_points, 2)): Coordinates of every point of every kept
+              feature, (latitude, longitude) in the same order as in the input.
+            - 'offsets' (numpy.ndarray of shape (n_features + 1,)): Start position of each feature in
+              'coordinates'; the points of feature i are coordinates[offsets[i]:offsets[i + 1]].
+            - 'type_codes' (numpy.ndarray of shape (n_features,)): Position of the type of each feature in
+              'road_types'.
+            - 'row_ids' (numpy.ndarray of shape (n_features,)): Position of the hexagon each feature belongs to.
+            - 'road_types' (list of str): Names of the road types corresponding to the type codes.
+            - 'n_rows' (int): Number of hexagons.
+    """
+    type_to_code = {} if road_types is None else {road_type: i for i, road_type in enumerate(road_types)}
+    coordinates, lengths, type_codes, row_ids = [], [], [], []
+
+    n_rows = 0
+    for row_id, row in enumerate(rows):
+        n_rows += 1
+        for element in row:
+            element_type = element['properties']['type']
+            code = type_to_code.get(element_type)
+            if code is None:
+                if road_types is not None:
+                    continue
+                code = type_to_code[element_type] = len(type_to_code)
+            element_coordinates = element['geometry']['coordinates']
+            coordinates.extend(element_coordinates)
+            lengths.append(len(element_coordinates))
+            type_codes.append(code)
+            row_ids.append(row_id)
+
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return {
+        'coordinates': np.asarray(coordinates, dtype=np.float64).reshape(-1, 2),
+        'offsets': offsets,
+        'type_codes': np.asarray(type_codes, dtype=np.int64),
+        'row_ids': np.asarray(row_ids, dtype=np.int64),
+        'road_types': list(type_to_code),
+        'n_rows': n_rows,
+    }
+
+
+def feature_lengths(flat_features, method='vincenty'):
+    """
+    Compute the length of every feature of flattened road data in a single vectorized pass.
+
+    Args:
+        flat_features (dict): The output of flatten_road_features.
+        method (str, optional): Distance formula, see pairwise_geodesic_length. Default is 'vincenty'.
+
+    Returns:
+        numpy.ndarray: The length in meters of each feature.
+    """
+    coords = flat_features['coordinates']
+    offsets = flat_features['offsets']
+    n_features = len(offsets) - 1
+    if len(coords) < 2:
+        return np.zeros(n_features)
+
+    # Length of every pair of consecutive points, including pairs spanning two features
+    dist = pairwise_geodesic_length(coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1], method=method)
+    # Feature each pair belongs to (the feature of its first point); pairs spanning two features are dropped
+    point_feature = np.repeat(np.arange(n_features), np.diff(offsets))
+    same_feature = point_feature[:-1] == point_feature[1:]
+    return np.bincount(point_feature[:-1][same_feature], weights=dist[same_feature], minlength=n_features)
+
+
+def road_lengths_batch(rows, road_types=None, method='vincenty'):
+    """
+    Calculate the total length of every road type in every hexagon in a single sweep.
+
+    All the segments of all the hexagons are flattened into contiguous arrays, their lengths are computed in one
+    vectorized pass and the totals are reduced by (hexagon, road type).
+
+    Args:
+        rows (pandas.Series or iterable of list of dict): One list of road features per hexagon, with the
+            structure described in road_length.
+        road_types (list of str, optional): Road types to compute. If None, every type found in the data is
+            returned (in order of first appearance).
+        method (str, optional): Distance formula, see pairwise_geodesic_length. Default is 'vincenty'.
+
+    Returns:
+        pandas.DataFrame: One row per hexagon (with the index of rows if it is a Series) and one column
+            'length_<type>' per road type with the total length in meters.
+
+    Example:
+        >>> df_roads = pd.DataFrame({'features': [road_data, []]})
+        >>> road_lengths_batch(df_roads['features'], road_types=['highway', 'street'])
+           length_highway  length_street
+        0    1.814223e+06   5.585234e+06
+        1    0.000000e+00   0.000000e+00
+    """
+    flat_features = flatten_road_features(rows, road_types=road_types)
+    lengths = feature_lengths(flat_features, method=method)
+
+    n_rows, n_types = flat_features['n_rows'], len(flat_features['road_types'])
+    # Sum the feature lengths by (hexagon, road type) in one bincount
+    cell = flat_features['row_ids'] * n_types + flat_features['type_codes']
+    totals = np.bincount(cell, weights=lengths, minlength=n_rows * n_types).reshape(n_rows, n_types)
+
+    index = rows.index if isinstance(rows, pd.Series) else None
+    return pd.DataFrame(totals, index=index,
+                        columns=[f'length_{road_type}' for road_type in flat_features['road_types']])
+
+
+def road_lengths_by_type(features, types=None, method='vincenty'):
+    """
+    Calculate the total length of every road type in a hexagon walking its features only once.
+
+    Args:
+        features (list of dictionaries): A list of dictionaries representing road segments, with the structure
+            described in road_length.
+        types (list of str, optional): Road types to calculate the length for. Types without any segment get a
+            length of 0. If None, the lengths of all types seen in features are returned.
+        method (str, optional): Distance formula, see pairwise_geodesic_length. Default is 'vincenty'.
+
+    Returns:
+        dict: The total length in meters of each road type, keyed by road type.
+
+    Example:
+        >>> road_lengths_by_type(road_data)
+        {'highway': 1814222.6660583902, 'street': 5585233.578943205}
+        >>> road_lengths_by_type(road_data, types=['highway', 'motorway'])
+        {'highway': 1814222.6660583902, 'motorway': 0.0}
+    """
+    flat_features = flatten_road_features([features], road_types=types)
+    lengths = feature_lengths(flat_features, method=method)
+    totals = np.bincount(flat_features['type_codes'], weights=lengths, minlength=len(flat_features['road_types']))
+    return {road_type: float(total) for road_type, total in zip(flat_features['road_types'], totals)}
 
 
 def road_length(row, road_type):
@@ -57,8 +329,6 @@ def road_length(row, road_type):
         ...     }
         ... ]
         >>> road_length(road_data, 'highway')
-        2344910.426632572
+        1814222.6660583902
     """
-    individual_length = [segment_length(element['geometry']['coordinates']) for element in row if
-                         element['properties']['type'] == road_type]
-    return sum(individual_length)
+    return road_lengths_by_type(row, types=[road_type])[road_type]
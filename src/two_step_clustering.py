@@ -0,0 +1,53 @@
+from src.hierarchical_clustering import HierarchicalHexClusterer
+
+
+def two_step_clustering(df, sub_clusterings, labels_first_step=None, first_step=None, tier_order=None):
+    """
+    Run the hierarchical clustering scheme (first-step tiers, then sub-clustering of some tiers) and return the
+    final labels as a single array, without merging DataFrames.
+
+    Thin wrapper over HierarchicalHexClusterer taking the keyword arguments of clustering_k_means for every step.
+    Labels are carried by position: each sub-clustering runs on the rows of one first-step tier and its labels are
+    written back in place into the final label array. The final labels are numbered consecutively following
+    tier_order: a tier without sub-clustering gets one label, a sub-clustered tier gets n_clusters labels.
+
+    Args:
+        df (pandas.DataFrame): The input DataFrame with the variables used by every step.
+        sub_clusterings (dict): For each first-step label to sub-cluster, the keyword arguments of
+            clustering_k_means for that tier, e.g. {0: {'columns_clustering': [...], 'n_clusters': 2}}.
+            'label_column_name' is ignored.
+        labels_first_step (array-like, optional): First-step labels of each row of df, if already computed.
+        first_step (dict, optional): Keyword arguments of clustering_k_means for the first step, used when
+            labels_first_step is None, e.g. {'columns_clustering': [...], 'n_clusters': 3}.
+        tier_order (list of int, optional): Order of the first-step labels in the final numbering. Default is the
+            sorted first-step labels.
+
+    Returns:
+        numpy.ndarray: The final label of each row of df.
+        dict: The metrics returned by clustering_k_means for each step, keyed by 'first_step' and by the
+            sub-clustered first-step labels (None if metrics were not requested).
+
+    Example:
+        >>> # 3-tier clustering (0: middle, 1: rural, 2: urban), then middle in 2 and rural in 3 sub-classes
+        >>> labels, metrics = two_step_clustering(
+        ...     uk_hex_total, labels_first_step=uk_hex_total['label_3_tier'],
+        ...     sub_clusterings={0: {'columns_clustering': columns_middle, 'n_clusters': 2},
+        ...                      1: {'columns_clustering': columns_rural, 'n_clusters': 3}},
+        ...     tier_order=[0, 2, 1])
+        >>> # labels: middle sub-classes 0-1, urban 2, rural sub-classes 3-5
+    """
+    def tier_spec(kwargs):
+        # clustering_k_means arguments (with its defaults) to a tier spec of the clusterer
+        kwargs = {'post_analysis': True, 'metrics': True, 'n_clusters': 3,
+                  **{key: value for key, value in kwargs.items() if key != 'label_column_name'}}
+        return {'columns': kwargs.pop('columns_clustering'), **kwargs}
+
+    if labels_first_step is None and first_step is None:
+        raise ValueError("Either labels_first_step or first_step must be provided.")
+    # Sub-clusterings fitted in turn, so that the post-analysis plots can be displayed
+    clusterer = HierarchicalHexClusterer(
+        first_step=None if first_step is None else tier_spec(first_step),
+        sub_clusterings={tier: tier_spec(kwargs) for tier, kwargs in sub_clusterings.items()},
+        tier_order=tier_order, n_jobs=1)
+    labels = clusterer.fit_predict(df, labels_first_step=labels_first_step)
+    return labels, clusterer.metrics_
@@ -0,0 +1,481 @@
+import os
+import gzip
+import json
+import sqlite3
+import string
+import functools
+from concurrent.futures import ProcessPoolExecutor
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from src.h3_index import as_uint64_cells, cell_resolution, cell_to_parent
+from src.hex_geometry import hex_boundaries
+
+# Resolution of the hexagons drawn at each zoom level: the coarsest resolution whose hexagons are still about 8
+# pixels wide at the latitude of the UK (the finest resolution of the data is used from zoom 10)
+DEFAULT_ZOOM_RESOLUTIONS = {0: 3, 1: 3, 2: 3, 3: 3, 4: 4, 5: 5, 6: 6, 7: 6, 8: 7, 9: 7}
+# Number of tile units per side of a tile (Mapbox Vector Tile specification)
+TILE_EXTENT = 4096
+
+# MVT geometry commands (command id | count << 3)
+_MOVE_TO = 1 | (1 << 3)
+_CLOSE_PATH = 7 | (1 << 3)
+
+# Standalone viewer of the tiles with MapLibre GL, served next to the tiles (no basemap and no external tile API)
+_VIEWER_TEMPLATE = string.Template("""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>$title</title>
+<script src="https://unpkg.com/maplibre-gl@^4.0.0/dist/maplibre-gl.js"></script>
+<link href="https://unpkg.com/maplibre-gl@^4.0.0/dist/maplibre-gl.css" rel="stylesheet">
+<style>html, body, #map {margin: 0; width: 100%; height: 100%;}</style>
+</head>
+<body>
+<div id="map"></div>
+<script>
+const map = new maplibregl.Map({
+  container: 'map',
+  center: [$longitude, $latitude],
+  zoom: $zoom,
+  style: {
+    version: 8,
+    sources: {
+      hexagons: {type: 'vector', tiles: [location.origin + '/{z}/{x}/{y}.pbf'], minzoom: $min_zoom,
+                 maxzoom: $max_zoom}
+    },
+    layers: [
+      {id: 'background', type: 'background', paint: {'background-color': '#f4f4f4'}},
+      {id: 'hexagons', type: 'fill', source: 'hexagons', 'source-layer': '$layer_name',
+       paint: {'fill-color': $fill_color, 'fill-opacity': 0.7}}
+    ]
+  }
+});
+map.on('click', 'hexagons', function (event) {
+  const names = $names;
+  new maplibregl.Popup().setLngLat(event.lngLat).setHTML(names[event.features[0].properties.label])
+    .addTo(map);
+});
+</script>
+</body>
+</html>
+""")
+
+
+def majority_labels(hex_ids, labels, resolution):
+    """
+    Aggregate the labels of H3 cells to their parent cells at a coarser resolution, by majority of the children.
+
+    Args:
+        hex_ids (array-like): H3 ids as strings or integers, all at a resolution finer than or equal to resolution.
+        labels (array-like): The integer label of each cell.
+        resolution (int): The resolution of the parent cells.
+
+    Returns:
+        numpy.ndarray: The parent cells as uint64, sorted.
+        numpy.ndarray: The most frequent label of the children of each parent (the smallest one in case of a tie).
+
+    Example:
+        >>> parents, parent_labels = majority_labels(uk_hex_total['index'], uk_hex_total['label_6_tier'], 6)
+    """
+    parents = cell_to_parent(as_uint64_cells(hex_ids), resolution)
+    labels = np.asarray(labels).astype(np.int64)
+    # Number of children of each (parent, label) pair
+    order = np.lexsort((labels, parents))
+    parents, labels = parents[order], labels[order]
+    pair_starts = np.flatnonzero(np.r_[True, (parents[1:] != parents[:-1]) | (labels[1:] != labels[:-1])])
+    counts = np.diff(np.r_[pair_starts, len(parents)])
+    parents, labels = parents[pair_starts], labels[pair_starts]
+    # First pair of each parent by decreasing count, then increasing label
+    order = np.lexsort((labels, -counts, parents))
+    parents, labels = parents[order], labels[order]
+    first = np.r_[True, parents[1:] != parents[:-1]]
+    return parents[first], labels[first]
+
+
+def _varint(value):
+    # Protocol buffers varint of a non-negative integer
+    encoded = bytearray()
+    while value > 0x7f:
+        encoded.append((value & 0x7f) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def _varints(values):
+    # Varints of many non-negative integers (< 2 ** 35) at once: the concatenated bytes and the length of each one
+    values = np.asarray(values, dtype=np.uint64)
+    groups = np.stack([(values >> np.uint64(7 * k)) & np.uint64(0x7f) for k in range(5)], axis=1).astype(np.uint8)
+    lengths = np.ones(len(values), dtype=np.int64)
+    for k in range(1, 5):
+        lengths[values >= np.uint64(1 << (7 * k))] = k + 1
+    used = np.arange(5) < lengths[:, None]
+    # Continuation bit on every byte but the last one of each varint
+    groups[np.arange(5) < lengths[:, None] - 1] |= 0x80
+    return groups[used].tobytes(), lengths
+
+
+def _zigzag(values):
+    return (values << 1) ^ (values >> 63)
+
+
+def _tile_coordinates(coordinates, zoom, extent=TILE_EXTENT):
+    # Web Mercator coordinates of (lng, lat) vertices in tile units of the whole world at a zoom level
+    world_size = extent * 2 ** zoom
+    x = (coordinates[:, 0] + 180) / 360 * world_size
+    latitudes = np.radians(coordinates[:, 1])
+    y = (1 - np.log(np.tan(latitudes) + 1 / np.cos(latitudes)) / np.pi) / 2 * world_size
+    return np.stack([x, y], axis=1)
+
+
+def _ragged_positions(starts, counts):
+    # Positions starts[i], ..., starts[i] + counts[i] - 1 of every i, concatenated
+    offsets = np.r_[0, np.cumsum(counts)[:-1]]
+    return np.repeat(starts - offsets, counts) + np.arange(int(np.sum(counts)))
+
+
+def _ring_geometries(local, n_vertices):
+    """
+    Encode the rings of the features of a tile as MVT polygon geometries (one ring per feature).
+
+    Args:
+        local (numpy.ndarray): The integer tile coordinates of the vertices of all the rings, shape (n, 2).
+        n_vertices (numpy.ndarray): The number of vertices of each ring.
+
+    Returns:
+        bytes: The packed geometries of the valid rings.
+        numpy.ndarray: The number of bytes of the geometry of each valid ring.
+        numpy.ndarray: Whether each ring is valid, i.e. it still has an area after rounding to tile units.
+    """
+    ring_ids = np.repeat(np.arange(len(n_vertices)), n_vertices)
+    # Drop the vertices equal to the previous one of the same ring (after rounding to tile units)
+    duplicate = np.r_[False, (local[1:] == local[:-1]).all(axis=1) & (ring_ids[1:] == ring_ids[:-1])]
+    # and the last vertex if it is equal to the first one (ClosePath draws that segment)
+    starts = np.r_[0, np.cumsum(n_vertices)[:-1]]
+    closed = (n_vertices > 1) & (local[starts + n_vertices - 1] == local[np.minimum(starts, len(local) - 1)]).all(
+        axis=1) if len(local) else np.zeros(len(n_vertices), dtype=bool)
+    duplicate[(starts + n_vertices - 1)[closed]] = True
+    local, ring_ids = local[~duplicate], ring_ids[~duplicate]
+    n_vertices = np.bincount(ring_ids, minlength=len(n_vertices))
+    starts = np.r_[0, np.cumsum(n_vertices)[:-1]]
+
+    # Signed area of each ring; exterior rings are clockwise in tile coordinates (y axis pointing down)
+    x, y = local[:, 0].astype(np.float64), local[:, 1].astype(np.float64)
+    next_vertex = np.arange(len(local)) + 1
+    next_vertex[(starts + n_vertices - 1)[n_vertices > 0]] = starts[n_vertices > 0]
+    twice_area = np.bincount(ring_ids, weights=x * y[next_vertex] - x[next_vertex] * y, minlength=len(n_vertices))
+    valid = (n_vertices >= 3) & (twice_area != 0)
+    position_in_ring = np.arange(len(local)) - np.repeat(starts, n_vertices)
+    reverse = np.repeat(twice_area < 0, n_vertices)
+    local = local[np.where(reverse, np.repeat(starts + n_vertices - 1, n_vertices) - position_in_ring,
+                           np.arange(len(local)))]
+
+    # Only the valid rings are encoded
+    vertices = _ragged_positions(starts[valid], n_vertices[valid])
+    local, position_in_ring = local[vertices], position_in_ring[vertices]
+    n_vertices = n_vertices[valid]
+    starts = np.r_[0, np.cumsum(n_vertices)[:-1]]
+
+    # Deltas from the previous vertex; the cursor starts at (0, 0) for every feature
+    previous = np.roll(local, 1, axis=0)
+    previous[starts] = 0
+    deltas = _zigzag(local - previous)
+
+    # MoveTo(1) x y LineTo(n - 1) x y ... ClosePath for every ring, i.e. 2 * n + 3 integers
+    sizes = 2 * n_vertices + 3
+    offsets = np.r_[0, np.cumsum(sizes)[:-1]]
+    commands = np.zeros(int(sizes.sum()), dtype=np.int64)
+    commands[offsets] = _MOVE_TO
+    commands[offsets + 1], commands[offsets + 2] = deltas[starts, 0], deltas[starts, 1]
+    commands[offsets + 3] = 2 | ((n_vertices - 1) << 3)
+    commands[offsets + sizes - 1] = _CLOSE_PATH
+    follow = np.flatnonzero(position_in_ring > 0)
+    vertex_offsets = np.repeat(offsets + 4, n_vertices)[follow] + 2 * (position_in_ring[follow] - 1)
+    commands[vertex_offsets], commands[vertex_offsets + 1] = deltas[follow, 0], deltas[follow, 1]
+
+    geometry_bytes, lengths = _varints(commands)
+    ring_lengths = np.add.reduceat(lengths, offsets) if len(offsets) else np.array([], dtype=np.int64)
+    return geometry_bytes, ring_lengths, valid
+
+
+def encode_tile(cells, labels, local, n_vertices, layer_name='hexagons', extent=TILE_EXTENT):
+    """
+    Encode the hexagons of one tile as a Mapbox Vector Tile with a single layer.
+
+    Each hexagon is a polygon feature whose id is the uint64 H3 id, with its label as the only attribute. The
+    hexagons that collapse to less than 3 distinct vertices in tile units are left out.
+
+    Args:
+        cells (numpy.ndarray): The H3 ids of the hexagons as uint64.
+        labels (numpy.ndarray): The integer label of each hexagon.
+        local (numpy.ndarray): The integer tile coordinates of the vertices of all the hexagons, shape (n, 2).
+        n_vertices (numpy.ndarray): The number of vertices of each hexagon.
+        layer_name (str, optional): The name of the layer. Default is 'hexagons'.
+        extent (int, optional): The number of tile units per side of the tile. Default is 4096.
+
+    Returns:
+        bytes: The (uncompressed) tile.
+    """
+    geometry_bytes, ring_lengths, valid = _ring_geometries(local, n_vertices)
+    geometry_offsets = np.r_[0, np.cumsum(ring_lengths)[:-1]]
+    label_values, value_indices = np.unique(labels[valid], return_inverse=True)
+
+    layer = [b'\x78\x02', b'\x0a' + _varint(len(layer_name.encode())) + layer_name.encode()]
+    for cell, value_index, start, length in zip(cells[valid].tolist(), value_indices.tolist(),
+                                                geometry_offsets.tolist(), ring_lengths.tolist()):
+        # id (H3 id), tags (key 0, value value_index), type (polygon), geometry
+        feature = b''.join([b'\x08', _varint(cell), b'\x12\x02\x00', _varint(value_index), b'\x18\x03\x22',
+                            _varint(length), geometry_bytes[start:start + length]])
+        layer.append(b'\x12' + _varint(len(feature)) + feature)
+    layer.append(b'\x1a\x05label')
+    for label in label_values.tolist():
+        value = b'\x28' + _varint(label)
+        layer.append(b'\x22' + _varint(len(value)) + value)
+    layer.append(b'\x28' + _varint(extent))
+    layer = b''.join(layer)
+    return b'\x1a' + _varint(len(layer)) + layer
+
+
+def _encode_tile_group(zoom, tiles, cells, labels, coordinates, n_vertices, layer_name, extent):
+    # Worker task: encode a group of tiles of one zoom level. tiles holds, for every (hexagon, tile) pair sorted by
+    # tile, the position of the hexagon and the column and row of the tile
+    vertex_starts = np.r_[0, np.cumsum(n_vertices)[:-1]]
+    tile_starts = np.flatnonzero(np.r_[True, (tiles[1:, 1:] != tiles[:-1, 1:]).any(axis=1)])
+    encoded = []
+    for start, end in zip(tile_starts, np.r_[tile_starts[1:], len(tiles)]):
+        hexagons, (x, y) = tiles[start:end, 0], tiles[start, 1:]
+        vertices = _ragged_positions(vertex_starts[hexagons], n_vertices[hexagons])
+        local = np.rint(coordinates[vertices] - np.array([x, y]) * extent).astype(np.int64)
+        encoded.append(((zoom, int(x), int(y)), encode_tile(cells[hexagons], labels[hexagons], local,
+                                                            n_vertices[hexagons], layer_name, extent)))
+    return encoded
+
+
+def _zoom_tiles(cells, labels, zoom, n_jobs, layer_name, extent, buffer):
+    # Encode all the tiles of one zoom level, splitting the tiles between n_jobs worker processes
+    lng_lat, n_vertices = hex_boundaries(cells)
+    coordinates = _tile_coordinates(lng_lat, zoom, extent)
+    vertex_starts = np.r_[0, np.cumsum(n_vertices)[:-1]]
+    # Tiles overlapped by the bounding box of each hexagon (with the buffer of the tiles)
+    minimum = np.minimum.reduceat(coordinates, vertex_starts) if len(cells) else np.empty((0, 2))
+    maximum = np.maximum.reduceat(coordinates, vertex_starts) if len(cells) else np.empty((0, 2))
+    first_tile = np.floor((minimum - buffer) / extent).astype(np.int64)
+    last_tile = np.floor((maximum + buffer) / extent).astype(np.int64)
+    first_tile, last_tile = np.clip(first_tile, 0, 2 ** zoom - 1), np.clip(last_tile, 0, 2 ** zoom - 1)
+    spans = last_tile - first_tile + 1
+    n_pairs = spans[:, 0] * spans[:, 1]
+    hexagons = np.repeat(np.arange(len(cells)), n_pairs)
+    pair_index = _ragged_positions(np.zeros(len(cells), dtype=np.int64), n_pairs)
+    tile_x = first_tile[hexagons, 0] + pair_index % spans[hexagons, 0]
+    tile_y = first_tile[hexagons, 1] + pair_index // spans[hexagons, 0]
+    tiles = np.stack([hexagons, tile_x, tile_y], axis=1)[np.lexsort((hexagons, tile_y, tile_x))]
+
+    # Split the pairs into groups of whole tiles, one group per task
+    tile_starts = np.flatnonzero(np.r_[True, (tiles[1:, 1:] != tiles[:-1, 1:]).any(axis=1)]) if len(tiles) \
+        else np.array([], dtype=np.int64)
+    groups = [group for group in np.array_split(tile_starts, max(1, min(4 * n_jobs, len(tile_starts)))) if len(group)]
+    bounds = [(group[0], next_group[0]) for group, next_group in zip(groups, groups[1:])] + \
+        ([(groups[-1][0], len(tiles))] if groups else [])
+    tasks = [(zoom, tiles[start:end], cells, labels, coordinates, n_vertices, layer_name, extent)
+             for start, end in bounds]
+    if n_jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            # map returns the tiles in the order of the tasks
+            results = list(executor.map(_encode_tile_group, *zip(*tasks)))
+    else:
+        results = [_encode_tile_group(*task) for task in tasks]
+    return [tile for result in results for tile in result]
+
+
+def _viewer_html(metadata, colors, names):
+    # MapLibre GL viewer of the tiles, with the hexagons colored by label
+    from matplotlib.colors import to_hex
+
+    fill_color = ['match', ['get', 'label']]
+    for label, color in enumerate(colors):
+        fill_color += [label, to_hex(color)]
+    fill_color.append('#000000')
+    longitude, latitude, zoom = metadata['center']
+    return _VIEWER_TEMPLATE.substitute(
+        title=metadata['name'], longitude=longitude, latitude=latitude, zoom=zoom, min_zoom=metadata['minzoom'],
+        max_zoom=metadata['maxzoom'], layer_name=metadata['vector_layers'][0]['id'], fill_color=json.dumps(fill_color),
+        names=json.dumps(names))
+
+
+def export_vector_tiles(hex_ids, labels, output_path, colors, names=None, min_zoom=0, max_zoom=10,
+                        zoom_resolutions=None, output_format='directory', n_jobs=1, layer_name='hexagons',
+                        extent=TILE_EXTENT, buffer=64, title='Clustering of hexagons'):
+    """
+    Export the labels of H3 hexagons as a pyramid of Mapbox Vector Tiles, as a z/x/y directory or an MBTiles file.
+
+    At low zoom levels the hexagons are aggregated to their parent cells at a coarser resolution (see
+    DEFAULT_ZOOM_RESOLUTIONS) with the majority label of their children, and the hexagons of the data are only
+    drawn from the zoom levels where they are a few pixels wide; clients overzoom the tiles of max_zoom. The tiles
+    of each zoom level are encoded in parallel on n_jobs worker processes. The directory also gets a TileJSON
+    file (metadata.json) and a MapLibre GL viewer (index.html), and both formats can be served locally with
+    serve_tiles.
+
+    Args:
+        hex_ids (array-like): H3 ids as strings or integers, all at the same resolution.
+        labels (array-like): The integer label of each hexagon (e.g. the 'label_6_tier' column).
+        output_path (str): The directory of the tiles, or the path of the MBTiles file.
+        colors (list): The color of each label (e.g. matplotlib color names), indexed by label.
+        names (list of str, optional): The name of each label. Default is the labels.
+        min_zoom (int, optional): The first zoom level. Default is 0.
+        max_zoom (int, optional): The last zoom level. Default is 10.
+        zoom_resolutions (dict, optional): The H3 resolution drawn at each zoom level; the resolution of the data is
+            used for the zoom levels not in the dict. Default is DEFAULT_ZOOM_RESOLUTIONS.
+        output_format (str, optional): 'directory' ({z}/{x}/{y}.pbf files) or 'mbtiles' (SQLite file with
+            gzip-compressed tiles). Default is 'directory'.
+        n_jobs (int, optional): The number of worker processes. Default is 1 (no pool).
+        layer_name (str, optional): The name of the layer of the tiles. Default is 'hexagons'.
+        extent (int, optional): The number of tile units per side of a tile. Default is 4096.
+        buffer (int, optional): The margin (in tile units) around each tile within which hexagons are included.
+            Default is 64.
+        title (str, optional): The name of the tileset. Default is 'Clustering of hexagons'.
+
+    Returns:
+        dict: The TileJSON metadata of the tileset, with the number of tiles of each zoom level ('tile_counts').
+
+    Example:
+        >>> export_vector_tiles(uk_hex_total['index'], uk_hex_total['label_6_tier'],
+        ...                     '../../outputs/01_weighted_interpolation/figures/uk_cluster_6_tier_tiles', colors,
+        ...                     n_jobs=os.cpu_count())
+    """
+    if output_format not in ('directory', 'mbtiles'):
+        raise ValueError("output_format must be 'directory' or 'mbtiles'.")
+    cells = as_uint64_cells(hex_ids)
+    labels = np.asarray(labels).astype(np.int64)
+    resolutions = np.unique(cell_resolution(cells))
+    if len(resolutions) != 1:
+        raise ValueError("All the hexagons must have the same resolution.")
+    zoom_resolutions = DEFAULT_ZOOM_RESOLUTIONS if zoom_resolutions is None else zoom_resolutions
+    names = [str(label) for label in range(len(colors))] if names is None else list(names)
+
+    lng_lat, _ = hex_boundaries(cells[::max(1, len(cells) // 1000)])
+    metadata = {
+        'tilejson': '3.0.0', 'name': title, 'format': 'pbf', 'scheme': 'xyz', 'tiles': ['{z}/{x}/{y}.pbf'],
+        'minzoom': min_zoom, 'maxzoom': max_zoom,
+        'bounds': [float(value) for value in np.r_[lng_lat.min(axis=0), lng_lat.max(axis=0)]],
+        'center': [float(value) for value in lng_lat.mean(axis=0)] + [min(max_zoom, max(min_zoom, 5))],
+        'vector_layers': [{'id': layer_name, 'fields': {'label': 'Number'}, 'minzoom': min_zoom,
+                           'maxzoom': max_zoom}],
+        'tile_counts': {}}
+
+    if output_format == 'mbtiles':
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        connection = sqlite3.connect(output_path)
+        connection.execute('CREATE TABLE metadata (name text, value text)')
+        connection.execute('CREATE TABLE tiles (zoom_level integer, tile_column integer, tile_row integer, '
+                           'tile_data blob)')
+        connection.execute('CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)')
+
+    for zoom in range(min_zoom, max_zoom + 1):
+        resolution = min(zoom_resolutions.get(zoom, resolutions[0]), resolutions[0])
+        if resolution < resolutions[0]:
+            zoom_cells, zoom_labels = majority_labels(cells, labels, resolution)
+        else:
+            zoom_cells, zoom_labels = cells, labels
+        tiles = _zoom_tiles(zoom_cells, zoom_labels, zoom, n_jobs, layer_name, extent, buffer)
+        metadata['tile_counts'][zoom] = len(tiles)
+
+        if output_format == 'mbtiles':
+            # Rows of the TMS scheme (y axis pointing north)
+            connection.executemany('INSERT INTO tiles VALUES (?, ?, ?, ?)',
+                                   [(z, x, 2 ** z - 1 - y, gzip.compress(tile)) for (z, x, y), tile in tiles])
+        else:
+            for (z, x, y), tile in tiles:
+                os.makedirs(os.path.join(output_path, str(z), str(x)), exist_ok=True)
+                with open(os.path.join(output_path, str(z), str(x), f'{y}.pbf'), 'wb') as file:
+                    file.write(tile)
+
+    if output_format == 'mbtiles':
+        mbtiles_metadata = {'name': title, 'format': 'pbf', 'minzoom': min_zoom, 'maxzoom': max_zoom,
+                            'bounds': ','.join(map(str, metadata['bounds'])),
+                            'center': ','.join(map(str, metadata['center'])),
+                            'json': json.dumps({'vector_layers': metadata['vector_layers'],
+                                                'colors': list(colors), 'names': names})}
+        connection.executemany('INSERT INTO metadata VALUES (?, ?)',
+                               [(name, str(value)) for name, value in mbtiles_metadata.items()])
+        connection.commit()
+        connection.close()
+    else:
+        with open(os.path.join(output_path, 'metadata.json'), 'w') as file:
+            json.dump(metadata, file)
+        with open(os.path.join(output_path, 'index.html'), 'w', encoding='utf-8') as file:
+            file.write(_viewer_html(metadata, colors, names))
+    return metadata
+
+
+class _TileRequestHandler(SimpleHTTPRequestHandler):
+    # Static file server of a tile directory, or of the tiles of an MBTiles file, with CORS headers
+    extensions_map = {**SimpleHTTPRequestHandler.extensions_map, '.pbf': 'application/x-protobuf'}
+    mbtiles_path = None
+    viewer = None
+
+    def end_headers(self):
+        self.send_header('Access-Control-Allow-Origin', '*')
+        super().end_headers()
+
+    def do_GET(self):
+        if self.mbtiles_path is None:
+            return super().do_GET()
+        path = self.path.split('?')[0].strip('/')
+        if path in ('', 'index.html'):
+            return self._send(self.viewer.encode(), 'text/html')
+        parts = path[:-len('.pbf')].split('/') if path.endswith('.pbf') else []
+        if len(parts) != 3 or not all(part.isdigit() for part in parts):
+            return self.send_error(404)
+        z, x, y = map(int, parts)
+        with sqlite3.connect(self.mbtiles_path) as connection:
+            row = connection.execute('SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND '
+                                     'tile_row = ?', (z, x, 2 ** z - 1 - y)).fetchone()
+        if row is None:
+            # Tiles without hexagons are empty
+            return self._send(b'', 'application/x-protobuf')
+        self._send(row[0], 'application/x-protobuf', encoding='gzip')
+
+    def _send(self, body, content_type, encoding=None):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve_tiles(path, port=8000, host='127.0.0.1'):
+    """
+    Serve the vector tiles written by export_vector_tiles (and their viewer) with a local HTTP server.
+
+    Args:
+        path (str): The directory of the tiles, or the path of the MBTiles file.
+        port (int, optional): The port of the server. Default is 8000.
+        host (str, optional): The address of the server. Default is '127.0.0.1'.
+
+    Example:
+        >>> serve_tiles('../../outputs/01_weighted_interpolation/figures/uk_cluster_6_tier_tiles')
+        Serving the tiles at http://127.0.0.1:8000/
+    """
+    if os.path.isdir(path):
+        handler = functools.partial(_TileRequestHandler, directory=path)
+    else:
+        with sqlite3.connect(path) as connection:
+            metadata = dict(connection.execute('SELECT name, value FROM metadata').fetchall())
+        tile_json = json.loads(metadata['json'])
+        viewer_metadata = {'name': metadata['name'], 'minzoom': int(metadata['minzoom']),
+                           'maxzoom': int(metadata['maxzoom']), 'vector_layers': tile_json['vector_layers'],
+                           'center': [float(value) for value in metadata['center'].split(',')]}
+        viewer = _viewer_html(viewer_metadata, tile_json['colors'], tile_json['names'])
+        handler = type('_MBTilesRequestHandler', (_TileRequestHandler,), {'mbtiles_path': os.path.abspath(path),
+                                                                          'viewer': viewer})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f'Serving the tiles at http://{host}:{port}/')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+
+# Bucket-to-weight mappings of the census histograms
+# Age columns at the hexagon level ('0', ..., '100'), weighted by age + 1 as in the original extraction
+AGE_WEIGHTS_HEXAGON = {f'{age}': age + 1 for age in range(101)}
+# Age columns at the local authority / output area level ('agedUnder1Year', 'aged2Years', ..., 'aged99Years')
+AGE_WEIGHTS_CENSUS = {('agedUnder1Year' if age == 0 else f'aged{age + 1}Years'): age + 1 for age in range(99)}
+# Household size columns ('1', ..., '8'), weighted by the number of people in the household
+HOUSEHOLD_SIZE_WEIGHTS = {f'{size}': size for size in range(1, 9)}
+
+
+def downcast_counts(df, weights):
+    """
+    Store the histogram columns of a DataFrame as 32-bit integers, halving their memory.
+
+    Args:
+        df (pandas.DataFrame): The input DataFrame, with one column per bucket of the histogram.
+        weights (dict): Mapping from column name to the weight of the bucket; only its keys are used.
+
+    Returns:
+        pandas.DataFrame: The DataFrame with the histogram columns converted to int32 and stored together (as a
+            single block) after the other columns.
+
+    Raises:
+        ValueError: If some count does not fit in a 32-bit integer.
+    """
+    columns = list(weights)
+    counts = df[columns]
+    if len(df) and (counts.max().max() >= 2 ** 31 or counts.min().min() < -2 ** 31):
+        raise ValueError("The counts do not fit in 32-bit integers.")
+    # Store the histogram as a single int32 block so that it can later be read without any copy
+    counts = pd.DataFrame(counts.to_numpy(dtype=np.int32), index=df.index, columns=columns)
+    return pd.concat([df.drop(columns=columns), counts], axis=1)
+
+
+def weighted_sums(df, weights, dtype='int64', block_size=1000000):
+    """
+    Compute the weighted sum and the total count of a histogram stored in several columns of a DataFrame.
+
+    The histogram columns are converted to a 2D NumPy array and reduced with one matrix-vector product per block
+    of rows, so no full-length temporary Series is allocated per column.
+
+    Args:
+        df (pandas.DataFrame): The input DataFrame, with one column per bucket of the histogram.
+        weights (dict): Mapping from column name to the weight of the bucket (e.g. AGE_WEIGHTS_HEXAGON).
+        dtype (str, optional): Integer type used for the counts, 'int64' or the memory-lean 'int32' (half the
+            memory per block, and no copy at all if the columns are already stored as int32, see
+            downcast_counts). With 'int32' the products are accumulated in 32-bit integers when they are
+            guaranteed not to overflow and in 64-bit integers otherwise. Default is 'int64'.
+        block_size (int, optional): Number of rows converted and reduced at a time, bounds the size of the
+            temporary arrays. Default is 1000000.
+
+    Returns:
+        tuple of numpy.ndarray: The weighted sum sum(weight * count) and the total count sum(count) of each row.
+
+    Example:
+        >>> df = pd.DataFrame({'1': [2, 0], '2': [1, 3]})
+        >>> weighted_sums(df, {'1': 1, '2': 2})
+        (array([4, 6]), array([3, 3]))
+    """
+    if dtype not in ('int64', 'int32'):
+        raise ValueError("dtype must be 'int64' or 'int32'.")
+    columns = list(weights)
+    positions = df.columns.get_indexer(columns)
+    if (positions < 0).any():
+        raise KeyError(f"Columns not found in the DataFrame: {[c for c, p in zip(columns, positions) if p < 0]}")
+    weight_vector = np.array([weights[column] for column in columns], dtype=dtype)
+    # Bound of the largest weighted sum per unit of count, used to rule out 32-bit overflows cheaply
+    max_sum_per_count = int(np.abs(weight_vector).sum()) + len(columns)
+
+    n_rows = len(df)
+    weighted_sum = np.empty(n_rows, dtype=np.int64)
+    total = np.empty(n_rows, dtype=np.int64)
+    for start in range(0, n_rows, block_size):
+        # Read the block in its stored type, so that the range is checked before any narrowing cast
+        counts = df.iloc[start:start + block_size, positions].to_numpy()
+        block_weights = weight_vector
+        if dtype == 'int32' and counts.size:
+            # Fall back to 64-bit accumulation if the block could overflow 32-bit integers
+            max_abs_count = max(int(counts.max()), -int(counts.min()))
+            if max_abs_count * max_sum_per_count >= 2 ** 31:
+                block_weights = weight_vector.astype(np.int64)
+        counts = counts.astype(block_weights.dtype, copy=False)
+        # Columns of a DataFrame are usually stored contiguously, multiply with the rows of the transposed block
+        weighted_sum[start:start + block_size] = block_weights @ counts.T if counts.flags['F_CONTIGUOUS'] \
+            else counts @ block_weights
+        total[start:start + block_size] = counts.sum(axis=1)
+    return weighted_sum, total
+
+
+def weighted_average(df, weights, denominator_column=None, dtype='int64', block_size=1000000):
+    """
+    Compute the weighted mean of a histogram stored in several columns of a DataFrame.
+
+    Args:
+        df (pandas.DataFrame): The input DataFrame, with one column per bucket of the histogram.
+        weights (dict): Mapping from column name to the weight of the bucket (e.g. AGE_WEIGHTS_HEXAGON).
+        denominator_column (str, optional): Column used as denominator (e.g. 'total' for the household size). If
+            None, the sum of the counts of the histogram is used. Default is None.
+        dtype (str, optional): Integer type used for the counts, 'int64' or the memory-lean 'int32'. Default is
+            'int64'.
+        block_size (int, optional): Number of rows converted and reduced at a time. Default is 1000000.
+
+    Returns:
+        pandas.Series: The weighted mean of each row, with the index of df (NaN or inf where the denominator is 0).
+
+    Example:
+        >>> df_age['avg_age'] = weighted_average(df_age, AGE_WEIGHTS_HEXAGON)
+        >>> df_householdsize['avg_household_size'] = weighted_average(df_householdsize, HOUSEHOLD_SIZE_WEIGHTS,
+        ...                                                           denominator_column='total')
+    """
+    weighted_sum, total = weighted_sums(df, weights, dtype=dtype, block_size=block_size)
+    if denominator_column is not None:
+        total = df[denominator_column].to_numpy(dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return pd.Series(weighted_sum / total, index=df.index)
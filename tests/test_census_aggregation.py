@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.census_aggregation import aggregate_census_features
+
+mongomock = pytest.importorskip('mongomock')
+
+# Histogram columns of the census collections at the hexagon level
+AGE_COLUMNS = [f'{age}' for age in range(101)]
+HOUSEHOLD_SIZE_COLUMNS = [f'{size}' for size in range(1, 9)]
+
+
+@pytest.fixture
+def census_db():
+    # Synthetic age and household size documents of a few hexagons, as stored in the census database
+    rng = np.random.default_rng(0)
+    hex_ids = ['88194e4151fffff', '88194e4153fffff', '88194e4155fffff', '88194e4157fffff']
+    db = mongomock.MongoClient().h3r8data
+    age_documents, household_documents = [], []
+    for hex_id in hex_ids:
+        ages = rng.integers(0, 20, size=len(AGE_COLUMNS))
+        sizes = rng.integers(0, 10, size=len(HOUSEHOLD_SIZE_COLUMNS))
+        age_documents.append({'index': hex_id, 'total': int(ages.sum()),
+                              **{column: int(count) for column, count in zip(AGE_COLUMNS, ages)}})
+        household_documents.append({'index': hex_id, 'total': int(sizes.sum()),
+                                    **{column: int(count) for column, count in zip(HOUSEHOLD_SIZE_COLUMNS, sizes)}})
+    db.age.insert_many(age_documents)
+    # The last hexagon has no household size document and is dropped by the join
+    db.householdsize.insert_many(household_documents[:-1])
+    return db
+
+
+def test_aggregation_matches_pandas(census_db):
+    df_census = aggregate_census_features(census_db).sort_values('index').reset_index(drop=True)
+
+    # Features computed in pandas from the full histograms
+    df_age = pd.DataFrame(list(census_db.age.find({}, {'_id': 0})))
+    df_age['avg_age'] = sum((age + 1) * df_age[column] for age, column in enumerate(AGE_COLUMNS)) / \
+        df_age[AGE_COLUMNS].sum(axis=1)
+    df_householdsize = pd.DataFrame(list(census_db.householdsize.find({}, {'_id': 0})))
+    df_householdsize['avg_household_size'] = sum(
+        size * df_householdsize[column] for size, column in enumerate(HOUSEHOLD_SIZE_COLUMNS, start=1)) / \
+        df_householdsize['total']
+    df_expected = df_age[['index', 'total', 'avg_age']] \
+        .merge(df_householdsize[['index', 'avg_household_size']], on='index') \
+        .sort_values('index').reset_index(drop=True)
+
+    assert list(df_census.columns) == ['index', 'total', 'avg_age', 'avg_household_size']
+    assert df_census['index'].tolist() == df_expected['index'].tolist()
+    np.testing.assert_allclose(df_census['total'], df_expected['total'])
+    np.testing.assert_allclose(df_census['avg_age'], df_expected['avg_age'])
+    np.testing.assert_allclose(df_census['avg_household_size'], df_expected['avg_household_size'])
+
+
+def test_empty_histogram_gives_nan(census_db):
+    census_db.age.update_one({'index': '88194e4151fffff'},
+                             {'$set': {'total': 0, **{column: 0 for column in AGE_COLUMNS}}})
+    df_census = aggregate_census_features(census_db).set_index('index')
+    assert np.isnan(df_census.loc['88194e4151fffff', 'avg_age'])
+
+
+def test_index_is_opt_in(census_db):
+    aggregate_census_features(census_db)
+    assert 'index_1' not in census_db.householdsize.index_information()
+    aggregate_census_features(census_db, ensure_index=True)
+    assert 'index_1' in census_db.householdsize.index_information()
+
+
+def test_index_failure_warns(census_db, monkeypatch):
+    def create_index(*args, **kwargs):
+        raise mongomock.OperationFailure('not authorized')
+    monkeypatch.setattr(census_db.householdsize, 'create_index', create_index)
+    with pytest.warns(UserWarning, match='Could not create the index'):
+        df_census = aggregate_census_features(census_db, ensure_index=True)
+    assert len(df_census) == 3
@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+import textwrap
+import numpy as np
+import pandas as pd
+import pytest
+from src.post_analysis_plots import plot_post_analysis, save_figure_async, wait_for_figures
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_save_figure_async(tmp_path):
+    from matplotlib.figure import Figure
+    fig = Figure()
+    fig.subplots().plot([0, 1], [1, 0])
+    future = save_figure_async(fig, str(tmp_path / 'figure.png'))
+    assert wait_for_figures() == [str(tmp_path / 'figure.png')]
+    assert future.done() and os.path.getsize(tmp_path / 'figure.png') > 0
+
+
+def test_plot_post_analysis_headless(tmp_path):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'population_density': rng.normal(size=200), 'label': rng.integers(0, 2, size=200)})
+    plot_post_analysis(df, ['population_density'], 'label', ['red', 'blue'],
+                       figure_file_path=str(tmp_path / 'post_analysis.png'))
+    assert wait_for_figures() == [str(tmp_path / 'post_analysis.png')]
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs the fork start method')
+def test_figures_of_forked_workers(tmp_path):
+    # A figure saved before forking starts the writer thread of the parent, which the forked workers do not
+    # inherit: the workers must start their own writer instead of waiting forever on the parent one
+    script = textwrap.dedent("""
+        import multiprocessing
+        import sys
+        import numpy as np
+        import pandas as pd
+        from matplotlib.figure import Figure
+        from src.hierarchical_clustering import HierarchicalHexClusterer
+        from src.post_analysis_plots import save_figure_async, wait_for_figures
+
+        if __name__ == '__main__':
+            multiprocessing.set_start_method('fork')
+            figure_directory = sys.argv[1]
+            save_figure_async(Figure(), f'{figure_directory}/parent.png')
+            df = pd.DataFrame(np.random.default_rng(0).normal(size=(300, 2)), columns=['a', 'b'])
+            clusterer = HierarchicalHexClusterer(
+                first_step={'columns': ['a'], 'n_clusters': 2},
+                sub_clusterings={tier: {'columns': ['b'], 'n_clusters': 2, 'post_analysis': True,
+                                        'colors_plot': ['red', 'blue'],
+                                        'figure_file_path': f'{figure_directory}/tier_{tier}.png'}
+                                 for tier in (0, 1)},
+                n_jobs=2, backend='process')
+            clusterer.fit(df)
+            wait_for_figures()
+    """)
+    subprocess.run([sys.executable, '-c', script, str(tmp_path)], cwd=ROOT, env={**os.environ, 'PYTHONPATH': ROOT},
+                   check=True, timeout=60)
+    assert sorted(os.listdir(tmp_path)) == ['parent.png', 'tier_0.png', 'tier_1.png']
@@ -0,0 +1,177 @@
+import gzip
+import math
+import os
+import sqlite3
+import numpy as np
+import pytest
+import h3.api.numpy_int as h3_int
+from src.vector_tiles import TILE_EXTENT, encode_tile, export_vector_tiles
+
+
+def _read_varint(data, position):
+    value, shift = 0, 0
+    while True:
+        byte = data[position]
+        value |= (byte & 0x7f) << shift
+        position += 1
+        shift += 7
+        if byte < 0x80:
+            return value, position
+
+
+def _fields(data):
+    # (field number, value) of each field of a protocol buffers message (varint and length-delimited fields only)
+    position = 0
+    while position < len(data):
+        key, position = _read_varint(data, position)
+        field, wire_type = key >> 3, key & 0x7
+        if wire_type == 0:
+            value, position = _read_varint(data, position)
+        elif wire_type == 2:
+            length, position = _read_varint(data, position)
+            value, position = data[position:position + length], position + length
+        else:
+            raise ValueError(f'Unexpected wire type {wire_type}')
+        yield field, value
+
+
+def _packed(data):
+    values, position = [], 0
+    while position < len(data):
+        value, position = _read_varint(data, position)
+        values.append(value)
+    return values
+
+
+def _unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def _decode_geometry(commands):
+    # Rings of a polygon geometry, as lists of absolute (x, y) tile coordinates
+    rings, cursor, position = [], (0, 0), 0
+    while position < len(commands):
+        command_id, count = commands[position] & 0x7, commands[position] >> 3
+        position += 1
+        if command_id == 7:
+            continue
+        assert command_id in (1, 2)
+        for _ in range(count):
+            cursor = (cursor[0] + _unzigzag(commands[position]), cursor[1] + _unzigzag(commands[position + 1]))
+            position += 2
+            if command_id == 1:
+                rings.append([])
+            rings[-1].append(cursor)
+    return rings
+
+
+def decode_tile(data):
+    """Decode a Mapbox Vector Tile into {layer name: {'extent', 'version', 'features'}}."""
+    layers = {}
+    for field, layer_data in _fields(data):
+        assert field == 3
+        layer = {'keys': [], 'values': [], 'features': []}
+        for layer_field, value in _fields(layer_data):
+            if layer_field == 1:
+                layer['name'] = value.decode()
+            elif layer_field == 2:
+                layer['features'].append(dict(_fields(value)))
+            elif layer_field == 3:
+                layer['keys'].append(value.decode())
+            elif layer_field == 4:
+                (value_field, layer_value), = _fields(value)
+                assert value_field == 5
+                layer['values'].append(layer_value)
+            elif layer_field == 5:
+                layer['extent'] = value
+            elif layer_field == 15:
+                layer['version'] = value
+        features = []
+        for feature in layer['features']:
+            tags = _packed(feature[2])
+            features.append({'id': feature[1], 'type': feature[3], 'rings': _decode_geometry(_packed(feature[4])),
+                             'properties': {layer['keys'][key]: layer['values'][value]
+                                            for key, value in zip(tags[::2], tags[1::2])}})
+        layers[layer['name']] = {'extent': layer['extent'], 'version': layer['version'], 'features': features}
+    return layers
+
+
+def signed_area(ring):
+    # Surveyor's formula in tile coordinates (y axis pointing down): positive for exterior rings
+    return sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(ring, ring[1:] + ring[:1])) / 2
+
+
+def test_encode_tile_round_trip():
+    cells = np.array([h3_int.geo_to_h3(51.5, -0.1, 8), h3_int.geo_to_h3(53.5, -2.2, 8), 2 ** 63 + 5],
+                     dtype=np.uint64)
+    labels = np.array([5, 2, 5])
+    # Clockwise hexagon, the same hexagon counter-clockwise and a closed triangle, in tile coordinates
+    hexagon = [(100, 50), (150, 80), (150, 140), (100, 170), (50, 140), (50, 80)]
+    triangle = [(4000, 4000), (4090, 4000), (4000, 4090), (4000, 4000)]
+    local = np.array(hexagon + hexagon[::-1] + triangle, dtype=np.int64)
+    n_vertices = np.array([6, 6, 4])
+
+    layers = decode_tile(encode_tile(cells, labels, local, n_vertices, layer_name='clusters'))
+    layer = layers['clusters']
+    assert (layer['version'], layer['extent']) == (2, TILE_EXTENT)
+    assert [feature['id'] for feature in layer['features']] == cells.tolist()
+    assert [feature['properties'] for feature in layer['features']] == [{'label': 5}, {'label': 2}, {'label': 5}]
+    assert all(feature['type'] == 3 for feature in layer['features'])
+    rings = [feature['rings'] for feature in layer['features']]
+    assert all(len(feature_rings) == 1 and signed_area(feature_rings[0]) > 0 for feature_rings in rings)
+    assert rings[0][0] == hexagon
+    # The counter-clockwise ring is reversed and the closing vertex of the triangle is left to ClosePath
+    assert sorted(rings[1][0]) == sorted(hexagon)
+    assert rings[2][0] == triangle[:-1]
+
+
+def test_encode_tile_drops_collapsed_hexagons():
+    local = np.array([(10, 10), (10, 10), (11, 10), (20, 20), (30, 20), (20, 30)], dtype=np.int64)
+    layers = decode_tile(encode_tile(np.array([1, 2], dtype=np.uint64), np.array([0, 1]), local, np.array([3, 3])))
+    assert [feature['id'] for feature in layers['hexagons']['features']] == [2]
+
+
+def _xyz_tile(lat, lng, zoom):
+    # Column and row of the XYZ (slippy map) tile containing a point
+    n = 2 ** zoom
+    x = int((lng + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return x, y
+
+
+@pytest.fixture
+def hexagons():
+    centers = h3_int.k_ring(h3_int.geo_to_h3(51.5, -0.1, 6), 1).tolist() + [h3_int.geo_to_h3(57.1, -2.1, 6)]
+    cells = np.array(centers, dtype=np.uint64)
+    return cells, np.arange(len(cells)) % 3
+
+
+def test_export_mbtiles_rows_are_flipped(hexagons, tmp_path):
+    cells, labels = hexagons
+    zoom = 7
+    options = {'min_zoom': zoom, 'max_zoom': zoom, 'zoom_resolutions': {}, 'buffer': 0}
+    export_vector_tiles(cells, labels, str(tmp_path / 'tiles'), ['red', 'green', 'blue'], **options)
+    export_vector_tiles(cells, labels, str(tmp_path / 'tiles.mbtiles'), ['red', 'green', 'blue'],
+                        output_format='mbtiles', **options)
+
+    with sqlite3.connect(tmp_path / 'tiles.mbtiles') as connection:
+        rows = connection.execute('SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles').fetchall()
+    assert rows
+    features = {}
+    for z, x, tile_row, tile_data in rows:
+        # TMS rows count from the south: the same tile as the XYZ row 2 ** z - 1 - tile_row of the directory
+        y = 2 ** z - 1 - tile_row
+        with open(os.path.join(tmp_path, 'tiles', str(z), str(x), f'{y}.pbf'), 'rb') as file:
+            assert gzip.decompress(tile_data) == file.read()
+        for feature in decode_tile(gzip.decompress(tile_data))['hexagons']['features']:
+            features.setdefault(feature['id'], []).append((x, y, feature))
+    assert sorted(features) == sorted(cells.tolist())
+
+    label_of = dict(zip(cells.tolist(), labels.tolist()))
+    for cell, tiles in features.items():
+        lat, lng = h3_int.h3_to_geo(cell)
+        # The tile containing the center of the hexagon has it, with its label and an exterior ring
+        assert _xyz_tile(lat, lng, zoom) in [(x, y) for x, y, _ in tiles]
+        for x, y, feature in tiles:
+            assert feature['properties'] == {'label': label_of[cell]}
+            assert len(feature['rings']) == 1 and signed_area(feature['rings'][0]) > 0
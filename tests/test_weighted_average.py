@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.weighted_average import downcast_counts, weighted_average, weighted_sums, HOUSEHOLD_SIZE_WEIGHTS
+
+
+@pytest.fixture
+def df_householdsize():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.integers(0, 50, size=(10, len(HOUSEHOLD_SIZE_WEIGHTS))), columns=list(HOUSEHOLD_SIZE_WEIGHTS))
+    df['total'] = df[list(HOUSEHOLD_SIZE_WEIGHTS)].sum(axis=1)
+    return df
+
+
+def expected_sums(df, weights):
+    weighted_sum = sum(df[column].astype('int64') * weight for column, weight in weights.items())
+    return weighted_sum.to_numpy(), df[list(weights)].sum(axis=1).to_numpy()
+
+
+@pytest.mark.parametrize('dtype', ['int64', 'int32'])
+def test_weighted_sums(df_householdsize, dtype):
+    weighted_sum, total = weighted_sums(df_householdsize, HOUSEHOLD_SIZE_WEIGHTS, dtype=dtype, block_size=3)
+    expected_weighted_sum, expected_total = expected_sums(df_householdsize, HOUSEHOLD_SIZE_WEIGHTS)
+    np.testing.assert_array_equal(weighted_sum, expected_weighted_sum)
+    np.testing.assert_array_equal(total, expected_total)
+
+
+def test_weighted_sums_int32_downcast_columns(df_householdsize):
+    df = downcast_counts(df_householdsize, HOUSEHOLD_SIZE_WEIGHTS)
+    weighted_sum, total = weighted_sums(df, HOUSEHOLD_SIZE_WEIGHTS, dtype='int32')
+    expected_weighted_sum, expected_total = expected_sums(df_householdsize, HOUSEHOLD_SIZE_WEIGHTS)
+    np.testing.assert_array_equal(weighted_sum, expected_weighted_sum)
+    np.testing.assert_array_equal(total, expected_total)
+
+
+def test_weighted_sums_int32_counts_out_of_range(df_householdsize):
+    # Counts that do not fit in 32-bit integers must not be truncated before the overflow check
+    df_householdsize.loc[4, '8'] = 2 ** 33
+    weighted_sum, total = weighted_sums(df_householdsize, HOUSEHOLD_SIZE_WEIGHTS, dtype='int32', block_size=3)
+    expected_weighted_sum, expected_total = expected_sums(df_householdsize, HOUSEHOLD_SIZE_WEIGHTS)
+    np.testing.assert_array_equal(weighted_sum, expected_weighted_sum)
+    np.testing.assert_array_equal(total, expected_total)
+
+
+def test_weighted_average_denominator(df_householdsize):
+    average = weighted_average(df_householdsize, HOUSEHOLD_SIZE_WEIGHTS, denominator_column='total')
+    expected_weighted_sum, _ = expected_sums(df_householdsize, HOUSEHOLD_SIZE_WEIGHTS)
+    np.testing.assert_allclose(average, expected_weighted_sum / df_householdsize['total'])
+    assert average.index.equals(df_householdsize.index)